@@ -9,27 +9,78 @@ Single app that:
 Run: python3 app.py
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-import json
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context
 import os
-import requests
+import http_pool
 import subprocess
 import threading
 import time
 import queue
+import json
+import selectors
 from pathlib import Path
 from datetime import datetime
+from store import Store
+from ring_buffer import LogRing
+from status_cache import StatusCache
+import sizes
+import images
+import metrics
 
 app = Flask(__name__, template_folder='templates')
+metrics.instrument(app, "app")
 app.secret_key = 'minicloud-secret-key'
 
 LB_URL = "http://127.0.0.1:8000"
+# Nodes start_services launches; more can join later by registering with the LB
+NODE_PORTS = [int(p) for p in os.environ.get("MINICLOUD_NODE_PORTS", "5000,5001").split(",") if p]
 USERS_FILE = Path("users.json")
 VMS_FILE = Path("user_vms.json")
+DB_FILE = Path("minicloud.db")
+SHELL_HISTORY_CHARS = 3000
+
+# Users and VM ownership (SQLite; imports the JSON files above on first run)
+store = Store(DB_FILE, USERS_FILE, VMS_FILE)
+
+
+
+def fetch_vm_statuses(names):
+    """One batched LB call for the live status of `names` ({name: {status, server}})."""
+    try:
+        r = http_pool.post(f"{LB_URL}/vm_status", json={'names': names}, timeout=5)
+        return r.json()['statuses']
+    except Exception as e:
+        print(f"[APP-ERR] Live VM status unavailable: {e}")
+        return {}
+
+
+def fetch_snapshots(username):
+    """The user's snapshots on every node, newest last (empty if the LB is unreachable)."""
+    try:
+        r = http_pool.get(f"{LB_URL}/snapshots", params={'owner': username}, timeout=5)
+        return sorted((dict(snap, server=server) for server, node in r.json().items() if isinstance(node, dict)
+                       for snap in node['snapshots']), key=lambda snap: snap['created_at'])
+    except Exception as e:
+        print(f"[APP-ERR] Snapshots unavailable: {e}")
+        return []
+
+
+# Most VMs one clone request may create
+MAX_CLONES = 50
+
+# Live VM status, shared by every dashboard request for a few seconds
+vm_statuses = StatusCache(fetch_vm_statuses, float(os.environ.get("MINICLOUD_STATUS_TTL", "3")))
+
+# VMs reported `missing` once (name -> server); a record is dropped only if the next fresh lookup agrees
+missing_seen = {}
 
-# Global log storage (thread-safe list)
-log_storage = []
-log_lock = __import__("threading").Lock()
+# Global log storage: the last LOG_CAPACITY lines, each with a sequence number
+LOG_CAPACITY = 5000
+log_storage = LogRing(LOG_CAPACITY)
+
+# One selector thread drains the stdout/stderr pipes of every child process
+pipe_selector = selectors.DefaultSelector()
+pipe_reader_started = threading.Event()
 
 lb_process = None
 server_processes = []
@@ -39,11 +90,54 @@ def log_message(source, msg):
     """Add a message to the log storage."""
     timestamp = datetime.now().strftime("%H:%M:%S")
     full_msg = f"[{timestamp}] [{source}] {msg}"
-    with log_lock:
-        log_storage.append(full_msg)
+    log_storage.append(full_msg)
     print(full_msg)  # Also print to console
 
 
+def read_pipes():
+    """Selector thread: read whichever child pipe has data, never blocking on one of them."""
+    while True:
+        for key, _ in pipe_selector.select(timeout=1.0):
+            source, pending = key.data
+            try:
+                chunk = os.read(key.fd, 65536)
+            except BlockingIOError:
+                continue
+            except OSError:
+                chunk = b""
+            if not chunk:
+                # EOF: flush any unterminated last line and stop watching
+                if pending:
+                    log_message(source, pending.decode("utf-8", errors="replace").strip())
+                pipe_selector.unregister(key.fileobj)
+                continue
+            pending.extend(chunk)
+            *lines, rest = pending.split(b"\n")
+            pending[:] = rest
+            for line in lines:
+                log_message(source, line.decode("utf-8", errors="replace").strip())
+
+
+def watch_process(proc, label):
+    """Register a child's stdout/stderr with the shared selector thread."""
+    for pipe, source in ((proc.stdout, label), (proc.stderr, f"{label}-ERR")):
+        os.set_blocking(pipe.fileno(), False)
+        pipe_selector.register(pipe, selectors.EVENT_READ, (source, bytearray()))
+    if not pipe_reader_started.is_set():
+        pipe_reader_started.set()
+        threading.Thread(target=read_pipes, daemon=True).start()
+
+
+def spawn(args):
+    """Start a child service with unbuffered, binary stdout/stderr pipes."""
+    return subprocess.Popen(
+        ["python3", *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=dict(os.environ, PYTHONUNBUFFERED="1")
+    )
+
+
 def start_services():
     """Start load balancer and server nodes, capture their output."""
     global lb_process, server_processes
@@ -53,41 +147,20 @@ def start_services():
     try:
         # Start load balancer
         log_message("APP", "Starting load balancer on port 8000...")
-        lb_process = subprocess.Popen(
-            ["python3", "load_balancer.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1
-        )
-        
-        def read_lb_output():
-            for line in lb_process.stdout:
-                log_message("LB", line.strip())
-            for line in lb_process.stderr:
-                log_message("LB-ERR", line.strip())
+        lb_process = spawn(["load_balancer.py"])
+        watch_process(lb_process, "LB")
         
-        threading.Thread(target=read_lb_output, daemon=True).start()
-        
-        # Start server nodes
-        for port in [5000, 5001]:
+        # Start server nodes, splitting this host's capacity between them so
+        # together they never promise more than the machine has
+        share = sizes.host_capacity(nodes=len(NODE_PORTS))
+        for port in NODE_PORTS:
             log_message("APP", f"Starting server node on port {port}...")
-            proc = subprocess.Popen(
-                ["python3", "server_node.py", "--port", str(port)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1
-            )
+            proc = spawn(["server_node.py", "--port", str(port), "--lb-url", LB_URL,
+                          "--cpu-capacity", str(share["cpu_shares"]),
+                          "--memory-capacity", str(share["memory_mb"]),
+                          "--pids-capacity", str(share["pids"])])
             server_processes.append(proc)
-            
-            def read_server_output(p=proc, port=port):
-                for line in p.stdout:
-                    log_message(f"SERVER:{port}", line.strip())
-                for line in p.stderr:
-                    log_message(f"SERVER:{port}-ERR", line.strip())
-            
-            threading.Thread(target=read_server_output, daemon=True).start()
+            watch_process(proc, f"SERVER:{port}")
         
         log_message("APP", "All services started successfully!")
         time.sleep(2)  # Give them time to boot
@@ -98,33 +171,7 @@ def start_services():
 
 def get_recent_logs(n=100):
     """Get recent log messages."""
-    with log_lock:
-        return log_storage[-n:] if log_storage else []
-
-
-# User management
-def load_users():
-    if USERS_FILE.exists():
-        with open(USERS_FILE) as f:
-            return json.load(f)
-    return {"admin": "admin"}  # Default admin
-
-
-def save_users(users):
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f)
-
-
-def load_user_vms():
-    if VMS_FILE.exists():
-        with open(VMS_FILE) as f:
-            return json.load(f)
-    return {}
-
-
-def save_user_vms(vms):
-    with open(VMS_FILE, 'w') as f:
-        json.dump(vms, f, indent=2)
+    return log_storage.recent(n)
 
 
 # Routes
@@ -138,13 +185,10 @@ def register():
             flash('Username and password required', 'error')
             return redirect(url_for('register'))
         
-        users = load_users()
-        if username in users:
+        if not store.add_user(username, password):
             flash('User already exists', 'error')
             return redirect(url_for('register'))
         
-        users[username] = password
-        save_users(users)
         flash('Registered! Please log in.', 'success')
         return redirect(url_for('login'))
     
@@ -157,8 +201,8 @@ def login():
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '').strip()
         
-        users = load_users()
-        if username not in users or users[username] != password:
+        stored = store.get_password(username)
+        if stored is None or stored != password:
             flash('Invalid credentials', 'error')
             return redirect(url_for('login'))
         
@@ -195,17 +239,8 @@ def delete_account():
         flash('Please confirm by typing YES', 'error')
         return redirect(url_for('dashboard'))
     
-    # Delete user from users.json
-    users = load_users()
-    if username in users:
-        del users[username]
-        save_users(users)
-    
-    # Delete user's VMs from user_vms.json
-    user_vms = load_user_vms()
-    if username in user_vms:
-        del user_vms[username]
-        save_user_vms(user_vms)
+    # Delete user and their VM records
+    store.delete_user(username)
     
     session.clear()
     flash('Account deleted successfully', 'success')
@@ -224,12 +259,102 @@ def admin_panel():
 
 @app.route('/admin/logs')
 def admin_logs_json():
-    """API endpoint to fetch logs (for real-time updates)."""
+    """API endpoint to fetch logs (for real-time updates).
+    
+    `?since=<seq>` returns only lines newer than that sequence number;
+    `next` is the cursor for the following call.
+    """
     if not session.get('is_admin'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    logs = get_recent_logs(100)
-    return jsonify({'logs': logs})
+    since = request.args.get('since', type=int)
+    if since is None:
+        entries, last = log_storage.tail(100)
+    else:
+        entries, last = log_storage.since(since, 1000)
+    return jsonify({'logs': [line for _, line in entries], 'next': last})
+
+
+@app.route('/admin/nodes')
+def admin_nodes():
+    """Live node membership, as reported by the load balancer."""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        r = http_pool.get(f"{LB_URL}/nodes", timeout=3)
+        return jsonify(r.json()), r.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+
+
+@app.route('/admin/drain', methods=['POST'])
+def admin_drain():
+    """Drain a node (no new VMs; optionally evacuate its VMs) or return it to service."""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    data = request.get_json(force=True)
+    try:
+        r = http_pool.post(f"{LB_URL}/drain_node", json={
+            'url': data.get('url'), 'drain': bool(data.get('drain', True)), 'evacuate': bool(data.get('evacuate'))
+        }, timeout=5)
+        return jsonify(r.json()), r.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+
+
+@app.route('/admin/migrate', methods=['POST'])
+def admin_migrate():
+    """Move a VM to another node (the LB picks one unless `target` is given)."""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    data = request.get_json(force=True)
+    name = data.get('name')
+    try:
+        r = http_pool.post(f"{LB_URL}/migrate_vm", json={'name': name, 'target': data.get('target') or None},
+                           timeout=360)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+    if r.status_code == 200:
+        # keep the owner's record pointing at the VM's new node
+        owner = store.vm_owner(name)
+        if owner:
+            store.update_vm(owner, name, server=r.json()['to'])
+        vm_statuses.invalidate(name)
+    return jsonify(r.json()), r.status_code
+
+
+@app.route('/admin/sessions')
+def admin_sessions():
+    """Shell sessions on every node (owner, VM, idle time, bytes in/out)."""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        r = http_pool.get(f"{LB_URL}/sessions", timeout=5)
+        return jsonify(r.json()), r.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+
+
+@app.route('/admin/logs/stream')
+def admin_logs_stream():
+    """Live tail of the logs as Server-Sent Events (resumes via Last-Event-ID)."""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    resume = request.headers.get('Last-Event-ID') or request.args.get('since')
+    cursor = int(resume) if resume and resume.isdigit() else log_storage.tail(0)[1]
+    
+    def generate():
+        seq = cursor
+        while True:
+            if not log_storage.wait(seq, 15):
+                yield ": keep-alive\n\n"
+                continue
+            entries, seq = log_storage.since(seq, 1000)
+            yield f"id: {seq}\ndata: {json.dumps([line for _, line in entries])}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/')
@@ -241,9 +366,36 @@ def dashboard():
         return redirect(url_for('admin_panel'))
     
     username = session['username']
-    user_vms = load_user_vms().get(username, {})
-    
-    return render_template('dashboard.html', username=username, user_vms=user_vms)
+    user_vms = store.user_vms(username)
+    live = vm_statuses.get(list(user_vms)) if user_vms else {}
+    
+    # Reconcile the stored records with what the nodes report
+    for name, state in live.items():
+        info = user_vms[name]
+        status = state.get('status', 'unknown')
+        if status == 'missing' and state.get('server'):
+            if missing_seen.get(name) != state['server']:
+                # a single report may be a moment's view: ask the node again on the next visit
+                missing_seen[name] = state['server']
+                vm_statuses.invalidate(name)
+                continue
+            # its own node says again that the container is gone (e.g. removed there): drop the stale record
+            missing_seen.pop(name, None)
+            store.remove_vm(username, name)
+            vm_statuses.invalidate(name)
+            del user_vms[name]
+            flash(f'VM {name} no longer exists and was removed', 'error')
+            continue
+        missing_seen.pop(name, None)
+        if status != 'unknown' and (status, state.get('server')) != (info['status'], info['server']):
+            store.update_vm(username, name, status=status, server=state.get('server') or info['server'])
+            info['server'] = state.get('server') or info['server']
+        info['status'] = status
+    
+    return render_template('dashboard.html', username=username, user_vms=user_vms,
+                           sizes=sizes.PROFILES, default_size=sizes.DEFAULT_SIZE,
+                           images=images.CATALOG, default_image=images.DEFAULT_IMAGE,
+                           snapshots=fetch_snapshots(username), max_clones=MAX_CLONES)
 
 
 @app.route('/create-vm', methods=['POST'])
@@ -253,49 +405,28 @@ def create_vm():
     
     username = session['username']
     name = request.form.get('name', '').strip()
+    size = request.form.get('size') or sizes.DEFAULT_SIZE
+    image = request.form.get('image') or images.DEFAULT_IMAGE
     
     if not name:
         flash('VM name required', 'error')
         return redirect(url_for('dashboard'))
     
     try:
-        r = requests.post(f"{LB_URL}/create_vm", json={'name': name}, timeout=10)
+        r = http_pool.post(f"{LB_URL}/create_vm", json={'name': name, 'size': size, 'image': image}, timeout=75)
         if r.status_code == 201:
-            # Query BOTH servers directly to find which one has the VM
-            servers = ["http://127.0.0.1:5000", "http://127.0.0.1:5001"]
-            
-            user_vms = load_user_vms()
-            if username not in user_vms:
-                user_vms[username] = {}
-            
-            # Check both servers
-            for srv_url in servers:
-                try:
-                    list_r = requests.get(f"{srv_url}/list_vms", timeout=5)
-                    if list_r.status_code == 200:
-                        vms = list_r.json()
-                        if isinstance(vms, list):
-                            for vm in vms:
-                                if vm['name'] == name:
-                                    user_vms[username][name] = {
-                                        'server': srv_url,
-                                        'created_at': datetime.now().isoformat(),
-                                        'status': 'running'
-                                    }
-                                    save_user_vms(user_vms)
-                                    flash(f'VM {name} created!', 'success')
-                                    return redirect(url_for('dashboard'))
-                except:
-                    pass
-            
-            # If we get here, VM was created but not found - add it anyway with unknown server
-            user_vms[username][name] = {
-                'server': 'http://127.0.0.1:5000',  # Default to first server
-                'created_at': datetime.now().isoformat(),
-                'status': 'running'
-            }
-            save_user_vms(user_vms)
-            flash(f'VM {name} created (using default server)', 'success')
+            # The load balancer reports which server the VM landed on
+            store.add_vm(username, name, r.json().get('server'),
+                         datetime.now().isoformat(), 'running')
+            vm_statuses.invalidate(name)
+            flash(f'VM {name} created!', 'success')
+            return redirect(url_for('dashboard'))
+        elif r.status_code == 202:
+            # Still being created on the node: record it now so the VM has an owner
+            store.add_vm(username, name, r.json().get('server'),
+                         datetime.now().isoformat(), 'creating')
+            vm_statuses.invalidate(name)
+            flash(f'VM {name} is still being created', 'success')
             return redirect(url_for('dashboard'))
         else:
             flash(f'Failed to create VM: {r.json()}', 'error')
@@ -311,20 +442,16 @@ def delete_vm(name):
         return redirect(url_for('login'))
     
     username = session['username']
-    user_vms = load_user_vms()
     
-    if username not in user_vms or name not in user_vms[username]:
+    if not store.get_vm(username, name):
         flash('VM not found', 'error')
         return redirect(url_for('dashboard'))
     
-    vm_info = user_vms[username][name]
-    server = vm_info['server']
-    
     try:
-        r = requests.post(f"{LB_URL}/delete_vm", json={'server': server, 'name': name}, timeout=10)
+        r = http_pool.post(f"{LB_URL}/delete_vm", json={'name': name}, timeout=10)
         if r.status_code == 200:
-            del user_vms[username][name]
-            save_user_vms(user_vms)
+            store.remove_vm(username, name)
+            vm_statuses.invalidate(name)
             flash(f'VM {name} deleted', 'success')
         else:
             flash(f'Failed to delete: {r.json()}', 'error')
@@ -334,6 +461,92 @@ def delete_vm(name):
     return redirect(url_for('dashboard'))
 
 
+@app.route('/snapshot-vm/<name>', methods=['POST'])
+def snapshot_vm(name):
+    if not session.get('username'):
+        return redirect(url_for('login'))
+    
+    username = session['username']
+    
+    if not store.get_vm(username, name):
+        flash('VM not found', 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        r = http_pool.post(f"{LB_URL}/snapshot_vm", json={'name': name, 'owner': username}, timeout=130)
+        if r.status_code == 201:
+            flash(f"Snapshot {r.json()['snapshot_id']} of {name} taken", 'success')
+        else:
+            flash(f'Failed to snapshot: {r.json()}', 'error')
+    except Exception as e:
+        flash(f'Error: {e}', 'error')
+    
+    return redirect(url_for('dashboard'))
+
+
+@app.route('/clone-vm', methods=['POST'])
+def clone_vm():
+    """Create `count` VMs named <prefix>-1 .. <prefix>-<count> from one of the user's snapshots."""
+    if not session.get('username'):
+        return redirect(url_for('login'))
+    
+    username = session['username']
+    snapshot_id = request.form.get('snapshot_id', '')
+    prefix = request.form.get('prefix', '').strip()
+    count = request.form.get('count', type=int) or 1
+    
+    if not prefix or not 1 <= count <= MAX_CLONES:
+        flash(f'Clone needs a name prefix and a count from 1 to {MAX_CLONES}', 'error')
+        return redirect(url_for('dashboard'))
+    if snapshot_id not in {snap['snapshot_id'] for snap in fetch_snapshots(username)}:
+        flash('Snapshot not found', 'error')
+        return redirect(url_for('dashboard'))
+    
+    names = [f'{prefix}-{i}' for i in range(1, count + 1)]
+    try:
+        r = http_pool.post(f"{LB_URL}/clone_vm", json={'snapshot_id': snapshot_id, 'names': names}, timeout=160)
+        if r.status_code != 200:
+            flash(f'Failed to clone: {r.json()}', 'error')
+            return redirect(url_for('dashboard'))
+        failed = []
+        for item in r.json()['results']:
+            if item.get('status') == 'error':
+                failed.append(f"{item['name']}: {item.get('error')}")
+                continue
+            store.add_vm(username, item['name'], item.get('server'), datetime.now().isoformat(),
+                         'running' if item.get('status') == 'created' else 'creating')
+            vm_statuses.invalidate(item['name'])
+        if len(failed) < len(names):
+            flash(f'{len(names) - len(failed)} clone(s) of {snapshot_id} created', 'success')
+        if failed:
+            flash('Some clones failed: ' + '; '.join(failed), 'error')
+    except Exception as e:
+        flash(f'Error: {e}', 'error')
+    
+    return redirect(url_for('dashboard'))
+
+
+@app.route('/delete-snapshot/<snapshot_id>', methods=['POST'])
+def delete_snapshot(snapshot_id):
+    if not session.get('username'):
+        return redirect(url_for('login'))
+    
+    if snapshot_id not in {snap['snapshot_id'] for snap in fetch_snapshots(session['username'])}:
+        flash('Snapshot not found', 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        r = http_pool.delete(f"{LB_URL}/snapshots/{snapshot_id}", timeout=35)
+        if r.status_code == 200:
+            flash(f'Snapshot {snapshot_id} deleted', 'success')
+        else:
+            flash(f'Failed to delete snapshot: {r.json()}', 'error')
+    except Exception as e:
+        flash(f'Error: {e}', 'error')
+    
+    return redirect(url_for('dashboard'))
+
+
 @app.route('/shutdown-vm/<name>', methods=['POST'])
 def shutdown_vm(name):
     if not session.get('username'):
@@ -349,24 +562,22 @@ def shell_page(name):
         return redirect(url_for('login'))
     
     username = session['username']
-    user_vms = load_user_vms()
     
-    if username not in user_vms or name not in user_vms[username]:
+    if not store.get_vm(username, name):
         flash('VM not found', 'error')
         return redirect(url_for('dashboard'))
     
-    vm_info = user_vms[username][name]
-    server = vm_info['server']
-    
-    # Start shell session
+    # Start shell session (the load balancer routes by VM name)
     try:
-        r = requests.post(f"{LB_URL}/shell_session", json={'server': server, 'name': name}, timeout=15)
+        r = http_pool.post(f"{LB_URL}/shell_session", json={'name': name, 'user': username}, timeout=15)
         if r.status_code == 201:
             session_data = r.json()
+            server = session_data.get('server')
             session['shell_session_id'] = session_data.get('session_id')
             session['shell_server'] = server
             session['shell_name'] = name
             session['shell_output'] = ''
+            session['shell_cursor'] = 0
             session.modified = True
             return render_template('shell.html', name=name, server=server)
         else:
@@ -383,10 +594,12 @@ def shell_input():
         return jsonify({'error': 'No session'}), 400
     
     command = request.form.get('command', '').strip()
+    # shell.html sends input with fetch() and reads output from /shell-stream
+    via_fetch = request.headers.get('X-Requested-With') == 'fetch'
     
     if command.lower() == 'exit':
         try:
-            requests.post(f"{LB_URL}/shell_close", json={
+            http_pool.post(f"{LB_URL}/shell_close", json={
                 'server': session['shell_server'],
                 'session_id': session['shell_session_id']
             }, timeout=10)
@@ -394,16 +607,22 @@ def shell_input():
             pass
         session.pop('shell_session_id', None)
         session.modified = True
+        if via_fetch:
+            return jsonify({'status': 'closed', 'redirect': url_for('dashboard')})
         return redirect(url_for('dashboard'))
     
     try:
-        requests.post(f"{LB_URL}/shell_input", json={
+        http_pool.post(f"{LB_URL}/shell_input", json={
             'server': session['shell_server'],
             'session_id': session['shell_session_id'],
             'input': command
         }, timeout=10)
-    except:
-        pass
+    except Exception as e:
+        if via_fetch:
+            return jsonify({'error': str(e)}), 502
+    
+    if via_fetch:
+        return jsonify({'status': 'sent'})
     
     session['shell_output'] = session.get('shell_output', '') + f"\n$ {command}\n"
     session.modified = True
@@ -411,25 +630,54 @@ def shell_input():
     return redirect(url_for('shell_page', name=session['shell_name']))
 
 
+@app.route('/shell-stream')
+def shell_stream():
+    """Relay the shell's Server-Sent Events stream from the load balancer."""
+    if not session.get('shell_session_id'):
+        return jsonify({'error': 'No session'}), 400
+    
+    params = {'session_id': session['shell_session_id'], 'server': session.get('shell_server')}
+    # lets a reconnecting EventSource resume exactly where it left off
+    resume = {'Last-Event-ID': request.headers['Last-Event-ID']} if 'Last-Event-ID' in request.headers else {}
+    try:
+        r = http_pool.stream("GET", f"{LB_URL}/shell_stream", params=params, headers=resume, timeout=(2, 60))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+    if r.status_code != 200:
+        r.close()
+        return jsonify({'error': f'Stream unavailable (HTTP {r.status_code})'}), 502
+    
+    def relay():
+        try:
+            for chunk in r.iter_content(chunk_size=None):
+                yield chunk
+        finally:
+            r.close()
+    
+    return Response(stream_with_context(relay()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/shell-output')
 def shell_output():
     if not session.get('shell_session_id'):
         return ""
     
     try:
-        r = requests.post(f"{LB_URL}/shell_output", json={
+        r = http_pool.post(f"{LB_URL}/shell_output", json={
             'server': session['shell_server'],
-            'session_id': session['shell_session_id']
+            'session_id': session['shell_session_id'],
+            'since': session.get('shell_cursor', 0)
         }, timeout=3)
         if r.status_code == 200:
-            # Get accumulated history and add new output
+            # The node returns exactly the bytes after our cursor, plus the next cursor
             current = session.get('shell_output', '')
-            new_text = r.text
-            # Only add if it's not empty and not just the prompt
-            if new_text and new_text.strip() and new_text not in current:
-                current += new_text
+            if r.text:
+                # keep the cookie-backed history under the ~4 KB cookie limit
+                current = (current + r.text)[-SHELL_HISTORY_CHARS:]
                 session['shell_output'] = current
-                session.modified = True
+            session['shell_cursor'] = int(r.headers.get('X-Shell-Offset', session.get('shell_cursor', 0)))
+            session.modified = True
             return current
     except Exception as e:
         pass
@@ -0,0 +1,630 @@
+"""
+asyncio proxy engine for the load balancer (python3 load_balancer.py --engine async).
+
+Same routes and JSON contracts as the threaded Flask engine in
+load_balancer.py, but upstream calls are non-blocking (aiohttp), so an
+in-flight request costs a coroutine rather than a thread and one process
+holds thousands of concurrent shell polls, streams and execs.
+
+Each backend sits behind a ConcurrencyLimit (backpressure.py): at most
+`--backend-limit` requests run against a node at once, up to
+`--backend-queue` more wait in line, and the rest get an immediate 503.
+Unary calls and exec streams hold their slot until they finish; shell
+SSE streams only until the node answers, since they are mostly idle.
+Queue depth per backend is reported in GET /stats and GET /metrics.
+
+A call the load balancer refuses to send -- the backend's queue is full,
+or its circuit breaker is open (health.py) -- also gets a 503, and a
+create refused that way moves to another node within the retry budget.
+"""
+
+import asyncio
+import time
+
+from aiohttp import (ClientConnectorError, ClientError, ClientSession, ClientTimeout, ConnectionTimeoutError,
+                     TCPConnector, web)
+
+import metrics
+from backpressure import ConcurrencyLimit, Overloaded
+from balancer import Balancer, Call, Gather, Sleep, Offload, Reply
+from health import CircuitOpen
+
+SERVICE = "load_balancer"
+CONNECT_TIMEOUT = 2
+
+backend_latency = metrics.histogram("minicloud_backend_request_seconds",
+                                    "Latency of requests forwarded to backend nodes", ["backend", "op"])
+backend_errors = metrics.counter("minicloud_backend_errors_total",
+                                 "Forwarded requests that failed without a response", ["backend", "op"])
+
+
+class Proxy(Balancer):
+    """Runs the shared flows (balancer.py) on the event loop, with per-backend limits and one upstream session."""
+
+    refused = (Overloaded, CircuitOpen)
+
+    def __init__(self, scheduler, placements, list_deadline, backend_limit, backend_queue,
+                 suspect_after=6.0, remove_after=15.0, rebalance_interval=0, rebalance_threshold=0.25,
+                 retry_budget=3.0):
+        super().__init__(scheduler, placements, list_deadline, suspect_after, remove_after, retry_budget)
+        self.backend_limit = backend_limit
+        self.backend_queue = backend_queue
+        self.limits = {}
+        self.rebalance_interval = rebalance_interval
+        self.rebalance_threshold = rebalance_threshold
+        self.http = None  # ClientSession, created on startup inside the event loop
+        metrics.gauge("minicloud_backend_queue_depth", "Requests waiting for a backend slot",
+                      lambda: {(s,): g.queued for s, g in self.limits.items()}, ["backend"])
+        metrics.gauge("minicloud_backend_active", "Requests currently running against a backend",
+                      lambda: {(s,): g.active for s, g in self.limits.items()}, ["backend"])
+
+    def limit(self, server):
+        gate = self.limits.get(server)
+        if gate is None:
+            gate = self.limits[server] = ConcurrencyLimit(self.backend_limit, self.backend_queue)
+        return gate
+
+    async def forward(self, method, server, path, timeout=15, accepted=False, **kwargs):
+        """Send a request to a backend node and read the whole response (a Reply).
+
+        Raises Overloaded if the node's queue is full, and CircuitOpen while
+        its breaker is open or it is ejected as a slow outlier. `accepted`
+        marks a follow-up on work the node already took on (a create job
+        poll): it skips the breaker, and its latency stays out of outlier
+        detection (see ThreadedBalancer.forward).
+        """
+        op = path.split("/")[1]
+        async with self.limit(server):
+            # asked only once holding a slot, so a half-open probe is never lost to a full queue
+            if not accepted and not self.scheduler.admit(server):
+                raise CircuitOpen(f"{server} is unavailable (circuit open or ejected)")
+            self.scheduler.start(server)
+            t0 = time.monotonic()
+            ok = False
+            try:
+                async with self.http.request(method, f"{server}{path}",
+                                             timeout=ClientTimeout(total=timeout, sock_connect=CONNECT_TIMEOUT),
+                                             **kwargs) as res:
+                    ok = res.status < 500 or res.status == 503
+                    return Reply(res.status, res.headers, await res.read())
+            except Exception:
+                backend_errors.inc(server, op)
+                raise
+            finally:
+                elapsed = time.monotonic() - t0
+                self.scheduler.finish(server, elapsed, ok, None if accepted else op)
+                backend_latency.observe(elapsed, server, op)
+
+    def never_sent(self, e):
+        return super().never_sent(e) or isinstance(e, (ClientConnectorError, ConnectionTimeoutError))
+
+    async def send(self, call, deadline=None):
+        coro = self.forward(call.method, call.server, call.path, **call.kwargs)
+        if deadline is None:
+            return await coro
+        try:
+            return await asyncio.wait_for(coro, deadline)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"no response within {deadline}s") from None
+
+    async def perform(self, step):
+        if isinstance(step, Call):
+            return await self.send(step)
+        if isinstance(step, Gather):
+            return await asyncio.gather(*(self.send(call, step.deadline) for call in step.calls),
+                                        return_exceptions=True)
+        if isinstance(step, Sleep):
+            return await asyncio.sleep(step.seconds)
+        if isinstance(step, Offload):
+            return await asyncio.to_thread(step.fn, *step.args)
+        raise TypeError(f"Unknown flow step {step!r}")
+
+    async def drive(self, flow):
+        """Run a flow to completion on the event loop and return its result."""
+        send, value = flow.send, None
+        try:
+            while True:
+                try:
+                    step = send(value)
+                except StopIteration as stop:
+                    return stop.value
+                try:
+                    send, value = flow.send, await self.perform(step)
+                except Exception as e:
+                    send, value = flow.throw, e
+        finally:
+            flow.close()
+
+    def spawn(self, flow):
+        # called from handlers and background tasks, all on the event loop
+        asyncio.get_running_loop().create_task(self.drive(flow))
+
+    async def watch_membership(self, interval=1.0):
+        """Background task: suspect, then remove, nodes whose heartbeats stop."""
+        while True:
+            await asyncio.sleep(interval)
+            self.membership.check()
+
+    def stats(self):
+        snapshot = super().stats()
+        for server, gate in self.limits.items():
+            if server in snapshot["backends"]:
+                snapshot["backends"][server]["queue"] = gate.stats()
+        return snapshot
+
+
+def error(message, status):
+    return web.json_response({"error": message}, status=status)
+
+
+def overloaded(e):
+    """503 for a call the load balancer would not send: the backend's queue is full or its circuit is open."""
+    message = str(e) if isinstance(e, CircuitOpen) else f"Backend overloaded: {e}"
+    return web.json_response({"error": message}, status=503, headers={"Retry-After": "1"})
+
+
+def relay(res):
+    """Pass a node's JSON reply straight back."""
+    return web.Response(body=res.body, status=res.status, content_type="application/json")
+
+
+def reply(body, status=200, headers=None):
+    """A flow's result as a response; a bytes body is already-encoded JSON."""
+    if isinstance(body, bytes):
+        return web.Response(body=body, status=status, content_type="application/json", headers=headers)
+    return web.json_response(body, status=status, headers=headers)
+
+
+async def respond(request, flow):
+    """Run a flow for a request; a refused call or pick becomes a 503, anything else a 500."""
+    try:
+        return reply(*await request.app["proxy"].drive(flow))
+    except LookupError as e:
+        return error(str(e), 503)
+    except (Overloaded, CircuitOpen) as e:
+        return overloaded(e)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def batch_names(request):
+    names = (await read_json(request)).get("names")
+    if not isinstance(names, list) or not names:
+        return None
+    return list(dict.fromkeys(str(n) for n in names))
+
+
+routes = web.RouteTableDef()
+
+
+@routes.post("/create_vm")
+async def create_vm(request):
+    """Forward the request to the backend chosen by the scheduling strategy.
+
+    Only nodes with room for the size and the catalog image already pulled
+    qualify. A node that refuses (503) or cannot be reached is skipped for
+    the next pick, within the retry budget.
+    """
+    return await respond(request, request.app["proxy"].create_vm(await read_json(request)))
+
+
+@routes.get("/jobs/{job_id}")
+async def get_job(request):
+    """Proxy a create job's status from the node running it."""
+    return await respond(request, request.app["proxy"].get_job(request.match_info["job_id"], dict(request.query)))
+
+
+@routes.post("/create_vms")
+async def create_vms(request):
+    """Create many VMs: split the batch across nodes and create each share concurrently.
+
+    Names a node refused or never received (code 503) are placed again on
+    other nodes, within the retry budget.
+    """
+    names = await batch_names(request)
+    if names is None:
+        return error("Missing names", 400)
+    return await respond(request, request.app["proxy"].create_vms(names, await read_json(request)))
+
+
+@routes.post("/delete_vms")
+async def delete_vms(request):
+    """Delete many VMs, each node's share concurrently."""
+    names = await batch_names(request)
+    if names is None:
+        return error("Missing names", 400)
+    return await respond(request, request.app["proxy"].delete_vms(names))
+
+
+@routes.post("/shutdown_vms")
+async def shutdown_vms(request):
+    """Stop many VMs, each node's share concurrently."""
+    names = await batch_names(request)
+    if names is None:
+        return error("Missing names", 400)
+    return await respond(request, request.app["proxy"].shutdown_vms(names))
+
+
+@routes.post("/vm_status")
+async def vm_status(request):
+    """Live status of many VMs in one call, each owning node asked once, concurrently."""
+    names = await batch_names(request)
+    if names is None:
+        return error("Missing names", 400)
+    return await respond(request, request.app["proxy"].vm_status(names))
+
+
+@routes.get("/list_all")
+async def list_all(request):
+    """Fetch the VM lists of all servers concurrently (one {server: vms or "Error: ..."} per node).
+
+    Same delta polling, ETag/304 and `?since_version=` deltas as the threaded engine.
+    """
+    return await respond(request, request.app["proxy"].list_all(
+        request.query.get("since_version"), request.query.get("epoch"), request.headers.get("If-None-Match")))
+
+
+async def vm_call(proxy, data, method, node_path, **kwargs):
+    """Forward to `node_path`/<name> on the owner of the VM named in `data`.
+
+    Returns (server, reply, error_response); exactly one of the last two is set.
+    """
+    name = data.get("name")
+    server = proxy.vm_server(data)
+    if not name:
+        return server, None, error("Missing name", 400)
+    if not server:
+        return server, None, error("Unknown VM", 404)
+    try:
+        return server, await proxy.forward(method, server, f"{node_path}/{name}", timeout=15, **kwargs), None
+    except (Overloaded, CircuitOpen) as e:
+        return server, None, overloaded(e)
+    except Exception as e:
+        return server, None, error(str(e), 500)
+
+
+@routes.post("/delete_vm")
+async def delete_vm(request):
+    """Forward delete requests to the server that owns the container."""
+    return await respond(request, request.app["proxy"].delete_vm(await read_json(request)))
+
+
+@routes.post("/shutdown_vm")
+async def shutdown_vm(request):
+    """Forward shutdown requests to the server that owns the container (stop without delete)."""
+    _, res, failed = await vm_call(request.app["proxy"], await read_json(request), "POST", "/shutdown_vm")
+    return failed or relay(res)
+
+
+async def open_stream(proxy, server, method, path, read_timeout, **kwargs):
+    """Open a streamed upstream response; returns (response, error_response)."""
+    try:
+        res = await proxy.http.request(method, f"{server}{path}",
+                                       timeout=ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT,
+                                                             sock_read=read_timeout),
+                                       **kwargs)
+    except Exception as e:
+        backend_errors.inc(server, path.split("/")[1])
+        return None, error(str(e), 500)
+    if res.status != 200:
+        body = await res.read()
+        res.release()
+        return None, web.Response(body=body, status=res.status, content_type="application/json")
+    return res, None
+
+
+async def pipe(request, res, content_type):
+    """Relay an upstream body chunk by chunk as it arrives."""
+    out = web.StreamResponse(headers={"Content-Type": content_type, "Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+    await out.prepare(request)
+    try:
+        async for chunk in res.content.iter_any():
+            await out.write(chunk)
+    finally:
+        res.release()
+    return out
+
+
+@routes.post("/exec_vm")
+async def exec_vm(request):
+    """Forward exec requests to the correct server, streaming the output through unbuffered."""
+    proxy = request.app["proxy"]
+    data = await read_json(request)
+    name = data.get("name")
+    server = proxy.vm_server(data)
+    if not name:
+        return error("Missing name", 400)
+    if not server:
+        return error("Unknown VM", 404)
+
+    gate = proxy.limit(server)
+    try:
+        await gate.acquire()
+    except Overloaded as e:
+        return overloaded(e)
+    if not proxy.scheduler.admit(server):
+        gate.release()
+        return overloaded(CircuitOpen(f"{server} is unavailable (circuit open or ejected)"))
+    proxy.scheduler.start(server)
+    t0 = time.monotonic()
+    ok = False
+    try:
+        res, failed = await open_stream(proxy, server, "POST", f"/exec_vm/{name}", None,
+                                        json={"cmd": data.get("cmd", "/bin/sh")})
+        ok = failed is None or failed.status < 500 or failed.status == 503
+        if failed:
+            return failed
+        try:
+            return await pipe(request, res, "text/plain")
+        except ClientError:
+            ok = False  # the node broke off mid-stream; a client going away is not its fault
+            backend_errors.inc(server, "exec_vm")
+            raise
+    finally:
+        gate.release()
+        elapsed = time.monotonic() - t0
+        proxy.scheduler.finish(server, elapsed, ok)
+        backend_latency.observe(elapsed, server, "exec_vm")
+
+
+@routes.post("/shell_session")
+async def shell_session(request):
+    """Initiate an interactive shell session on a container."""
+    proxy = request.app["proxy"]
+    data = await read_json(request)
+    server, res, failed = await vm_call(proxy, data, "POST", "/shell_session", json={"user": data.get("user")})
+    if failed:
+        return failed
+    body = res.json()
+    if res.status == 201:
+        proxy.session_servers[body["session_id"]] = server
+        body["server"] = server
+    return web.json_response(body, status=res.status)
+
+
+async def session_call(request, node_path, timeout, body=None):
+    """Forward to `node_path`/<session_id> on the node hosting the session."""
+    proxy = request.app["proxy"]
+    data = await read_json(request)
+    server = proxy.session_server(data)
+    session_id = data.get("session_id")
+    if not server or not session_id:
+        return data, None, error("Missing server or session_id", 400)
+    try:
+        res = await proxy.forward("POST", server, f"{node_path}/{session_id}",
+                                  json=body(data) if body else None, timeout=timeout)
+        if res.status == 404:
+            proxy.session_servers.pop(session_id, None)  # closed or reaped on the node
+        return data, res, None
+    except (Overloaded, CircuitOpen) as e:
+        return data, None, overloaded(e)
+    except Exception as e:
+        return data, None, error(str(e), 500)
+
+
+@routes.post("/shell_input")
+async def shell_input(request):
+    """Send input to an active shell session."""
+    _, res, failed = await session_call(request, "/shell_input", 15,
+                                        body=lambda d: {"input": d.get("input", "")})
+    return failed or relay(res)
+
+
+@routes.post("/shell_output")
+async def shell_output(request):
+    """Get output from an active shell session."""
+    _, res, failed = await session_call(
+        request, "/shell_output", 5,
+        body=lambda d: {"since": d["since"]} if d.get("since") is not None else {})
+    if failed:
+        return failed
+    headers = {k: v for k, v in res.headers.items() if k.startswith("X-Shell-")}
+    return web.Response(body=res.body, status=res.status, headers=headers, content_type="text/plain")
+
+
+@routes.get("/shell_stream")
+async def shell_stream(request):
+    """Relay a node's Server-Sent Events shell stream without buffering."""
+    proxy = request.app["proxy"]
+    server = proxy.session_server(request.query)
+    session_id = request.query.get("session_id")
+    if not server or not session_id:
+        return error("Missing server or session_id", 400)
+
+    # the slot covers opening the stream only: an idle SSE stream costs the node nothing
+    try:
+        async with proxy.limit(server):
+            resume = {"Last-Event-ID": request.headers["Last-Event-ID"]} if "Last-Event-ID" in request.headers else {}
+            params = {"since": request.query["since"]} if request.query.get("since") else {}
+            res, failed = await open_stream(proxy, server, "GET", f"/shell_stream/{session_id}", 60,
+                                            params=params, headers=resume)
+    except (Overloaded, CircuitOpen) as e:
+        return overloaded(e)
+    return failed or await pipe(request, res, "text/event-stream")
+
+
+@routes.post("/shell_close")
+async def shell_close(request):
+    """Close an active shell session."""
+    data, res, failed = await session_call(request, "/shell_close", 15)
+    if failed:
+        return failed
+    request.app["proxy"].session_servers.pop(data.get("session_id"), None)
+    return relay(res)
+
+
+@routes.get("/images")
+async def list_images(request):
+    """Catalog image state and pull progress of every node: {server: {"images"} or "Error: ..."}."""
+    return await respond(request, request.app["proxy"].list_images())
+
+
+@routes.get("/sessions")
+async def list_sessions(request):
+    """Shell sessions of every node, fetched concurrently: {server: {"sessions", "limits"} or "Error: ..."}."""
+    return await respond(request, request.app["proxy"].list_sessions())
+
+
+@routes.post("/snapshot_vm")
+async def snapshot_vm(request):
+    """Snapshot a VM on its node: {"name", "owner"?} -> snapshot metadata plus "server"."""
+    return await respond(request, request.app["proxy"].snapshot_vm(await read_json(request)))
+
+
+@routes.get("/snapshots")
+async def list_snapshots(request):
+    """Snapshots on every node (`?owner=` filters): {server: {"snapshots", "limits"} or "Error: ..."}."""
+    return await respond(request, request.app["proxy"].list_snapshots(request.query.get("owner")))
+
+
+@routes.delete("/snapshots/{snapshot_id}")
+async def delete_snapshot(request):
+    """Delete a snapshot on the node holding it."""
+    return await respond(request, request.app["proxy"].delete_snapshot(request.match_info["snapshot_id"]))
+
+
+@routes.post("/clone_vm")
+async def clone_vm(request):
+    """Stamp out VMs from a snapshot on the node holding it: {"snapshot_id", "names", "size"?}."""
+    names = await batch_names(request)
+    if names is None:
+        return error("Missing names", 400)
+    return await respond(request, request.app["proxy"].clone_vm(names, await read_json(request)))
+
+
+@routes.post("/migrate_vm")
+async def migrate_vm(request):
+    """Move a VM to another node: {"name", "target" (optional)}."""
+    data = await read_json(request)
+    if not data.get("name"):
+        return error("Missing name", 400)
+    return await respond(request, request.app["proxy"].migrate(data["name"], data.get("target")))
+
+
+@routes.post("/drain_node")
+async def drain_node(request):
+    """Stop (or resume) new placements on a node: {"url", "drain": true, "evacuate": false}."""
+    proxy = request.app["proxy"]
+    data = await read_json(request)
+    url, draining = data.get("url"), data.get("drain", True)
+    if not proxy.scheduler.drain(url, draining):
+        return error("Unknown node", 404)
+    print(f"[LB] Node {url} {'draining' if draining else 'accepting VMs again'}")
+    if draining and data.get("evacuate"):
+        proxy.spawn(proxy.evacuate(url))
+    return web.json_response({"url": url, "draining": draining,
+                              "evacuating": bool(draining and data.get("evacuate"))})
+
+
+@routes.post("/register_node")
+async def register_node(request):
+    """A node announces itself: {"url": ..., "stats": {...}}."""
+    proxy = request.app["proxy"]
+    data = await read_json(request)
+    url = data.get("url")
+    if not url:
+        return error("Missing url", 400)
+    proxy.membership.register(url, data.get("stats"))
+    proxy.scheduler.update_stats(url, data.get("stats") or {})
+    return web.json_response({"status": "registered", "url": url})
+
+
+@routes.post("/heartbeat")
+async def heartbeat(request):
+    """Liveness and load report from a registered node; 404 means register again."""
+    proxy = request.app["proxy"]
+    data = await read_json(request)
+    url = data.get("url")
+    if not proxy.membership.heartbeat(url, data.get("stats")):
+        return error("Unknown node, register first", 404)
+    if data.get("stats"):
+        proxy.scheduler.update_stats(url, data["stats"])
+    return web.json_response({"status": "ok"})
+
+
+@routes.get("/nodes")
+async def list_nodes(request):
+    """Return the live membership table (plus each node's drain flag and health)."""
+    proxy = request.app["proxy"]
+    backends = proxy.scheduler.snapshot()["backends"]
+    return web.json_response({url: dict(m, draining=backends.get(url, {}).get("draining", False),
+                                        health=backends.get(url, {}).get("health", "healthy"))
+                              for url, m in proxy.membership.snapshot().items()})
+
+
+@routes.get("/placements")
+async def list_placements(request):
+    """Return the VM name -> server placement table."""
+    return web.json_response(request.app["proxy"].placements.snapshot())
+
+
+@routes.get("/stats")
+async def stats(request):
+    """Report the scheduler's view of every backend, with its queue depth (plus migrations awaiting activation)."""
+    return web.json_response(request.app["proxy"].stats())
+
+
+@routes.get("/metrics")
+async def metrics_endpoint(request):
+    return web.Response(text=metrics.REGISTRY.render(), content_type="text/plain")
+
+
+@web.middleware
+async def record_metrics(request, handler):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        route = request.match_info.route.resource
+        route = route.canonical if route is not None else "unmatched"
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - t0, SERVICE, route, request.method)
+        metrics.HTTP_REQUESTS.inc(SERVICE, route, request.method, str(status))
+
+
+def make_app(proxy):
+    app = web.Application(middlewares=[record_metrics])
+    app["proxy"] = proxy
+    app.add_routes(routes)
+
+    async def startup(app):
+        # no per-host cap here: the ConcurrencyLimit in front of each backend governs
+        proxy.http = ClientSession(connector=TCPConnector(limit=0, keepalive_timeout=30))
+        app["watcher"] = asyncio.create_task(proxy.watch_membership())
+        app["rebalancer"] = (asyncio.create_task(proxy.drive(proxy.rebalance(proxy.rebalance_interval,
+                                                                              proxy.rebalance_threshold)))
+                             if proxy.rebalance_interval > 0 else None)
+
+    async def cleanup(app):
+        app["watcher"].cancel()
+        if app["rebalancer"]:
+            app["rebalancer"].cancel()
+        await proxy.http.close()
+
+    app.on_startup.append(startup)
+    app.on_cleanup.append(cleanup)
+    return app
+
+
+def run(scheduler, placements, args):
+    """Serve the load balancer with the async engine (called from load_balancer.py)."""
+    proxy = Proxy(scheduler, placements, args.list_timeout, args.backend_limit, args.backend_queue,
+                  args.suspect_after, args.remove_after, args.rebalance_interval, args.rebalance_threshold,
+                  args.retry_budget)
+    print(f"[+] Starting async load balancer on port {args.port} (strategy: {args.strategy}, "
+          f"backend limit {args.backend_limit}, queue {args.backend_queue})")
+    web.run_app(make_app(proxy), host="0.0.0.0", port=args.port, print=None)
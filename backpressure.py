@@ -0,0 +1,73 @@
+"""
+Per-backend concurrency limits with bounded queues, for the async load balancer.
+
+A ConcurrencyLimit lets at most `limit` requests to one backend run at
+once. Further requests wait in FIFO order; once `max_queue` are already
+waiting, new ones are rejected immediately with Overloaded so the caller
+can shed load (503) instead of piling up unbounded work.
+"""
+
+import asyncio
+from collections import deque
+
+
+class Overloaded(Exception):
+    """Raised when a backend's wait queue is full."""
+
+
+class ConcurrencyLimit:
+    def __init__(self, limit=256, max_queue=1024):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters = deque()  # futures of queued requests, oldest first
+        self.rejected = 0
+        self.peak_queued = 0
+
+    @property
+    def queued(self):
+        return len(self.waiters)
+
+    async def acquire(self):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{len(self.waiters)} requests already queued")
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters.append(fut)
+        self.peak_queued = max(self.peak_queued, len(self.waiters))
+        try:
+            await fut  # release() hands its slot straight to us
+        except asyncio.CancelledError:
+            if fut in self.waiters:
+                self.waiters.remove(fut)
+            elif fut.done() and not fut.cancelled():
+                self.release()  # we were handed a slot but won't use it
+            raise
+
+    def release(self):
+        while self.waiters:
+            fut = self.waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # slot changes hands; `active` is unchanged
+                return
+        self.active -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "peak_queued": self.peak_queued,
+            "rejected": self.rejected,
+        }
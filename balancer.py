@@ -0,0 +1,687 @@
+"""
+Engine-agnostic load balancer logic, shared by the threaded engine
+(load_balancer.py) and the asyncio engine (async_load_balancer.py).
+
+The engines differ only in how they reach the nodes. Everything else --
+validating and placing a create, moving it to another node while the
+first one provably did nothing, splitting a bulk request by node and
+merging the results, the steps of a migration -- is written once here, as
+"flows": generators that yield the I/O they need and are sent its outcome.
+
+    Call(method, server, path, kwargs)   -> the node's Reply; a failure is thrown in
+    Gather(calls, deadline)              -> [Reply or exception, ...], all calls at once;
+                                            calls still running at the deadline get a TimeoutError
+    Sleep(seconds)                       -> None
+    Offload(fn, args)                    -> fn(*args); off the event loop in the async engine
+                                            (placement registry writes touch the disk)
+
+A flow returns (body, status_code) or (body, status_code, headers); a
+bytes body is already-encoded JSON. Each engine subclasses Balancer with
+`drive(flow)`, which performs the steps with its own HTTP client (the
+threaded one through `run`), `spawn` for flows that run in the background,
+and its own `never_sent`.
+"""
+
+import json
+import threading
+import time
+from collections import namedtuple
+
+import images
+import metrics
+import sizes
+from health import CircuitOpen
+from membership import Membership
+from rebalance import plan_move
+from versioned import ListingAggregator
+
+# seconds a sync create may wait for its job
+CREATE_WAIT = 60
+# a node answers /create_vm as soon as the name is reserved, so a slow answer means trouble
+RESERVE_TIMEOUT = 5
+# a create the node provably did not act on moves to another node, at most this many tries
+RETRY_ATTEMPTS = 3
+# seconds a node gets to finish its share of a bulk request
+BATCH_TIMEOUT = 150
+# seconds a target gets to stage a migrating VM
+MIGRATE_TIMEOUT = 330
+SNAPSHOT_TIMEOUT = 120
+# a migrated copy's activation is retried ACTIVATE_ATTEMPTS times in place,
+# then every ACTIVATE_RETRY s in the background
+ACTIVATE_ATTEMPTS = 3
+ACTIVATE_RETRY = 5
+
+backend_retries = metrics.counter("minicloud_backend_retries_total",
+                                  "Creates moved to another node after a node refused or was unreachable", ["op"])
+
+Call = namedtuple("Call", "method server path kwargs")
+Gather = namedtuple("Gather", "calls deadline", defaults=(None,))
+Sleep = namedtuple("Sleep", "seconds")
+Offload = namedtuple("Offload", "fn args")
+
+
+class Reply:
+    """A fully read upstream response."""
+
+    def __init__(self, status, headers, body):
+        self.status, self.headers, self.body = status, headers, body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value lists `etag` or is "*" (weak comparison)."""
+    for tag in (if_none_match or "").split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def run(flow, perform):
+    """Drive a flow with a blocking `perform(step)` and return its result."""
+    send, value = flow.send, None
+    try:
+        while True:
+            try:
+                step = send(value)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                send, value = flow.send, perform(step)
+            except Exception as e:
+                send, value = flow.throw, e
+    finally:
+        flow.close()
+
+
+def error_item(name, message, code):
+    return {"name": name, "status": "error", "error": message, "code": code}
+
+
+class Balancer:
+    """Routing state (scheduler, membership, registries) and the flows that use it."""
+
+    # exceptions for calls the load balancer itself would not send
+    refused = (CircuitOpen,)
+
+    def __init__(self, scheduler, placements, list_deadline=3.0, suspect_after=6.0, remove_after=15.0,
+                 retry_budget=3.0):
+        self.scheduler = scheduler
+        self.placements = placements  # VM name -> owning server (persisted)
+        self.list_deadline = list_deadline
+        self.retry_budget = retry_budget
+        self.membership = Membership(suspect_after, remove_after, on_change=self.membership_changed)
+        self.session_servers = {}  # shell session id -> server
+        self.job_servers = {}  # async create job id -> server running it
+        # every node's VM list, kept current with delta queries, plus the versioned aggregate
+        self.listings = ListingAggregator()
+        self.migrating = set()
+        self.migrate_lock = threading.Lock()
+        self.unactivated = {}  # name -> target whose staged copy still needs activating
+        self.snapshot_index = {}  # snapshot id -> {"server", "size"}; refilled from /snapshots on a miss
+
+    def never_sent(self, e):
+        """True if a failed call provably never reached the node, so retrying elsewhere is safe."""
+        return isinstance(e, self.refused)
+
+    def spawn(self, flow):
+        """Run a flow in the background (engine-specific)."""
+        raise NotImplementedError
+
+    def vm_server(self, data):
+        """Resolve the server owning the VM named in a request body.
+
+        The placement registry is authoritative; an explicit "server" field is
+        only used for VMs the registry does not know about.
+        """
+        return self.placements.get(data.get("name")) or data.get("server")
+
+    def session_server(self, data):
+        """Resolve the server hosting the shell session named in a request body."""
+        return self.session_servers.get(data.get("session_id")) or data.get("server")
+
+    def membership_changed(self, server, state):
+        """Keep the scheduler's backend set in step with live membership."""
+        print(f"[+] Node {server} is {state}")
+        if state == "alive":
+            self.scheduler.add(server)
+            self.spawn(self.sync_placements(server))
+        else:
+            self.scheduler.remove(server)
+
+    def sync_placements(self, server):
+        """Record a node's own VM list in the placement registry (run whenever it turns alive)."""
+        try:
+            res = yield Call("GET", server, "/list_vms", {"timeout": self.list_deadline})
+            if res.status == 200:
+                names = [vm["name"] for vm in res.json()]
+                yield Offload(self.placements.merge, ({server: names},))
+                print(f"[+] Placements synced from {server} ({len(names)} VMs)")
+        except Exception as e:
+            print(f"[LB-ERR] Placement sync from {server} failed: {e}")
+
+    def scatter(self, method, path, deadline, per_server=None, **kwargs):
+        """Send the same request to every node at once, within `deadline` seconds overall.
+
+        `per_server(server)` may return extra keyword arguments for one node's
+        request. Returns {server: Reply}, with an exception in place of the
+        reply for nodes that failed or did not answer in time.
+        """
+        servers = list(self.scheduler.urls)
+        replies = yield Gather([Call(method, s, path, {**kwargs, "timeout": deadline,
+                                                       **(per_server(s) if per_server else {})})
+                                for s in servers], deadline)
+        return dict(zip(servers, replies))
+
+    def collect(self, path, **kwargs):
+        """GET `path` from every node: {server: its JSON body or "Error: ..."}."""
+        results = yield from self.scatter("GET", path, self.list_deadline, **kwargs)
+        out = {}
+        for server, res in results.items():
+            if isinstance(res, Exception):
+                out[server] = f"Error: {res}"
+            elif res.status != 200:
+                out[server] = f"Error: HTTP {res.status}"
+            else:
+                out[server] = res.json()
+        return out
+
+    def list_images(self):
+        """Catalog image state and pull progress of every node."""
+        return (yield from self.collect("/images")), 200
+
+    def list_sessions(self):
+        """Shell sessions of every node."""
+        return (yield from self.collect("/sessions")), 200
+
+    def refresh_listings(self):
+        """Bring every node's VM list up to date with one delta query per node, in parallel.
+
+        Returns {server: "Error: ..."} for nodes that failed or missed the deadline.
+        """
+        urls = self.scheduler.urls
+        for server in self.listings.servers():
+            if server not in urls:
+                self.listings.drop(server)
+        results = yield from self.scatter("GET", "/list_vms", self.list_deadline,
+                                          per_server=lambda s: {"params": self.listings.params(s)})
+        errors = {}
+        for server, res in results.items():
+            if isinstance(res, Exception):
+                errors[server] = f"Error: {res}"
+            elif res.status != 200:
+                errors[server] = f"Error: HTTP {res.status}"
+            else:
+                self.listings.apply(server, res.json())
+        return errors
+
+    def list_all(self, since=None, epoch=None, if_none_match=None):
+        """Every node's VM list; see load_balancer.list_all for the response shapes."""
+        errors = yield from self.refresh_listings()
+        urls = self.scheduler.urls
+        # 500 only if every node failed; an empty cluster (e.g. at LB startup) is just empty
+        status = 200 if not urls or len(errors) < len(urls) else 500
+        if since is not None:
+            try:
+                delta = self.listings.view.delta(int(since), epoch)
+            except ValueError:
+                return {"error": "Invalid since_version"}, 400
+            return dict(delta, errors=errors), status
+        if errors:
+            # partial results are never cached or validated
+            return [{s: errors.get(s) or self.listings.vms(s) or []} for s in urls], status
+        etag, body = self.listings.listing(urls)
+        if etag_matches(if_none_match, etag):
+            return b"", 304, {"ETag": etag}
+        return body, status, {"ETag": etag}
+
+    def create_vm(self, data):
+        """Place one VM on the scheduler's pick; see load_balancer.create_vm."""
+        if data.get("name") in self.placements:
+            return {"error": "VM already exists"}, 400
+        size, image = data.get("size"), data.get("image") or images.DEFAULT_IMAGE
+        try:
+            sizes.resources(size)
+            images.resolve(image)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        server, res = yield from self.reserve_on_some_node(data, size, image)
+        body = res.json()
+        if res.status != 202:
+            return body, res.status
+        # the name is reserved on the node: record the placement right away
+        self.scheduler.placed(server, size)
+        yield Offload(self.placements.set, (body["name"], server))
+        self.job_servers[body["job_id"]] = server
+        body["server"] = server
+        if data.get("async"):
+            return body, 202
+        return (yield from self.wait_for_create(server, body))
+
+    def reserve_on_some_node(self, data, size, image):
+        """POST /create_vm to the scheduler's pick, moving on to another node while the node provably did nothing.
+
+        Returns (server, Reply) of the last node asked; re-raises the last
+        error if no node could be reached.
+        """
+        deadline = time.monotonic() + self.retry_budget
+        tried = []
+        while True:
+            try:
+                server = self.scheduler.pick(size, image=image, exclude=tried)
+            except LookupError:
+                if not tried:
+                    raise
+                if isinstance(failure, Exception):
+                    raise failure
+                return tried[-1], failure
+            try:
+                failure = yield Call("POST", server, "/create_vm", {"json": data, "timeout": RESERVE_TIMEOUT})
+                if failure.status != 503:
+                    return server, failure
+            except Exception as e:
+                if not self.never_sent(e):
+                    raise
+                failure = e
+            tried.append(server)
+            if len(tried) >= RETRY_ATTEMPTS or time.monotonic() >= deadline:
+                if isinstance(failure, Exception):
+                    raise failure
+                return server, failure
+            backend_retries.inc("create_vm")
+
+    def wait_for_create(self, server, accepted):
+        """Long-poll a node's create job until it finishes (or CREATE_WAIT runs out).
+
+        The node has accepted the create, so if polling fails the reply is still
+        a 202 with the job id, never an error the caller would retry. A 404 means
+        the node has lost the job (it restarted), so polling stops there.
+        """
+        deadline = time.monotonic() + CREATE_WAIT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return dict(accepted, status="pending", error="Creation still in progress"), 202
+            try:
+                res = yield Call("GET", server, f"/jobs/{accepted['job_id']}",
+                                 {"accepted": True, "params": {"wait": str(min(remaining, 10))},
+                                  "timeout": remaining + 5})
+                job = res.json()
+            except Exception as e:
+                return dict(accepted, status="pending",
+                            error=f"Lost track of the creation, poll /jobs/{accepted['job_id']}: {e}"), 202
+            if res.status == 404:
+                self.job_servers.pop(accepted["job_id"], None)
+                return dict(accepted, server=server,
+                            error="The node lost the create job; check /list_vms for the outcome"), 502
+            if job.get("status") == "done":
+                self.job_servers.pop(accepted["job_id"], None)
+                return {"status": "created", "name": job["name"], "server": server}, 201
+            if job.get("status") == "failed":
+                self.job_servers.pop(accepted["job_id"], None)
+                yield Offload(self.placements.remove, (job["name"],))
+                return {"error": job["error"], "name": job["name"], "server": server}, 500
+
+    def get_job(self, job_id, params):
+        """A create job's status from the node running it (`params` are passed on)."""
+        server = self.job_servers.get(job_id) or params.get("server")
+        if not server:
+            return {"error": "Job not found"}, 404
+        res = yield Call("GET", server, f"/jobs/{job_id}", {"accepted": True, "params": params, "timeout": 35})
+        job = res.json()
+        if job.get("status") == "failed":
+            yield Offload(self.placements.remove, (job["name"],))
+        if job.get("status") in ("done", "failed"):
+            self.job_servers.pop(job_id, None)
+        job["server"] = server
+        return job, res.status
+
+    def run_batch(self, path, groups, **fields):
+        """Send each node its share of a bulk request, all nodes in parallel.
+
+        `groups` maps server -> [names]; `fields` are added to every node's
+        request body. Returns {name: result}; if a node fails outright, every
+        name it was given gets an error entry, with code 503 if the node
+        provably did nothing (it refused, or was never reached).
+        """
+        servers = list(groups)
+        replies = yield Gather([Call("POST", s, path, {"json": {"names": groups[s], **fields},
+                                                       "timeout": BATCH_TIMEOUT})
+                                for s in servers])
+        results = {}
+        for server, res in zip(servers, replies):
+            code = 502
+            try:
+                if isinstance(res, Exception):
+                    raise res
+                body = res.json()
+                if "results" not in body:
+                    code = 503 if res.status == 503 else 502
+                    raise RuntimeError(body.get("error", "Malformed response"))
+                items = body["results"]
+            except Exception as e:
+                code = 503 if self.never_sent(e) else code
+                items = [error_item(n, str(e), code) for n in groups[server]]
+            for item in items:
+                item["server"] = server
+                results[item["name"]] = item
+        return results
+
+    def group_by_owner(self, names, results):
+        """Group names by owning server; unknown names get a 404 entry in `results`."""
+        groups = {}
+        for name in names:
+            server = self.placements.get(name)
+            if server:
+                groups.setdefault(server, []).append(name)
+            else:
+                results[name] = error_item(name, "Unknown VM", 404)
+        return groups
+
+    def create_vms(self, names, data):
+        """Create many VMs, each node's share in parallel; see load_balancer.create_vms."""
+        if not self.scheduler.urls:
+            return {"error": "No live backend nodes"}, 503
+        size, image = data.get("size"), data.get("image") or images.DEFAULT_IMAGE
+        try:
+            sizes.resources(size)
+            images.resolve(image)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        results, tried = {}, {}
+        todo = []
+        for name in names:
+            if name in self.placements:
+                results[name] = error_item(name, "VM already exists", 400)
+            else:
+                todo.append(name)
+        deadline = time.monotonic() + self.retry_budget
+        for attempt in range(RETRY_ATTEMPTS):
+            groups = {}
+            for name in todo:
+                try:
+                    server = self.scheduler.pick(size, image=image, exclude=tried.get(name, ()))
+                except LookupError as e:
+                    # keep a node's refusal from an earlier round over "nowhere left to try"
+                    results.setdefault(name, error_item(name, str(e), 503))
+                    continue
+                self.scheduler.placed(server, size)
+                groups.setdefault(server, []).append(name)
+
+            yield Offload(self.placements.set_many, ({n: s for s, group in groups.items() for n in group},))
+            batch = yield from self.run_batch("/create_vms", groups, size=size, image=image)
+            results.update(batch)
+            todo = [n for n, r in batch.items() if r.get("code") == 503]
+            if not todo or time.monotonic() >= deadline or attempt == RETRY_ATTEMPTS - 1:
+                break
+            for name in todo:
+                tried.setdefault(name, []).append(batch[name]["server"])
+            backend_retries.inc("create_vms", amount=len(todo))
+        yield from self.forget_failed(results)
+        return {"results": [results[n] for n in names]}, 200
+
+    def forget_failed(self, results):
+        """Drop the placements recorded up front for creates that failed."""
+        yield Offload(self.placements.remove_many,
+                      ([n for n, r in results.items()
+                        if r.get("status") == "error" and r.get("error") != "VM already exists"],))
+
+    def delete_vms(self, names):
+        """Delete many VMs, each node's share in parallel."""
+        results = {}
+        results.update((yield from self.run_batch("/delete_vms", self.group_by_owner(names, results))))
+        yield Offload(self.placements.remove_many,
+                      ([n for n, r in results.items() if r.get("status") == "deleted" or r.get("code") == 404],))
+        return {"results": [results[n] for n in names]}, 200
+
+    def shutdown_vms(self, names):
+        """Stop many VMs, each node's share in parallel."""
+        results = {}
+        results.update((yield from self.run_batch("/shutdown_vms", self.group_by_owner(names, results))))
+        return {"results": [results[n] for n in names]}, 200
+
+    def vm_status(self, names):
+        """Live status of many VMs, each owning node asked once, in parallel; see load_balancer.vm_status."""
+        statuses = {}
+        groups = {}
+        for name in names:
+            server = self.placements.get(name)
+            if server and name not in self.migrating and name not in self.unactivated:
+                groups.setdefault(server, []).append(name)
+            else:
+                # a placement can be missing only for a moment (LB restart, node re-sync), and
+                # mid-migration the VM is on neither node for a while: only a settled owner can
+                # say the VM is gone
+                statuses[name] = {"status": "unknown", "server": server}
+        servers = list(groups)
+        replies = yield Gather([Call("POST", s, "/vm_status", {"json": {"names": groups[s]},
+                                                               "timeout": self.list_deadline})
+                                for s in servers])
+        for server, res in zip(servers, replies):
+            try:
+                found = res.json()["statuses"]
+            except Exception:
+                found = {}
+            for name in groups[server]:
+                statuses[name] = {"status": found.get(name, "unknown"), "server": server}
+        return {"statuses": statuses}, 200
+
+    def delete_vm(self, data):
+        """Delete one VM on the server that owns it."""
+        name = data.get("name")
+        server = self.vm_server(data)
+        if not name:
+            return {"error": "Missing name"}, 400
+        if not server:
+            return {"error": "Unknown VM"}, 404
+        res = yield Call("DELETE", server, f"/delete_vm/{name}", {"timeout": 15})
+        # a 409 means the create is still running there: the placement must stay
+        if res.status in (200, 404):
+            yield Offload(self.placements.remove, (name,))
+        return res.json(), res.status
+
+    def refresh_snapshots(self, owner=None):
+        """Ask every node for its snapshots; returns {server: {"snapshots", "limits"} or "Error: ..."}."""
+        out = yield from self.collect("/snapshots", params={"owner": owner} if owner else None)
+        for server, listing in out.items():
+            for snap in listing["snapshots"] if isinstance(listing, dict) else ():
+                self.snapshot_index[snap["snapshot_id"]] = {"server": server, "size": snap["size"]}
+        return out
+
+    def list_snapshots(self, owner=None):
+        """Snapshots on every node (`owner` filters); refills the snapshot index on the way."""
+        return (yield from self.refresh_snapshots(owner)), 200
+
+    def find_snapshot(self, snapshot_id):
+        """{"server", "size"} of a snapshot, or None if no node holds it."""
+        if snapshot_id not in self.snapshot_index:
+            yield from self.refresh_snapshots()
+        return self.snapshot_index.get(snapshot_id)
+
+    def snapshot_vm(self, data):
+        """Snapshot a VM on its node: {"name", "owner"?} -> snapshot metadata plus "server"."""
+        name = data.get("name")
+        server = self.placements.get(name)
+        if not server:
+            return {"error": "Unknown VM"}, 404
+        res = yield Call("POST", server, f"/snapshot_vm/{name}", {"json": {"owner": data.get("owner")},
+                                                                   "timeout": SNAPSHOT_TIMEOUT})
+        body = res.json()
+        if res.status == 201:
+            self.snapshot_index[body["snapshot_id"]] = {"server": server, "size": body["size"]}
+            body["server"] = server
+        return body, res.status
+
+    def delete_snapshot(self, snapshot_id):
+        """Delete a snapshot on the node holding it."""
+        snap = yield from self.find_snapshot(snapshot_id)
+        if not snap:
+            return {"error": "Unknown snapshot"}, 404
+        res = yield Call("DELETE", snap["server"], f"/snapshots/{snapshot_id}", {"timeout": 30})
+        if res.status in (200, 404):
+            self.snapshot_index.pop(snapshot_id, None)
+        return res.json(), res.status
+
+    def clone_vm(self, names, data):
+        """Stamp out VMs from a snapshot on the node holding it; see load_balancer.clone_vm."""
+        snapshot_id = data.get("snapshot_id")
+        snap = yield from self.find_snapshot(snapshot_id)
+        if not snap:
+            return {"error": "Unknown snapshot"}, 404
+        server = snap["server"]
+        backend = self.scheduler.snapshot()["backends"].get(server)
+        if backend is None:
+            return {"error": "The node holding this snapshot is gone"}, 503
+        if backend["draining"]:
+            return {"error": "The node holding this snapshot is draining"}, 503
+        size = data.get("size") or snap["size"]
+        try:
+            sizes.resources(size)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        results, group = {}, []
+        for name in names:
+            if name in self.placements:
+                results[name] = error_item(name, "VM already exists", 400)
+                continue
+            self.scheduler.placed(server, size)
+            group.append(name)
+
+        yield Offload(self.placements.set_many, ({n: server for n in group},))
+        results.update((yield from self.run_batch("/clone_vm", {server: group} if group else {},
+                                                  snapshot_id=snapshot_id, size=size)))
+        yield from self.forget_failed(results)
+        if any(r.get("error") == "Snapshot not found" for r in results.values()):
+            self.snapshot_index.pop(snapshot_id, None)  # evicted on the node
+        return {"snapshot_id": snapshot_id, "results": [results[n] for n in names]}, 200
+
+    def vm_spec(self, server, name):
+        """(size, image) of a VM, from the node's cached listing (refreshed once if missing)."""
+        for attempt in range(2):
+            for vm in self.listings.vms(server) or ():
+                if vm["name"] == name:
+                    return vm.get("size") or sizes.DEFAULT_SIZE, vm.get("image") or images.DEFAULT_IMAGE
+            if attempt == 0:
+                yield from self.refresh_listings()
+        return sizes.DEFAULT_SIZE, images.DEFAULT_IMAGE
+
+    def migrate(self, name, target=None):
+        """Move a VM to `target` (default: the scheduler's pick) by commit-and-recreate.
+
+        The target stages a copy from the source's committed image, the
+        original is deleted, then the copy is activated under the VM's name and
+        the placement follows it. The VM restarts on the target: running
+        processes and open shell sessions do not survive. Returns (body, status_code).
+        """
+        source = self.placements.get(name)
+        if not source:
+            return {"error": "Unknown VM"}, 404
+        if target == source:
+            return {"error": "VM is already on that node"}, 400
+        if name in self.unactivated:
+            return {"error": "The VM's last migration is still being activated"}, 409
+        with self.migrate_lock:
+            if name in self.migrating:
+                return {"error": "Migration already in progress"}, 409
+            self.migrating.add(name)
+        try:
+            size, image = yield from self.vm_spec(source, name)
+            # no image filter: the VM's committed image travels with it
+            target = target or self.scheduler.pick(size, exclude=[source])
+            res = yield Call("POST", target, "/import_vm",
+                             {"json": {"name": name, "source": source, "size": size, "image": image},
+                              "timeout": MIGRATE_TIMEOUT})
+            if res.status != 201:
+                return dict(res.json(), stage="stage"), res.status
+            res = yield Call("DELETE", source, f"/delete_vm/{name}", {"timeout": 30})
+            if res.status != 200:
+                yield Call("POST", target, f"/import_vm/{name}/abort", {"timeout": 30})
+                return {"error": f"Removing the original failed: {res.json().get('error')}", "stage": "remove"}, 502
+            # from here on the VM only exists on the target
+            yield Offload(self.placements.set, (name, target))
+            self.scheduler.placed(target, size)
+            body, code = yield from self.activate(name, target)
+            if code != 200:
+                if code != 404:
+                    # the copy is still staged on the target: keep trying until it serves the VM
+                    self.unactivated[name] = target
+                    self.spawn(self.finish_activation(name, target))
+                return dict(body, stage="activate", retrying=code != 404), code
+            print(f"[LB] Migrated {name} from {source} to {target}")
+            return {"status": "migrated", "name": name, "from": source, "to": target}, 200
+        except self.refused + (LookupError,) as e:
+            return {"error": str(e)}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+        finally:
+            with self.migrate_lock:
+                self.migrating.discard(name)
+
+    def activate(self, name, target, attempts=ACTIVATE_ATTEMPTS):
+        """Activate a migrated VM's staged copy, retrying with backoff. Returns (body, status_code).
+
+        Activation is idempotent on the node, so a retry after a lost reply is safe;
+        404 means nothing is staged there (the copy is gone) and is not retried.
+        """
+        for attempt in range(attempts):
+            if attempt:
+                yield Sleep(2 ** (attempt - 1))
+            try:
+                res = yield Call("POST", target, f"/import_vm/{name}/activate", {"timeout": 30})
+                body, code = res.json(), res.status
+            except Exception as e:
+                body, code = {"error": str(e)}, 502
+            if code in (200, 404):
+                break
+        return body, code
+
+    def finish_activation(self, name, target):
+        """Background flow: keep activating a stranded migration copy while its node is live."""
+        try:
+            while target in self.scheduler.urls:
+                yield Sleep(ACTIVATE_RETRY)
+                body, code = yield from self.activate(name, target, attempts=1)
+                if code == 200:
+                    print(f"[LB] Migrated {name} to {target} (activated on retry)")
+                    return
+                if code == 404:
+                    break
+            print(f"[LB-ERR] Gave up activating {name} on {target} (node gone or nothing staged)")
+        finally:
+            self.unactivated.pop(name, None)
+
+    def evacuate(self, server):
+        """Background flow: migrate every VM off a draining node, one at a time."""
+        yield from self.refresh_listings()
+        for vm in self.listings.vms(server) or ():
+            body, code = yield from self.migrate(vm["name"])
+            if code != 200:
+                print(f"[LB-ERR] Evacuating {vm['name']} from {server} failed: {body.get('error')}")
+
+    def rebalance(self, interval, threshold):
+        """Background flow: when node loads diverge by more than `threshold`, migrate one VM."""
+        while True:
+            yield Sleep(interval)
+            try:
+                yield from self.refresh_listings()
+                backends = self.scheduler.snapshot()["backends"]
+                vms = {s: [(vm["name"], vm.get("size") or sizes.DEFAULT_SIZE) for vm in self.listings.vms(s) or ()]
+                       for s in backends}
+                move = plan_move(backends, vms, threshold)
+                if move:
+                    name, source, target = move
+                    print(f"[LB] Rebalancing: moving {name} from {source} to {target}")
+                    body, code = yield from self.migrate(name, target)
+                    if code != 200:
+                        print(f"[LB-ERR] Rebalance of {name} failed: {body.get('error')}")
+            except Exception as e:
+                print(f"[LB-ERR] Rebalance round failed: {e}")
+
+    def stats(self):
+        """The scheduler's view of every backend, plus migrations awaiting activation."""
+        return dict(self.scheduler.snapshot(), unactivated=dict(self.unactivated))
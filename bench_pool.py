@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Before/after latency benchmark for pooled HTTP forwarding.
+
+Compares one-connection-per-request (`requests.post`) against the shared
+keep-alive pool (`http_pool.post`). By default it starts a tiny local
+HTTP/1.1 server that answers like `/shell_output`; pass --url to point it
+at a running load balancer or server node instead.
+
+Run: python3 bench_pool.py [-n 2000] [--url http://127.0.0.1:8000/shell_output]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import http_pool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = b"$ "
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _run(label, send, url, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        send(url, json={"server": "bench", "session_id": "bench"}, timeout=5)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    p = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    print(f"{label:<10} n={n:<6} mean={statistics.mean(samples):.3f}ms "
+          f"p50={p(0.50):.3f}ms p99={p(0.99):.3f}ms total={sum(samples) / 1000:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs unpooled HTTP calls.")
+    parser.add_argument("-n", type=int, default=2000, help="Requests per run (default: 2000)")
+    parser.add_argument("--url", help="Target URL (default: built-in local server)")
+    args = parser.parse_args()
+
+    url = args.url
+    server = None
+    if not url:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/shell_output"
+
+    print(f"[+] Benchmarking POST {url}")
+    _run("before", requests.post, url, args.n)
+    _run("after", http_pool.post, url, args.n)
+
+    http_pool.close_all()
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
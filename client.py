@@ -4,7 +4,10 @@ No direct Docker access — all operations go through the load balancer.
 """
 
 import requests
+import http_pool
+import json
 import sys
+from exec_stream import ExitTrailerParser
 import time
 import threading
 
@@ -17,12 +20,45 @@ def create_vm():
         print("❌ VM name required.")
         return
 
-    res = requests.post(f"{LOAD_BALANCER}/create_vm", json={"name": name}, timeout=30)
+    res = http_pool.post(f"{LOAD_BALANCER}/create_vm", json={"name": name}, timeout=75)
     print("Response:", res.json())
 
 
+def print_batch(res):
+    results = res.json().get("results", [])
+    ok = [r for r in results if r.get("status") != "error"]
+    print(f"Done: {len(ok)}/{len(results)} succeeded")
+    for r in results:
+        if r.get("status") == "error":
+            print(f"  ❌ {r['name']}: {r.get('error')}")
+
+
+def bulk_create_vms():
+    prefix = input("VM name prefix: ").strip()
+    count = input("How many VMs: ").strip()
+    if not prefix or not count.isdigit():
+        print("❌ Prefix and a numeric count required.")
+        return
+    names = [f"{prefix}-{i}" for i in range(1, int(count) + 1)]
+    res = http_pool.post(f"{LOAD_BALANCER}/create_vms", json={"names": names}, timeout=300)
+    print_batch(res)
+
+
+def bulk_delete_vms():
+    prefix = input("Delete all VMs whose name starts with: ").strip()
+    if not prefix:
+        print("❌ Prefix required.")
+        return
+    names = [n for _, n in list_vms() if n.startswith(prefix)]
+    if not names:
+        print("No matching VMs.")
+        return
+    res = http_pool.post(f"{LOAD_BALANCER}/delete_vms", json={"names": names}, timeout=300)
+    print_batch(res)
+
+
 def list_vms():
-    res = requests.get(f"{LOAD_BALANCER}/list_all", timeout=10)
+    res = http_pool.get(f"{LOAD_BALANCER}/list_all", timeout=10)
     data = res.json()
     all_vms = []
     print("\n=== Running Containers (All Servers) ===")
@@ -38,18 +74,42 @@ def list_vms():
     return all_vms
 
 
+def run_command():
+    name = input("Enter VM name: ").strip()
+    cmd = input("Command to run: ").strip()
+    if not name or not cmd:
+        print("❌ VM name and command required.")
+        return
+    res = http_pool.stream("POST", f"{LOAD_BALANCER}/exec_vm", json={"name": name, "cmd": cmd},
+                           timeout=(2, None))
+    try:
+        if res.status_code != 200:
+            print(f"❌ {res.json()}")
+            return
+        # print output as it arrives; the stream ends with an exit-code trailer
+        parser = ExitTrailerParser()
+        out = sys.stdout.buffer
+        for chunk in res.iter_content(chunk_size=None):
+            out.write(parser.feed(chunk))
+            out.flush()
+        out.write(parser.finish())
+        out.flush()
+        if parser.exit_code is None:
+            print("\n[!] Stream ended without an exit code")
+        else:
+            print(f"\n[exit code {parser.exit_code}]")
+    finally:
+        res.close()
+
+
 def delete_vm():
     all_vms = list_vms()
     if not all_vms:
         print("No VMs to delete.")
         return
-    choice = input("\nEnter VM name to delete: ").strip()
-    target = next(((s, n) for s, n in all_vms if n == choice), None)
-    if not target:
-        print("❌ VM not found.")
-        return
-    server, name = target
-    res = requests.post(f"{LOAD_BALANCER}/delete_vm", json={"server": server, "name": name}, timeout=30)
+    name = input("\nEnter VM name to delete: ").strip()
+    # the load balancer knows which server owns the VM
+    res = http_pool.post(f"{LOAD_BALANCER}/delete_vm", json={"name": name}, timeout=30)
     print("Response:", res.json())
 
 
@@ -58,19 +118,14 @@ def ssh_into_vm():
     if not all_vms:
         print("No VMs to connect.")
         return
-    choice = input("\nEnter VM name to open shell: ").strip()
-    target = next(((s, n) for s, n in all_vms if n == choice), None)
-    if not target:
-        print("❌ VM not found.")
-        return
-    server, name = target
+    name = input("\nEnter VM name to open shell: ").strip()
     
-    print(f"\n[+] Opening interactive shell to {name} on {server}...")
+    print(f"\n[+] Opening interactive shell to {name}...")
     
     # Initiate shell session
     try:
-        res = requests.post(f"{LOAD_BALANCER}/shell_session", 
-                          json={"server": server, "name": name}, 
+        res = http_pool.post(f"{LOAD_BALANCER}/shell_session", 
+                          json={"name": name}, 
                           timeout=30)
         if res.status_code != 201:
             print(f"❌ Failed to create shell session: {res.json()}")
@@ -78,7 +133,8 @@ def ssh_into_vm():
         
         session_data = res.json()
         session_id = session_data.get("session_id")
-        print(f"[+] Session started (ID: {session_id[:8]}...)")
+        server = session_data.get("server")
+        print(f"[+] Session started on {server} (ID: {session_id[:8]}...)")
         print("[+] Type 'exit' to close connection.\n")
         
         # Open interactive shell
@@ -95,14 +151,49 @@ def interactive_shell(server, session_id):
     output_buffer = []
     stop_event = threading.Event()
     
+    def stream_output():
+        """Print output pushed over Server-Sent Events. Returns False if unavailable."""
+        try:
+            res = http_pool.stream("GET", f"{LOAD_BALANCER}/shell_stream",
+                                   params={"server": server, "session_id": session_id},
+                                   timeout=(2, 60))
+        except Exception:
+            return False
+        if res.status_code != 200:
+            res.close()
+            return False
+        try:
+            event = None
+            for line in res.iter_lines(chunk_size=None, decode_unicode=True):
+                if stop_event.is_set():
+                    break
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:") and event != "end":
+                    print(json.loads(line[5:]), end='', flush=True)
+                elif not line:
+                    event = None
+        except Exception as e:
+            if not stop_event.is_set():
+                print(f"\n[!] Output stream error: {e}")
+        finally:
+            res.close()
+        return True
+    
     def read_output():
+        if stream_output():
+            return
+        # fall back to polling, resuming from the node's output cursor
+        cursor = 0
         while not stop_event.is_set():
             try:
-                res = requests.post(f"{LOAD_BALANCER}/shell_output", 
-                                  json={"server": server, "session_id": session_id}, 
+                res = http_pool.post(f"{LOAD_BALANCER}/shell_output", 
+                                  json={"server": server, "session_id": session_id, "since": cursor}, 
                                   timeout=1)
-                if res.status_code == 200 and res.text:
-                    print(res.text, end='', flush=True)
+                if res.status_code == 200:
+                    cursor = int(res.headers.get("X-Shell-Offset", cursor))
+                    if res.text:
+                        print(res.text, end='', flush=True)
             except requests.exceptions.Timeout:
                 pass
             except Exception as e:
@@ -124,7 +215,7 @@ def interactive_shell(server, session_id):
             
             # Send input to shell
             try:
-                res = requests.post(f"{LOAD_BALANCER}/shell_input", 
+                res = http_pool.post(f"{LOAD_BALANCER}/shell_input", 
                                   json={"server": server, "session_id": session_id, "input": user_input}, 
                                   timeout=10)
                 if res.status_code != 200:
@@ -142,7 +233,7 @@ def interactive_shell(server, session_id):
     finally:
         # Close session
         try:
-            requests.post(f"{LOAD_BALANCER}/shell_close", 
+            http_pool.post(f"{LOAD_BALANCER}/shell_close", 
                         json={"server": server, "session_id": session_id}, 
                         timeout=10)
         except:
@@ -158,8 +249,11 @@ def menu():
         print("1. Create VM")
         print("2. List VMs")
         print("3. SSH (exec) into VM")
-        print("4. Delete VM")
-        print("5. Exit")
+        print("4. Run command in VM")
+        print("5. Delete VM")
+        print("6. Bulk create VMs")
+        print("7. Bulk delete VMs")
+        print("8. Exit")
         print("=======================================")
         choice = input("Enter choice: ").strip()
         if choice == "1":
@@ -169,8 +263,14 @@ def menu():
         elif choice == "3":
             ssh_into_vm()
         elif choice == "4":
-            delete_vm()
+            run_command()
         elif choice == "5":
+            delete_vm()
+        elif choice == "6":
+            bulk_create_vms()
+        elif choice == "7":
+            bulk_delete_vms()
+        elif choice == "8":
             print("Goodbye!")
             sys.exit(0)
         else:
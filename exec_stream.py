@@ -0,0 +1,63 @@
+"""
+Wire format for streamed exec_vm output.
+
+The node streams a command's output as a chunked text/plain body and ends
+it with an in-band trailer carrying the exit code:
+
+    <output bytes ...>\\x00minicloud-exit:<code>\\n
+
+(HTTP trailers are not supported by the Flask dev server or requests, so
+the exit code travels in the body.) ExitTrailerParser strips the trailer
+back out of a chunk stream without buffering more than a few bytes.
+"""
+
+EXIT_MARKER = b"\x00minicloud-exit:"
+
+
+def trailer(exit_code):
+    """Encode the exit-code trailer that terminates an exec stream."""
+    return EXIT_MARKER + str(exit_code).encode() + b"\n"
+
+
+class ExitTrailerParser:
+    """Incrementally split an exec stream into output bytes and the exit code."""
+
+    def __init__(self):
+        self.pending = b""
+        self.exit_code = None
+        self.tail = None  # bytes after the marker, once seen
+
+    def feed(self, chunk):
+        """Consume a chunk; return the output bytes that are safe to print now."""
+        if self.tail is not None:
+            self.tail += chunk
+            self._parse_tail()
+            return b""
+        data = self.pending + chunk
+        idx = data.find(EXIT_MARKER)
+        if idx >= 0:
+            self.pending = b""
+            self.tail = data[idx + len(EXIT_MARKER):]
+            self._parse_tail()
+            return data[:idx]
+        # hold back a suffix that could be the start of a split marker
+        keep = 0
+        for n in range(min(len(EXIT_MARKER) - 1, len(data)), 0, -1):
+            if EXIT_MARKER.startswith(data[-n:]):
+                keep = n
+                break
+        self.pending = data[len(data) - keep:] if keep else b""
+        return data[:len(data) - keep]
+
+    def _parse_tail(self):
+        line, sep, _ = self.tail.partition(b"\n")
+        if sep:
+            try:
+                self.exit_code = int(line)
+            except ValueError:
+                self.exit_code = None
+
+    def finish(self):
+        """Flush held-back bytes at end of stream (no trailer = truncated stream)."""
+        rest, self.pending = self.pending, b""
+        return rest
@@ -0,0 +1,214 @@
+"""
+Backend health for the load balancer: circuit breakers and outlier ejection.
+
+Every call the load balancer makes to a node is recorded with its outcome
+and latency (HealthTable.record). Two independent checks then keep
+traffic away from a node that is failing or slow:
+
+ - Circuit breaker, per node. While closed it counts the outcomes of the
+   last `window` calls; once `min_calls` are in and the failure rate
+   reaches `failure_rate` it opens, and calls to the node fail fast for
+   `open_for` seconds. Then it goes half-open and lets `probes` calls
+   through: a success closes it, a failure re-opens it for twice as long
+   (up to `max_open_for`).
+ - Outlier ejection. Latency is tracked per node *and operation*, so a
+   long-poll is only compared with other long-polls. A node whose EWMA for
+   an operation is over `slow_factor` times the median of the other nodes'
+   (and at least `slow_min_ms` slower) is ejected for `eject_for` seconds,
+   longer on repeats. Its latency history is reset when it returns. At most
+   `max_ejected` of the nodes are out at once, so a cluster-wide slowdown
+   never ejects everyone. Operations whose latency measures the work asked
+   for rather than the node (UNTIMED_OPS: bulk creates, migrations,
+   snapshots) and create job polls are left out.
+
+A failure is an exception (refused connection, timeout) or a 5xx other
+than 503, which nodes use to refuse work they have no room for.
+"""
+
+import threading
+import time
+from collections import deque
+from statistics import median
+
+# operations that take as long as the work in them (batch size, VM size, create time)
+UNTIMED_OPS = frozenset({"jobs", "create_vms", "delete_vms", "shutdown_vms", "clone_vm",
+                         "import_vm", "export_vm", "snapshot_vm", "exec_vm"})
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a node whose breaker is open or that is ejected."""
+
+
+class CircuitBreaker:
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, open_for=5.0, max_open_for=60.0, probes=1):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_for = open_for
+        self.max_open_for = max_open_for
+        self.probes = probes
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.state = "closed"
+        self.opened_at = None
+        self.cooldown = open_for
+        self.probing = 0
+        self.opened = 0
+
+    def available(self, now):
+        """Would a call be let through right now? (No side effects.)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return now - self.opened_at >= self.cooldown
+        return self.probing < self.probes
+
+    def allow(self, now):
+        """Admit one call; in half-open state this takes a probe slot."""
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state, self.probing = "half-open", 0
+        if self.state == "closed":
+            return True
+        if self.state == "half-open" and self.probing < self.probes:
+            self.probing += 1
+            return True
+        return False
+
+    def record(self, ok, now):
+        if self.state == "half-open":
+            self.probing = max(0, self.probing - 1)
+            if ok:
+                self.state, self.cooldown = "closed", self.open_for
+                self.outcomes.clear()
+            else:
+                self._open(now, min(self.cooldown * 2, self.max_open_for))
+        elif self.state == "closed":
+            self.outcomes.append(ok)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+                self._open(now, self.open_for)
+        # results arriving while open come from calls admitted earlier: ignore them
+
+    def _open(self, now, cooldown):
+        self.state, self.opened_at, self.cooldown = "open", now, cooldown
+        self.outcomes.clear()
+        self.opened += 1
+
+    def failure_ratio(self):
+        return round(self.outcomes.count(False) / len(self.outcomes), 3) if self.outcomes else 0.0
+
+
+class HealthTable:
+    """Thread-safe breaker and outlier state for every backend."""
+
+    def __init__(self, breaker=None, slow_factor=3.0, slow_min_ms=100.0, min_samples=3,
+                 eject_for=10.0, max_eject_for=120.0, max_ejected=0.5, alpha=0.3, untimed=UNTIMED_OPS):
+        self.breaker_options = dict(breaker or {})
+        self.slow_factor = slow_factor
+        self.slow_min_ms = slow_min_ms
+        self.min_samples = min_samples
+        self.eject_for = eject_for
+        self.max_eject_for = max_eject_for
+        self.max_ejected = max_ejected
+        self.alpha = alpha
+        self.untimed = untimed
+        self.breakers = {}  # url -> CircuitBreaker
+        self.latency = {}  # (url, op) -> [ewma_ms, samples]
+        self.ejected = {}  # url -> ejected until
+        self.ejections = {}  # url -> times ejected
+        self.lock = threading.Lock()
+
+    def _breaker(self, url):
+        b = self.breakers.get(url)
+        if b is None:
+            b = self.breakers[url] = CircuitBreaker(**self.breaker_options)
+        return b
+
+    def _is_ejected(self, url, now):
+        until = self.ejected.get(url)
+        if until is None:
+            return False
+        if now < until:
+            return True
+        # back in rotation with a clean slate, so stale latency can't re-eject it at once
+        del self.ejected[url]
+        for key in [k for k in self.latency if k[0] == url]:
+            del self.latency[key]
+        return False
+
+    def available(self, url, now=None):
+        """True if the scheduler may place work on `url`."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return not self._is_ejected(url, now) and self._breaker(url).available(now)
+
+    def allow(self, url, now=None):
+        """Admit one call to `url` (False: fail fast with CircuitOpen instead)."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return not self._is_ejected(url, now) and self._breaker(url).allow(now)
+
+    def record(self, url, ok, elapsed, op=None, now=None):
+        """Fold in one finished call: its outcome, and its latency in seconds for `op`."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._breaker(url).record(ok, now)
+            if op is None or op in self.untimed:
+                return
+            ms = elapsed * 1000
+            entry = self.latency.setdefault((url, op), [ms, 0])
+            entry[0] = ms if entry[1] == 0 else self.alpha * ms + (1 - self.alpha) * entry[0]
+            entry[1] += 1
+            if entry[1] >= self.min_samples and self._is_outlier(url, op, entry[0], now):
+                self._eject(url, now)
+
+    def _is_outlier(self, url, op, ewma, now):
+        peers = [e for (u, o), (e, n) in list(self.latency.items())
+                 if o == op and u != url and n >= self.min_samples and not self._is_ejected(u, now)]
+        if not peers:
+            return False
+        typical = median(peers)
+        return ewma > self.slow_factor * typical and ewma - typical >= self.slow_min_ms
+
+    def _eject(self, url, now):
+        if url in self.ejected:
+            return
+        if len(self.ejected) + 1 > self.max_ejected * len(self.breakers):
+            return
+        self.ejections[url] = self.ejections.get(url, 0) + 1
+        self.ejected[url] = now + min(self.eject_for * self.ejections[url], self.max_eject_for)
+        print(f"[LB] Ejecting slow node {url} for {self.ejected[url] - now:.0f}s")
+
+    def forget(self, url):
+        """Drop all state for a node that left the cluster."""
+        with self.lock:
+            self.breakers.pop(url, None)
+            self.ejected.pop(url, None)
+            self.ejections.pop(url, None)
+            for key in [k for k in self.latency if k[0] == url]:
+                del self.latency[key]
+
+    def state(self, url, now=None):
+        """One of "healthy", "ejected", "open" or "half-open"."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self._is_ejected(url, now):
+                return "ejected"
+            b = self._breaker(url)
+            return "healthy" if b.state == "closed" else b.state
+
+    def snapshot(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            out = {}
+            for url, b in self.breakers.items():
+                ejected = self._is_ejected(url, now)
+                out[url] = {
+                    "state": "ejected" if ejected else ("healthy" if b.state == "closed" else b.state),
+                    "breaker": b.state,
+                    "failure_rate": b.failure_ratio(),
+                    "opened": b.opened,
+                    "ejected_for": round(self.ejected[url] - now, 3) if ejected else None,
+                    "ejections": self.ejections.get(url, 0),
+                    "latency_ms": {op: round(e, 3) for (u, op), (e, _) in self.latency.items() if u == url},
+                }
+            return out
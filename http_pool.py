@@ -0,0 +1,103 @@
+"""
+Shared HTTP connection pools for talking to MiniCloud services.
+
+Every backend (load balancer, server node) gets one long-lived
+requests.Session with a bounded, keep-alive connection pool, so repeated
+calls (e.g. shell output polling) reuse TCP connections instead of opening
+a new one per request.
+
+Tuning via environment variables:
+ - MINICLOUD_POOL_SIZE        max pooled connections per backend (default 32)
+ - MINICLOUD_POOL_BLOCK       "1" to wait for a free connection instead of
+                              opening an extra, unpooled one (default 1)
+ - MINICLOUD_CONNECT_TIMEOUT  connect timeout in seconds (default 2)
+ - MINICLOUD_READ_TIMEOUT     default read timeout in seconds (default 15)
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = int(os.environ.get("MINICLOUD_POOL_SIZE", "32"))
+POOL_BLOCK = os.environ.get("MINICLOUD_POOL_BLOCK", "1") == "1"
+CONNECT_TIMEOUT = float(os.environ.get("MINICLOUD_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.environ.get("MINICLOUD_READ_TIMEOUT", "15"))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _origin(url):
+    """Return scheme://host:port for a URL (the pool key)."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _new_session():
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE,
+                          pool_block=POOL_BLOCK, max_retries=0)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers["Connection"] = "keep-alive"
+    return s
+
+
+def get_session(url):
+    """Return the shared session (connection pool) for the backend serving `url`."""
+    key = _origin(url)
+    s = _sessions.get(key)
+    if s is None:
+        with _sessions_lock:
+            s = _sessions.get(key)
+            if s is None:
+                s = _sessions[key] = _new_session()
+    return s
+
+
+def _timeout(timeout):
+    """Normalise a timeout so the connect phase always uses CONNECT_TIMEOUT."""
+    if timeout is None:
+        return (CONNECT_TIMEOUT, READ_TIMEOUT)
+    if isinstance(timeout, tuple):
+        return timeout
+    return (min(CONNECT_TIMEOUT, timeout), timeout)
+
+
+def request(method, url, timeout=None, **kwargs):
+    """Send a request through the pooled session for the target backend."""
+    return get_session(url).request(method, url, timeout=_timeout(timeout), **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
+
+
+def stream(method, url, timeout=None, **kwargs):
+    """Open a long-lived streaming request (SSE, chunked output).
+
+    Streams hold their connection for minutes, so they get their own
+    connection instead of pinning one of the bounded pool's slots; the
+    setup cost is negligible next to the stream's lifetime. The caller
+    must close() the returned response.
+    """
+    return requests.request(method, url, timeout=_timeout(timeout), stream=True, **kwargs)
+
+
+def close_all():
+    """Close every pooled connection (used on shutdown and by benchmarks)."""
+    with _sessions_lock:
+        for s in _sessions.values():
+            s.close()
+        _sessions.clear()
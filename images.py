@@ -0,0 +1,96 @@
+"""
+Image catalog and node-side image pre-pulling.
+
+Callers choose a VM image by catalog name (CATALOG maps it to an image
+reference). Nodes pull the whole catalog in the background at startup, so
+a create never waits for a pull: a node only accepts VMs whose image is
+already local, and reports which images those are with its heartbeats so
+the load balancer places VMs on nodes that have them.
+
+ImagePuller tracks every catalog image's state on one node ("missing",
+"pulling", "ready" or "failed") with byte-level pull progress.
+"""
+
+import threading
+import time
+
+CATALOG = {
+    "alpine": "alpine:latest",
+    "debian": "debian:bookworm-slim",
+    "ubuntu": "ubuntu:24.04",
+}
+DEFAULT_IMAGE = "alpine"
+
+
+def resolve(name=None):
+    """Image reference for a catalog name (the default when None). Raises ValueError if not allowed."""
+    name = name or DEFAULT_IMAGE
+    if name not in CATALOG:
+        raise ValueError(f"Unknown image {name!r} (choose from {', '.join(CATALOG)})")
+    return CATALOG[name]
+
+
+class ImagePuller:
+    """Pulls the catalog onto one node through a runtime and reports progress."""
+
+    def __init__(self, runtime, catalog=None, retry_after=60.0):
+        self.runtime = runtime
+        self.catalog = dict(catalog or CATALOG)
+        self.retry_after = retry_after
+        self.images = {name: {"ref": ref, "state": "missing", "current": 0, "total": None, "error": None}
+                       for name, ref in self.catalog.items()}
+        self.lock = threading.Lock()
+
+    def ready(self, name):
+        with self.lock:
+            return self.images.get(name, {}).get("state") == "ready"
+
+    def available(self):
+        """Catalog names that are local and usable right now."""
+        with self.lock:
+            return [name for name, img in self.images.items() if img["state"] == "ready"]
+
+    def progress(self):
+        """{name: percent} for images being pulled (None while the size is unknown)."""
+        with self.lock:
+            return {name: (round(100 * img["current"] / img["total"]) if img["total"] else None)
+                    for name, img in self.images.items() if img["state"] == "pulling"}
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(img) for name, img in self.images.items()}
+
+    def _set(self, name, **fields):
+        with self.lock:
+            self.images[name].update(fields)
+
+    def pull(self, name):
+        """Make one image local (no-op if it already is); returns True when ready."""
+        ref = self.catalog[name]
+        try:
+            if self.runtime.has_image(ref):
+                self._set(name, state="ready", error=None)
+                return True
+            self._set(name, state="pulling", current=0, total=None, error=None)
+            layers = {}  # layer id -> (current, total)
+            for event in self.runtime.pull(ref):
+                layers[event["layer"]] = (event["current"], event["total"])
+                self._set(name, current=sum(c for c, _ in layers.values()),
+                          total=sum(t for _, t in layers.values()) or None)
+            self._set(name, state="ready")
+            print(f"[Images] {name} ({ref}) is ready")
+            return True
+        except Exception as e:
+            self._set(name, state="failed", error=str(e))
+            print(f"[Images] Pulling {name} ({ref}) failed: {e}")
+            return False
+
+    def run(self):
+        """Background thread: pull every missing catalog image, retrying failures."""
+        while True:
+            for name in self.catalog:
+                if not self.ready(name):
+                    self.pull(name)
+            if all(self.ready(name) for name in self.catalog):
+                return
+            time.sleep(self.retry_after)
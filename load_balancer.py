@@ -1,101 +1,327 @@
 """
-Simple load balancer that distributes requests between two servers.
+Simple load balancer that distributes requests between server nodes.
+Placement is delegated to a pluggable strategy (see scheduler.py).
+
+Routing logic shared with the async engine (placement, create retries,
+bulk requests, migration) lives in balancer.py; this module is the
+threaded Flask engine that runs it.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 import requests
-import itertools
+from urllib3.exceptions import NewConnectionError
+import http_pool
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from scheduler import Scheduler, STRATEGIES
+from health import HealthTable, CircuitOpen
+from placement import PlacementRegistry
+from balancer import Balancer, Call, Gather, Sleep, Offload, Reply, run
+import metrics
 
 app = Flask(__name__)
+metrics.instrument(app, "load_balancer")
 
-# backend servers (for now, 2)
-servers = ["http://127.0.0.1:5000", "http://127.0.0.1:5001"]
-server_cycle = itertools.cycle(servers)
+# shared pool for fan-out calls to every node
+fanout = ThreadPoolExecutor(max_workers=32, thread_name_prefix="fanout")
 
+# per-backend latency, labelled by the first path segment (e.g. "delete_vm")
+backend_latency = metrics.histogram("minicloud_backend_request_seconds",
+                                    "Latency of requests forwarded to backend nodes", ["backend", "op"])
+backend_errors = metrics.counter("minicloud_backend_errors_total",
+                                 "Forwarded requests that failed without a response", ["backend", "op"])
 
-@app.route("/create_vm", methods=["POST"])
-def create_vm():
-    """Forward the request to one of the backend servers."""
-    server = next(server_cycle)
+
+class ThreadedBalancer(Balancer):
+    """Runs the shared flows (balancer.py) with blocking calls: one thread per request, a pool for fan-out."""
+
+    def forward(self, method, server, path, accepted=False, **kwargs):
+        """Send a request to a backend node, tracking in-flight count, latency and health.
+
+        Raises CircuitOpen without calling the node while its breaker is open or
+        it is ejected as a slow outlier (see health.py). `accepted` marks a
+        follow-up on work the node already took on (a create job poll): it goes
+        out regardless, and its latency, which is really the create's, is kept
+        out of outlier detection.
+        """
+        op = path.split("/")[1]
+        if not accepted and not self.scheduler.admit(server):
+            raise CircuitOpen(f"{server} is unavailable (circuit open or ejected)")
+        self.scheduler.start(server)
+        t0 = time.monotonic()
+        ok = False
+        try:
+            res = http_pool.request(method, f"{server}{path}", **kwargs)
+            ok = res.status_code < 500 or res.status_code == 503
+            return res
+        except Exception:
+            backend_errors.inc(server, op)
+            raise
+        finally:
+            elapsed = time.monotonic() - t0
+            self.scheduler.finish(server, elapsed, ok, None if accepted else op)
+            backend_latency.observe(elapsed, server, op)
+
+    def never_sent(self, e):
+        if super().never_sent(e) or isinstance(e, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(e.args[0], "reason", None) if e.args else None
+        return isinstance(e, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+    def send(self, call):
+        res = self.forward(call.method, call.server, call.path, **call.kwargs)
+        return Reply(res.status_code, res.headers, res.content)
+
+    def perform(self, step):
+        if isinstance(step, Call):
+            return self.send(step)
+        if isinstance(step, Gather):
+            futures = [fanout.submit(self.send, call) for call in step.calls]
+            done, _ = wait(futures, timeout=step.deadline)
+            return [f.exception() or f.result() if f in done else TimeoutError(f"no response within {step.deadline}s")
+                    for f in futures]
+        if isinstance(step, Sleep):
+            return time.sleep(step.seconds)
+        if isinstance(step, Offload):
+            return step.fn(*step.args)
+        raise TypeError(f"Unknown flow step {step!r}")
+
+    def drive(self, flow):
+        """Run a flow to completion on this thread and return its result."""
+        return run(flow, self.perform)
+
+    def spawn(self, flow):
+        threading.Thread(target=self.drive, args=(flow,), daemon=True).start()
+
+
+# backend nodes are added and removed by the membership table (see /register_node);
+# rebuilt with the command-line settings in __main__. Until then placements stay
+# in memory, so importing this module never reads or rewrites ./placements.json.
+lb = ThreadedBalancer(Scheduler(), PlacementRegistry(None))
+
+
+def reply(body, status=200, headers=None):
+    """A flow's result as a response; a bytes body is already-encoded JSON."""
+    if isinstance(body, bytes):
+        return Response(body, status=status, mimetype="application/json", headers=headers)
+    return jsonify(body), status, headers or {}
+
+
+def respond(flow):
+    """Run a flow for a request; a node or pick the LB refused becomes a 503, anything else a 500."""
     try:
-        res = requests.post(f"{server}/create_vm", json=request.get_json(force=True), timeout=15)
-        return jsonify(res.json()), res.status_code
+        return reply(*lb.drive(flow))
+    except (LookupError, CircuitOpen) as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def batch_request():
+    """Read the de-duplicated `names` list of a bulk request (None if missing)."""
+    names = request.get_json(force=True).get("names")
+    if not isinstance(names, list) or not names:
+        return None
+    return list(dict.fromkeys(str(n) for n in names))
+
+
+def watch_membership(interval=1.0):
+    """Background thread: suspect, then remove, nodes whose heartbeats stop."""
+    while True:
+        time.sleep(interval)
+        lb.membership.check()
+
+
+@app.route("/create_vm", methods=["POST"])
+def create_vm():
+    """Forward the request to the backend chosen by the scheduling strategy.
+
+    Nodes create VMs asynchronously. With {"async": true} the node's 202 and
+    job ID are passed straight back (poll /jobs/<job_id>); otherwise the
+    load balancer waits for the job and answers 201 as before. Either way
+    the response carries the chosen "server".
+
+    An optional "size" (see sizes.py) only goes to a node with room for it,
+    and an optional catalog "image" (see images.py) only to a node that has
+    already pulled it; if no node qualifies, the request is refused with 503
+    before any node is asked. A node that refuses (503) or cannot be reached
+    is skipped for the next pick, within the retry budget.
+    """
+    return respond(lb.create_vm(request.get_json(force=True)))
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Proxy a create job's status from the node running it."""
+    return respond(lb.get_job(job_id, request.args.to_dict()))
+
+
+@app.route("/create_vms", methods=["POST"])
+def create_vms():
+    """Create many VMs: split the batch across nodes and create each share in parallel.
+
+    Returns {"results": [...]} with one entry (including "server") per name.
+    Names a node refused or never received (code 503) are placed again on
+    other nodes, within the retry budget.
+    """
+    names = batch_request()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    return respond(lb.create_vms(names, request.get_json(force=True)))
+
+
+@app.route("/delete_vms", methods=["POST"])
+def delete_vms():
+    """Delete many VMs, each node's share in parallel."""
+    names = batch_request()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    return respond(lb.delete_vms(names))
+
+
+@app.route("/shutdown_vms", methods=["POST"])
+def shutdown_vms():
+    """Stop many VMs, each node's share in parallel."""
+    names = batch_request()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    return respond(lb.shutdown_vms(names))
+
+
+@app.route("/vm_status", methods=["POST"])
+def vm_status():
+    """Live status of many VMs in one call, each owning node asked once, in parallel.
+
+    Returns {"statuses": {name: {"status", "server"}}}. "missing" means the
+    VM's node has no such container; "unknown" means there is no placement
+    for it right now or its node could not be asked.
+    """
+    names = batch_request()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    return respond(lb.vm_status(names))
+
+
 @app.route("/list_all", methods=["GET"])
 def list_all():
-    """Fetch list of VMs from a single server (round-robin)."""
-    server = next(server_cycle)
-    try:
-        r = requests.get(f"{server}/list_vms", timeout=5)
-        return jsonify({server: r.json()})
-    except Exception as e:
-        return jsonify({server: f"Error: {e}"}), 500
+    """Fetch the VM lists of all servers in parallel.
+
+    Returns one {server: vms} entry per node; nodes that failed or missed
+    the deadline get an "Error: ..." string instead of a list. Nodes are
+    asked only for changes since the last call, and the aggregate is
+    versioned like a node's list: If-None-Match gets a 304 while nothing
+    changed, and `?since_version=<n>[&epoch=<e>]` returns a delta whose
+    entries carry their "server" (plus an "errors" map).
+    """
+    return respond(lb.list_all(request.args.get("since_version"), request.args.get("epoch"),
+                               request.headers.get("If-None-Match")))
 
 
 @app.route("/delete_vm", methods=["POST"])
 def delete_vm():
     """Forward delete requests to the server that owns the container."""
-    data = request.get_json(force=True)
-    server = data.get("server")
-    name = data.get("name")
-    if not server or not name:
-        return jsonify({"error": "Missing server or name"}), 400
-
-    try:
-        res = requests.delete(f"{server}/delete_vm/{name}", timeout=15)
-        return jsonify(res.json()), res.status_code
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return respond(lb.delete_vm(request.get_json(force=True)))
 
 
 @app.route("/shutdown_vm", methods=["POST"])
 def shutdown_vm():
     """Forward shutdown requests to the server that owns the container (stop without delete)."""
     data = request.get_json(force=True)
-    server = data.get("server")
     name = data.get("name")
-    if not server or not name:
-        return jsonify({"error": "Missing server or name"}), 400
+    server = lb.vm_server(data)
+    if not name:
+        return jsonify({"error": "Missing name"}), 400
+    if not server:
+        return jsonify({"error": "Unknown VM"}), 404
 
     try:
-        res = requests.post(f"{server}/shutdown_vm/{name}", timeout=15)
+        res = lb.forward("POST", server, f"/shutdown_vm/{name}", timeout=15)
         return jsonify(res.json()), res.status_code
+    except CircuitOpen as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/exec_vm", methods=["POST"])
 def exec_vm():
-    """Forward exec (SSH-like) requests to the correct server."""
+    """Forward exec (SSH-like) requests to the correct server, streaming the output through.
+
+    There is no overall deadline and no buffering: chunks are relayed as
+    the node produces them, exit-code trailer included.
+    """
     data = request.get_json(force=True)
-    server = data.get("server")
     name = data.get("name")
+    server = lb.vm_server(data)
     cmd = data.get("cmd", "/bin/sh")
-    if not server or not name:
-        return jsonify({"error": "Missing server or name"}), 400
+    if not name:
+        return jsonify({"error": "Missing name"}), 400
+    if not server:
+        return jsonify({"error": "Unknown VM"}), 404
+    if not lb.scheduler.admit(server):
+        return jsonify({"error": f"{server} is unavailable (circuit open or ejected)"}), 503
+
+    lb.scheduler.start(server)
+    t0 = time.monotonic()
+
+    def done(ok):
+        elapsed = time.monotonic() - t0
+        lb.scheduler.finish(server, elapsed, ok, "exec_vm")
+        backend_latency.observe(elapsed, server, "exec_vm")
 
     try:
-        res = requests.post(f"{server}/exec_vm/{name}", json={"cmd": cmd}, timeout=15)
-        return (res.text, res.status_code, {"Content-Type": "text/plain"})
+        res = http_pool.stream("POST", f"{server}/exec_vm/{name}", json={"cmd": cmd}, timeout=(2, None))
     except Exception as e:
+        backend_errors.inc(server, "exec_vm")
+        done(False)
         return jsonify({"error": str(e)}), 500
+    if res.status_code != 200:
+        body = res.content
+        res.close()
+        done(res.status_code < 500 or res.status_code == 503)
+        return (body, res.status_code, {"Content-Type": "application/json"})
+
+    def relay():
+        ok = False
+        try:
+            for chunk in res.iter_content(chunk_size=None):
+                yield chunk
+            ok = True
+        except GeneratorExit:
+            ok = True  # the client went away, not the node
+            raise
+        except Exception:
+            backend_errors.inc(server, "exec_vm")
+            raise
+        finally:
+            res.close()
+            done(ok)
+
+    return Response(stream_with_context(relay()), mimetype="text/plain")
 
 
 @app.route("/shell_session", methods=["POST"])
 def shell_session():
     """Initiate an interactive shell session on a container."""
     data = request.get_json(force=True)
-    server = data.get("server")
     name = data.get("name")
-    if not server or not name:
-        return jsonify({"error": "Missing server or name"}), 400
+    server = lb.vm_server(data)
+    if not name:
+        return jsonify({"error": "Missing name"}), 400
+    if not server:
+        return jsonify({"error": "Unknown VM"}), 404
     
     try:
-        res = requests.post(f"{server}/shell_session/{name}", timeout=15)
-        return jsonify(res.json()), res.status_code
+        res = lb.forward("POST", server, f"/shell_session/{name}", json={"user": data.get("user")}, timeout=15)
+        body = res.json()
+        if res.status_code == 201:
+            lb.session_servers[body["session_id"]] = server
+            body["server"] = server
+        return jsonify(body), res.status_code
+    except CircuitOpen as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -104,7 +330,7 @@ def shell_session():
 def shell_input():
     """Send input to an active shell session."""
     data = request.get_json(force=True)
-    server = data.get("server")
+    server = lb.session_server(data)
     session_id = data.get("session_id")
     cmd_input = data.get("input", "")
     
@@ -112,8 +338,12 @@ def shell_input():
         return jsonify({"error": "Missing server or session_id"}), 400
     
     try:
-        res = requests.post(f"{server}/shell_input/{session_id}", json={"input": cmd_input}, timeout=15)
+        res = lb.forward("POST", server, f"/shell_input/{session_id}", json={"input": cmd_input}, timeout=15)
+        if res.status_code == 404:
+            lb.session_servers.pop(session_id, None)  # closed or reaped on the node
         return jsonify(res.json()), res.status_code
+    except CircuitOpen as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -122,36 +352,247 @@ def shell_input():
 def shell_output():
     """Get output from an active shell session."""
     data = request.get_json(force=True)
-    server = data.get("server")
+    server = lb.session_server(data)
     session_id = data.get("session_id")
     
     if not server or not session_id:
         return jsonify({"error": "Missing server or session_id"}), 400
     
     try:
-        res = requests.post(f"{server}/shell_output/{session_id}", timeout=5)
-        return (res.text, res.status_code, {"Content-Type": "text/plain"})
+        body = {"since": data["since"]} if data.get("since") is not None else {}
+        res = lb.forward("POST", server, f"/shell_output/{session_id}", json=body, timeout=5)
+        if res.status_code == 404:
+            lb.session_servers.pop(session_id, None)
+        headers = {k: v for k, v in res.headers.items() if k.startswith("X-Shell-")}
+        headers["Content-Type"] = "text/plain"
+        return (res.text, res.status_code, headers)
+    except CircuitOpen as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/shell_stream", methods=["GET"])
+def shell_stream():
+    """Relay a node's Server-Sent Events shell stream without buffering."""
+    server = lb.session_server(request.args)
+    session_id = request.args.get("session_id")
+    if not server or not session_id:
+        return jsonify({"error": "Missing server or session_id"}), 400
+
+    try:
+        # no read deadline beyond the node's keep-alive interval: streams live long
+        resume = {"Last-Event-ID": request.headers["Last-Event-ID"]} if "Last-Event-ID" in request.headers else {}
+        res = http_pool.stream("GET", f"{server}/shell_stream/{session_id}",
+                               params={"since": request.args.get("since")}, headers=resume, timeout=(2, 60))
+    except Exception as e:
+        backend_errors.inc(server, "shell_stream")
+        return jsonify({"error": str(e)}), 500
+    if res.status_code != 200:
+        body = res.content
+        res.close()
+        return (body, res.status_code, {"Content-Type": "application/json"})
+
+    def relay():
+        try:
+            for chunk in res.iter_content(chunk_size=None):
+                yield chunk
+        finally:
+            res.close()
+
+    return Response(stream_with_context(relay()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.route("/shell_close", methods=["POST"])
 def shell_close():
     """Close an active shell session."""
     data = request.get_json(force=True)
-    server = data.get("server")
+    server = lb.session_server(data)
     session_id = data.get("session_id")
     
     if not server or not session_id:
         return jsonify({"error": "Missing server or session_id"}), 400
     
     try:
-        res = requests.post(f"{server}/shell_close/{session_id}", timeout=15)
+        res = lb.forward("POST", server, f"/shell_close/{session_id}", timeout=15)
+        lb.session_servers.pop(session_id, None)
         return jsonify(res.json()), res.status_code
+    except CircuitOpen as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/images", methods=["GET"])
+def list_images():
+    """Catalog image state and pull progress of every node: {server: {"images"} or "Error: ..."}."""
+    return respond(lb.list_images())
+
+
+@app.route("/sessions", methods=["GET"])
+def list_sessions():
+    """Shell sessions of every node, fetched in parallel: {server: {"sessions", "limits"} or "Error: ..."}."""
+    return respond(lb.list_sessions())
+
+
+@app.route("/snapshot_vm", methods=["POST"])
+def snapshot_vm():
+    """Snapshot a VM on its node: {"name", "owner"?} -> snapshot metadata plus "server"."""
+    return respond(lb.snapshot_vm(request.get_json(force=True)))
+
+
+@app.route("/snapshots", methods=["GET"])
+def list_snapshots():
+    """Snapshots on every node (`?owner=` filters): {server: {"snapshots", "limits"} or "Error: ..."}."""
+    return respond(lb.list_snapshots(request.args.get("owner")))
+
+
+@app.route("/snapshots/<snapshot_id>", methods=["DELETE"])
+def delete_snapshot(snapshot_id):
+    """Delete a snapshot on the node holding it."""
+    return respond(lb.delete_snapshot(snapshot_id))
+
+
+@app.route("/clone_vm", methods=["POST"])
+def clone_vm():
+    """Stamp out VMs from a snapshot: {"snapshot_id", "names", "size"?} -> {"results": [...]}.
+
+    Clones always go to the node holding the snapshot, which already has
+    its layers; a draining or departed holder gets a 503.
+    """
+    names = batch_request()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    return respond(lb.clone_vm(names, request.get_json(force=True)))
+
+
+@app.route("/migrate_vm", methods=["POST"])
+def migrate_vm():
+    """Move a VM to another node: {"name", "target" (optional)}; see Balancer.migrate."""
+    data = request.get_json(force=True)
+    if not data.get("name"):
+        return jsonify({"error": "Missing name"}), 400
+    return respond(lb.migrate(data["name"], data.get("target")))
+
+
+@app.route("/drain_node", methods=["POST"])
+def drain_node():
+    """Stop (or resume) new placements on a node: {"url", "drain": true, "evacuate": false}.
+
+    With "evacuate" its VMs are also migrated away in the background.
+    """
+    data = request.get_json(force=True)
+    url, draining = data.get("url"), data.get("drain", True)
+    if not lb.scheduler.drain(url, draining):
+        return jsonify({"error": "Unknown node"}), 404
+    print(f"[LB] Node {url} {'draining' if draining else 'accepting VMs again'}")
+    if draining and data.get("evacuate"):
+        lb.spawn(lb.evacuate(url))
+    return jsonify({"url": url, "draining": draining, "evacuating": bool(draining and data.get("evacuate"))})
+
+
+@app.route("/register_node", methods=["POST"])
+def register_node():
+    """A node announces itself: {"url": ..., "stats": {...}}."""
+    data = request.get_json(force=True)
+    url = data.get("url")
+    if not url:
+        return jsonify({"error": "Missing url"}), 400
+    lb.membership.register(url, data.get("stats"))
+    lb.scheduler.update_stats(url, data.get("stats") or {})
+    return jsonify({"status": "registered", "url": url})
+
+
+@app.route("/heartbeat", methods=["POST"])
+def heartbeat():
+    """Liveness and load report from a registered node; 404 means register again."""
+    data = request.get_json(force=True)
+    url = data.get("url")
+    if not lb.membership.heartbeat(url, data.get("stats")):
+        return jsonify({"error": "Unknown node, register first"}), 404
+    if data.get("stats"):
+        lb.scheduler.update_stats(url, data["stats"])
+    return jsonify({"status": "ok"})
+
+
+@app.route("/nodes", methods=["GET"])
+def list_nodes():
+    """Return the live membership table (plus each node's drain flag and health)."""
+    backends = lb.scheduler.snapshot()["backends"]
+    return jsonify({url: dict(m, draining=backends.get(url, {}).get("draining", False),
+                              health=backends.get(url, {}).get("health", "healthy"))
+                    for url, m in lb.membership.snapshot().items()})
+
+
+@app.route("/placements", methods=["GET"])
+def list_placements():
+    """Return the VM name -> server placement table."""
+    return jsonify(lb.placements.snapshot())
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Report the scheduler's view of every backend (plus migrations awaiting activation)."""
+    return jsonify(lb.stats())
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000)
+    parser = argparse.ArgumentParser(description="Start the load balancer.")
+    parser.add_argument("--port", type=int, default=8000,
+                        help="Port number to run the load balancer on (default: 8000)")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="round-robin",
+                        help="Backend selection strategy (default: round-robin)")
+    parser.add_argument("--suspect-after", type=float, default=6.0,
+                        help="Seconds without a heartbeat before a node gets no new work (default: 6)")
+    parser.add_argument("--remove-after", type=float, default=15.0,
+                        help="Seconds without a heartbeat before a node is dropped (default: 15)")
+    parser.add_argument("--list-timeout", type=float, default=3.0,
+                        help="Per-node deadline in seconds for /list_all fan-out (default: 3)")
+    parser.add_argument("--placement-file", default="placements.json",
+                        help="File the VM placement registry is persisted to (default: placements.json)")
+    parser.add_argument("--engine", choices=["threaded", "async"], default="threaded",
+                        help="threaded: Flask server (default); async: asyncio proxy for high concurrency")
+    parser.add_argument("--backend-limit", type=int, default=256,
+                        help="async engine: max concurrent requests per backend node (default: 256)")
+    parser.add_argument("--backend-queue", type=int, default=1024,
+                        help="async engine: requests that may wait per backend before 503s (default: 1024)")
+    parser.add_argument("--rebalance-interval", type=float, default=0,
+                        help="Seconds between rebalancing rounds that migrate one VM off the hottest node "
+                             "(default: 0, disabled)")
+    parser.add_argument("--rebalance-threshold", type=float, default=0.25,
+                        help="Load gap (fraction of capacity) between hottest and coolest node that "
+                             "triggers a migration (default: 0.25)")
+    parser.add_argument("--breaker-failure-rate", type=float, default=0.5,
+                        help="Failure rate over a node's recent calls that opens its circuit (default: 0.5)")
+    parser.add_argument("--breaker-min-calls", type=int, default=5,
+                        help="Calls a node's breaker needs to see before it may open (default: 5)")
+    parser.add_argument("--breaker-open-for", type=float, default=5.0,
+                        help="Seconds an open circuit fails fast before a half-open probe (default: 5)")
+    parser.add_argument("--eject-slow-factor", type=float, default=3.0,
+                        help="Eject a node whose latency for an operation is this many times the "
+                             "other nodes' median (default: 3)")
+    parser.add_argument("--eject-for", type=float, default=10.0,
+                        help="Seconds a slow node stays ejected, multiplied on repeats (default: 10)")
+    parser.add_argument("--retry-budget", type=float, default=3.0,
+                        help="Seconds within which a refused or unreachable create moves to another node "
+                             "(default: 3)")
+    args = parser.parse_args()
+
+    health = HealthTable({"failure_rate": args.breaker_failure_rate, "min_calls": args.breaker_min_calls,
+                          "open_for": args.breaker_open_for},
+                         slow_factor=args.eject_slow_factor, eject_for=args.eject_for)
+    scheduler = Scheduler(strategy=args.strategy, health=health)
+    placements = PlacementRegistry(args.placement_file)
+    if args.engine == "async":
+        import async_load_balancer  # needs aiohttp
+        async_load_balancer.run(scheduler, placements, args)
+    else:
+        lb = ThreadedBalancer(scheduler, placements, args.list_timeout, args.suspect_after, args.remove_after,
+                              args.retry_budget)
+        threading.Thread(target=watch_membership, daemon=True).start()
+        if args.rebalance_interval > 0:
+            lb.spawn(lb.rebalance(args.rebalance_interval, args.rebalance_threshold))
 
+        print(f"[+] Starting load balancer on port {args.port} (strategy: {args.strategy})")
+        app.run(host="0.0.0.0", port=args.port)
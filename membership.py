@@ -0,0 +1,112 @@
+"""
+Live membership table of server nodes for the load balancer.
+
+Nodes register themselves at startup (POST /register_node) and then send a
+heartbeat carrying their load every few seconds (POST /heartbeat). A node
+whose heartbeats stop is first marked "suspect" (no new work is sent to
+it) and, if it stays silent, removed. A heartbeat from a node the table
+does not know (e.g. after a load balancer restart) is refused so the node
+registers again.
+
+State changes are reported through `on_change(url, state)`, called outside
+the table's lock, with state one of "alive", "suspect" or "removed".
+"""
+
+import threading
+import time
+
+
+class Member:
+    def __init__(self, url, now):
+        self.url = url
+        self.state = "alive"
+        self.registered_at = now
+        self.last_seen = now
+        self.heartbeats = 0
+        self.stats = {}
+
+    def to_dict(self, now):
+        return {
+            "state": self.state,
+            "registered_at": self.registered_at,
+            "last_seen_ago": round(now - self.last_seen, 3),
+            "heartbeats": self.heartbeats,
+            "stats": self.stats,
+        }
+
+
+class Membership:
+    """Thread-safe node table with heartbeat-based failure detection."""
+
+    def __init__(self, suspect_after=6.0, remove_after=15.0, on_change=None):
+        self.suspect_after = suspect_after
+        self.remove_after = remove_after
+        self.on_change = on_change or (lambda url, state: None)
+        self.members = {}
+        self.lock = threading.Lock()
+
+    def _notify(self, changes):
+        for url, state in changes:
+            self.on_change(url, state)
+
+    def register(self, url, stats=None, now=None):
+        """Add (or revive) a node. Returns True if it was not already alive."""
+        now = time.time() if now is None else now
+        with self.lock:
+            m = self.members.get(url)
+            changed = m is None or m.state != "alive"
+            if m is None:
+                m = self.members[url] = Member(url, now)
+            m.state, m.last_seen = "alive", now
+            m.stats = stats or m.stats
+        if changed:
+            self._notify([(url, "alive")])
+        return changed
+
+    def heartbeat(self, url, stats=None, now=None):
+        """Record a heartbeat. Returns False for unknown nodes, which must register first."""
+        now = time.time() if now is None else now
+        with self.lock:
+            m = self.members.get(url)
+            if m is None:
+                return False
+            revived = m.state != "alive"
+            m.state, m.last_seen = "alive", now
+            m.heartbeats += 1
+            if stats is not None:
+                m.stats = stats
+        if revived:
+            self._notify([(url, "alive")])
+        return True
+
+    def remove(self, url):
+        with self.lock:
+            found = self.members.pop(url, None) is not None
+        if found:
+            self._notify([(url, "removed")])
+        return found
+
+    def check(self, now=None):
+        """Apply failure detection; returns the [(url, state)] changes made."""
+        now = time.time() if now is None else now
+        changes = []
+        with self.lock:
+            for url, m in list(self.members.items()):
+                silent = now - m.last_seen
+                if silent >= self.remove_after:
+                    del self.members[url]
+                    changes.append((url, "removed"))
+                elif silent >= self.suspect_after and m.state == "alive":
+                    m.state = "suspect"
+                    changes.append((url, "suspect"))
+        self._notify(changes)
+        return changes
+
+    def alive(self):
+        with self.lock:
+            return [url for url, m in self.members.items() if m.state == "alive"]
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            return {url: m.to_dict(now) for url, m in self.members.items()}
@@ -0,0 +1,195 @@
+"""
+Minimal Prometheus-style metrics shared by all MiniCloud services.
+
+Each service process keeps its metrics in the module-level REGISTRY and
+serves them in Prometheus text format at GET /metrics (see instrument()).
+
+Recording is cheap enough to leave on under load: a dict lookup, a
+bisect over a handful of bucket bounds and a few additions under a
+per-metric lock.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# latency buckets in seconds (1 ms .. 30 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, v in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Context manager that observes the elapsed wall time of its block."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted((k, list(v)) for k, v in self.series.items())
+        for labels, s in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), s[:-1]):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {s[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A value read from a callback at scrape time.
+
+    With `labels`, the callback returns {label_values_tuple: value}.
+    """
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name, self.help, self.fn, self.label_names = name, help, fn, tuple(labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if not self.label_names:
+            return lines + [f"{self.name} {self.fn()}"]
+        for labels, v in sorted(self.fn().items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {v}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, metric):
+        # re-registering returns the existing metric (module reloads, tests)
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labels=()):
+    return REGISTRY.add(Counter(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.add(Histogram(name, help, labels, buckets))
+
+
+def gauge(name, help, fn, labels=()):
+    return REGISTRY.add(Gauge(name, help, fn, labels))
+
+
+LOCK_WAIT = histogram("minicloud_lock_wait_seconds", "Time spent waiting to acquire a lock", ["lock"])
+LOCK_HOLD = histogram("minicloud_lock_hold_seconds", "Time a lock was held", ["lock"])
+HTTP_REQUESTS = counter("minicloud_http_requests_total", "HTTP requests handled",
+                        ["service", "route", "method", "status"])
+HTTP_LATENCY = histogram("minicloud_http_request_seconds", "HTTP request latency",
+                         ["service", "route", "method"])
+
+
+class InstrumentedLock:
+    """Drop-in threading.Lock that records wait and hold times."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._held_since = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        t0 = time.perf_counter()
+        ok = self._lock.acquire(blocking, timeout)
+        if ok:
+            self._held_since = time.perf_counter()
+            LOCK_WAIT.observe(self._held_since - t0, self.name)
+        return ok
+
+    def release(self):
+        held = time.perf_counter() - self._held_since
+        self._lock.release()
+        LOCK_HOLD.observe(held, self.name)
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def instrument(app, service):
+    """Record per-route request counts and latency for a Flask app and serve GET /metrics."""
+    from flask import g, request, Response  # only the Flask services need this
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        t0 = g.pop("metrics_t0", None)
+        if t0 is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - t0, service, route, request.method)
+            HTTP_REQUESTS.inc(service, route, request.method, str(response.status_code))
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,170 @@
+"""
+VM placement registry for the load balancer.
+
+Maps each VM name to the server node that hosts it, so name-based routes
+(delete, shutdown, exec, shell) can find the owner without asking every
+node. The table is topped up from each node's own listing whenever the
+node (re)joins.
+
+It is persisted as an append-only journal, one JSON line per change
+(["set", {name: server}] or ["del", [names]]), so a create or delete
+costs one short write instead of re-serialising the whole table. Each
+line is flushed as it is written, so a crashed LB loses nothing. Once the
+journal holds more lines than both `compact_every` and the table's size,
+it is compacted: the table is written as a single line to a temporary
+file, fsynced and renamed over the journal, so the file is never
+half-written. The older format (a plain {name: server} object) is read
+and converted on startup. Unreadable lines are skipped and reported, and
+the damaged file is kept next to the journal as `<name>.corrupt`.
+
+With `path=None` the table lives in memory only: nothing is read or written.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+
+class PlacementRegistry:
+    """Thread-safe, journal-backed name -> server mapping."""
+
+    def __init__(self, path="placements.json", compact_every=1000):
+        self.path = None if path is None else Path(path)
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.placements = {}
+        self.journal = None
+        self.journal_lines = 0
+        if self.path is not None and self.path.exists():
+            self._load()
+            with self.lock:
+                self._compact()  # start from one clean line (also converts the old format)
+
+    def _load(self):
+        try:
+            text = self.path.read_text()
+        except OSError as e:
+            print(f"[LB-ERR] Cannot read placement file {self.path}: {e}")
+            return
+        try:
+            legacy = json.loads(text)
+        except ValueError:
+            legacy = None
+        if isinstance(legacy, dict):
+            self.placements = legacy
+            return
+        bad = 0
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                op, arg = json.loads(line)
+                if op == "set":
+                    self.placements.update(arg)
+                elif op == "del":
+                    for name in arg:
+                        self.placements.pop(name, None)
+                else:
+                    raise ValueError(f"unknown op {op!r}")
+            except (ValueError, TypeError, AttributeError):
+                bad += 1
+        if bad:
+            kept = self.path.with_name(self.path.name + ".corrupt")
+            shutil.copyfile(self.path, kept)
+            print(f"[LB-ERR] Placement file {self.path}: skipped {bad} unreadable line(s), "
+                  f"{len(self.placements)} placements recovered; the original is kept as {kept}")
+
+    def _compact(self):
+        """Rewrite the journal as one line holding the whole table (caller holds the lock)."""
+        if self.journal is not None:
+            self.journal.close()
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent or ".", prefix=".placements-")
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(["set", self.placements]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        try:
+            dir_fd = os.open(self.path.parent or ".", os.O_RDONLY)
+        except OSError:
+            dir_fd = None  # e.g. platforms that can't open directories
+        if dir_fd is not None:
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self.journal = open(self.path, "a")
+        self.journal_lines = 1
+
+    def _append(self, op, arg):
+        """Journal one change (caller holds the lock)."""
+        if self.path is None:
+            return
+        if self.journal is None:
+            self._compact()  # first change to a new file
+        self.journal.write(json.dumps([op, arg]) + "\n")
+        self.journal.flush()
+        self.journal_lines += 1
+        if self.journal_lines > max(self.compact_every, len(self.placements)):
+            self._compact()
+
+    def get(self, name):
+        return self.placements.get(name)
+
+    def __contains__(self, name):
+        return name in self.placements
+
+    def set(self, name, server):
+        with self.lock:
+            self.placements[name] = server
+            self._append("set", {name: server})
+
+    def set_many(self, mapping):
+        """Record several placements with a single journal line."""
+        if not mapping:
+            return
+        with self.lock:
+            self.placements.update(mapping)
+            self._append("set", dict(mapping))
+
+    def remove_many(self, names):
+        """Forget several placements with a single journal line."""
+        with self.lock:
+            removed = [n for n in names if self.placements.pop(n, None) is not None]
+            if removed:
+                self._append("del", removed)
+            return removed
+
+    def remove(self, name):
+        with self.lock:
+            server = self.placements.pop(name, None)
+            if server is not None:
+                self._append("del", [name])
+            return server
+
+    def merge(self, listings):
+        """Record every name in `listings` ({server: [names]}) on its server.
+
+        Entries not listed are kept: a create in flight is placed before it
+        shows up in its node's listing. Stale ones go when the node answers
+        404 for them.
+        """
+        with self.lock:
+            changed = {name: server for server, names in listings.items() for name in names
+                       if self.placements.get(name) != server}
+            if changed:
+                self.placements.update(changed)
+                self._append("set", changed)
+
+    def close(self):
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.placements)
@@ -0,0 +1,47 @@
+"""
+Rebalancing decisions for the load balancer.
+
+A node's load is its fullest resource: max(allocated / capacity) over the
+resources in sizes.py. When the most and least loaded nodes differ by more
+than `threshold`, plan_move() proposes moving one VM from the hottest node
+to the coolest, choosing the VM that best lowers the pair's peak load.
+Draining nodes and nodes that have not reported capacity are left alone.
+One move per call keeps migrations gradual and lets fresh load reports
+confirm each step.
+"""
+
+import sizes
+
+
+def node_load(capacity, allocated):
+    return max(allocated.get(k, 0) / capacity[k] for k in sizes.RESOURCES if capacity.get(k))
+
+
+def plan_move(nodes, vms, threshold):
+    """Pick one migration as (name, source, target), or None if the cluster is balanced.
+
+    `nodes` maps url -> {"capacity", "allocated", "draining"}; `vms` maps
+    url -> [(name, size), ...] of that node's VMs.
+    """
+    loads = {url: node_load(n["capacity"], n["allocated"])
+             for url, n in nodes.items() if n.get("capacity") and not n.get("draining")}
+    if len(loads) < 2:
+        return None
+    source = max(loads, key=loads.get)
+    target = min(loads, key=loads.get)
+    if loads[source] - loads[target] <= threshold:
+        return None
+
+    best = None
+    for name, size in vms.get(source, ()):
+        need = sizes.resources(size)
+        if not sizes.fits(nodes[target]["capacity"], nodes[target]["allocated"], need):
+            continue
+        after_source = node_load(nodes[source]["capacity"],
+                                 {k: nodes[source]["allocated"].get(k, 0) - need[k] for k in sizes.RESOURCES})
+        after_target = node_load(nodes[target]["capacity"],
+                                 {k: nodes[target]["allocated"].get(k, 0) + need[k] for k in sizes.RESOURCES})
+        peak = max(after_source, after_target)
+        if peak < loads[source] and (best is None or peak < best[0]):
+            best = (peak, name)
+    return None if best is None else (best[1], source, target)
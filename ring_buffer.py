@@ -0,0 +1,141 @@
+"""
+Bounded ring buffers addressed by monotonic offsets.
+
+ByteRing holds the most recent `capacity` bytes of a stream (e.g. a shell
+session's output). Every byte ever written has an absolute offset, so a
+reader asks for "everything since offset N" and gets exactly the new bytes
+plus the cursor to use next time. Readers that fall more than `capacity`
+bytes behind are told how much they missed.
+
+LogRing is the line-oriented equivalent (e.g. the admin log): the last
+`capacity` lines, each with a sequence number readers resume from.
+"""
+
+import threading
+from collections import deque
+from itertools import islice
+
+
+def complete_utf8(data):
+    """Return the length of the longest prefix of `data` that ends on a UTF-8 character boundary."""
+    # look back at most 3 bytes for the lead byte of an unfinished sequence
+    for i in range(1, min(4, len(data)) + 1):
+        b = data[-i]
+        if b & 0xC0 == 0x80:
+            continue  # continuation byte, keep looking
+        if b & 0x80 == 0:
+            return len(data)  # ASCII
+        need = 2 if b & 0xE0 == 0xC0 else 3 if b & 0xF0 == 0xE0 else 4
+        return len(data) if i >= need else len(data) - i
+    return len(data)
+
+
+class ByteRing:
+    """Fixed-size circular byte buffer with absolute read offsets."""
+
+    def __init__(self, capacity=64 * 1024):
+        self.capacity = capacity
+        self.buf = bytearray(capacity)
+        self.end = 0  # offset one past the last byte written
+        self.closed = False
+        self.cond = threading.Condition()
+
+    @property
+    def start(self):
+        """Offset of the oldest byte still held."""
+        return max(0, self.end - self.capacity)
+
+    def write(self, data):
+        if not data:
+            return
+        with self.cond:
+            if len(data) > self.capacity:
+                # only the tail can survive; account for the rest as written
+                self.end += len(data) - self.capacity
+                data = data[-self.capacity:]
+            pos = self.end % self.capacity
+            first = min(len(data), self.capacity - pos)
+            self.buf[pos:pos + first] = data[:first]
+            self.buf[:len(data) - first] = data[first:]
+            self.end += len(data)
+            self.cond.notify_all()
+
+    def read(self, since=0, max_bytes=None):
+        """Return (data, next_offset, dropped) for bytes written at or after `since`.
+
+        `dropped` is how many requested bytes were already overwritten.
+        """
+        with self.cond:
+            since = min(max(since, 0), self.end)
+            dropped = max(0, self.start - since)
+            since += dropped
+            stop = self.end if max_bytes is None else min(self.end, since + max_bytes)
+            a, b = since % self.capacity, stop % self.capacity
+            if stop - since == 0:
+                data = b""
+            elif a < b:
+                data = bytes(self.buf[a:b])
+            else:
+                data = bytes(self.buf[a:]) + bytes(self.buf[:b])
+            return data, stop, dropped
+
+    def wait(self, since, timeout=None):
+        """Block until data past `since` exists or the ring is closed. Returns True if there is data."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.end > since or self.closed, timeout)
+            return self.end > since
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class LogRing:
+    """Bounded log of lines, each tagged with a monotonically increasing sequence number."""
+
+    def __init__(self, capacity=5000):
+        self.entries = deque(maxlen=capacity)  # (seq, line)
+        self.next_seq = 1
+        self.cond = threading.Condition()
+
+    def append(self, line):
+        with self.cond:
+            seq = self.next_seq
+            self.entries.append((seq, line))
+            self.next_seq += 1
+            self.cond.notify_all()
+            return seq
+
+    def since(self, seq=0, limit=None):
+        """Return (entries, cursor) for entries with sequence number > `seq`, oldest first.
+
+        `cursor` is the seq to pass next time. With `limit`, only the oldest
+        `limit` of the new entries are returned and the cursor stops at the
+        last of them, so a burst is read in pages rather than skipped.
+        """
+        with self.cond:
+            last = self.next_seq - 1
+            # sequence numbers are contiguous, so the count is pure arithmetic;
+            # walking from the newest end keeps this O(new entries)
+            count = min(len(self.entries), max(0, last - seq))
+            entries = list(islice(reversed(self.entries), count))[::-1]
+        if limit is not None and len(entries) > limit:
+            entries = entries[:limit]
+            return entries, entries[-1][0] if entries else seq
+        return entries, last
+
+    def tail(self, n=100):
+        """Return (entries, cursor) for the newest `n` entries; the cursor is the latest seq."""
+        with self.cond:
+            last = self.next_seq - 1
+            return list(islice(reversed(self.entries), min(n, len(self.entries))))[::-1], last
+
+    def recent(self, n=100):
+        """Return the last `n` lines."""
+        return [line for _, line in self.tail(n)[0]]
+
+    def wait(self, seq, timeout=None):
+        """Block until an entry newer than `seq` exists. Returns True if there is one."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.next_seq - 1 > seq, timeout)
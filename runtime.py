@@ -0,0 +1,360 @@
+"""
+Container runtimes for server nodes.
+
+A runtime is the only thing a node talks to about containers:
+
+    run(name, labels, resources, image)
+                               -> container handle (.name .id .short_id .status .labels);
+                                  resources = {"cpu_shares", "memory_mb", "pids"} limits (sizes.py),
+                                  image = an image ref that is already local (default: alpine);
+                                  run never pulls
+    list(label=None)           -> handles for all containers, optionally filtered by "key=value"
+    rename(c, name), stop(c), remove(c, force=False)
+    exec_stream(c, cmd)        -> (iterator of output bytes, exit_code() callable)
+    exec_socket(c, cmd)        -> socket-like object (recv / sendall / close) attached to a TTY
+    events(since, actions)     -> iterator of {"action", "id", "name", "time"} dicts, blocking
+    has_image(ref)             -> True if the image is local
+    pull(ref)                  -> iterator of {"layer", "current", "total"} progress dicts, blocking
+    commit(c)                  -> "repository:tag" of an image of the container's current filesystem
+    save_image(ref)            -> iterator of bytes (an archive load_image accepts, on any node)
+    load_image(chunks)         -> image ref
+    remove_image(ref, force=False) -- force untags an image still used by containers
+
+DockerRuntime wraps the Docker SDK. SimRuntime keeps containers in memory,
+with configurable per-call latency and failure injection, so scheduling
+and concurrency work can be exercised and benchmarked without Docker.
+
+Pick one with get_runtime(name) or the MINICLOUD_RUNTIME environment variable.
+"""
+
+import itertools
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+DEFAULT_DOCKER_URL = os.environ.get("MINICLOUD_DOCKER_URL",
+                                    "unix:///home/testuser/.docker/desktop/docker.sock")
+IMAGE = "alpine:latest"
+COMMIT_REPOSITORY = "minicloud-commit"
+
+
+class DockerRuntime:
+    name = "docker"
+
+    def __init__(self, base_url=DEFAULT_DOCKER_URL):
+        import docker  # only needed for this backend
+        self.client = docker.DockerClient(base_url=base_url)
+
+    def run(self, name, labels=None, resources=None, image=None):
+        limits = {}
+        if resources:
+            limits = {"cpu_shares": resources["cpu_shares"],
+                      "mem_limit": f"{resources['memory_mb']}m",
+                      "memswap_limit": f"{resources['memory_mb']}m",  # no swap beyond the limit
+                      "pids_limit": resources["pids"]}
+        # create + start rather than containers.run, which would pull a missing image inline
+        container = self.client.containers.create(
+            image or IMAGE,
+            name=name,
+            command="sleep infinity",
+            detach=True,
+            tty=True,
+            labels=labels or {},
+            **limits
+        )
+        container.start()
+        return container
+
+    def list(self, label=None):
+        filters = {"label": label} if label else None
+        return self.client.containers.list(all=True, filters=filters)
+
+    def rename(self, container, name):
+        container.rename(name)
+
+    def stop(self, container):
+        container.stop()
+
+    def remove(self, container, force=False):
+        container.remove(force=force)
+
+    def exec_stream(self, container, cmd):
+        # low-level API: exec_run(stream=True) cannot report the exit code
+        exec_id = self.client.api.exec_create(container.id, cmd, stdout=True, stderr=True, tty=False)["Id"]
+        output = self.client.api.exec_start(exec_id, stream=True)
+        return output, lambda: self.client.api.exec_inspect(exec_id).get("ExitCode")
+
+    def exec_socket(self, container, cmd="/bin/sh"):
+        exec_id = self.client.api.exec_create(
+            container.id, cmd, stdin=True, stdout=True, stderr=True, tty=True
+        )["Id"]
+        return self.client.api.exec_start(exec_id, socket=True, tty=True)._sock
+
+    def has_image(self, ref):
+        import docker.errors
+        try:
+            self.client.images.get(ref)
+            return True
+        except docker.errors.ImageNotFound:
+            return False
+
+    def pull(self, ref):
+        repository, _, tag = ref.partition(":")
+        for event in self.client.api.pull(repository, tag=tag or "latest", stream=True, decode=True):
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            detail = event.get("progressDetail") or {}
+            if event.get("id") and detail.get("total"):
+                yield {"layer": event["id"], "current": detail.get("current", 0), "total": detail["total"]}
+
+    def commit(self, container):
+        # the repository:tag, not the image ID: removing the tag works while clones still use the image
+        tag = uuid.uuid4().hex[:12]
+        container.commit(repository=COMMIT_REPOSITORY, tag=tag)
+        return f"{COMMIT_REPOSITORY}:{tag}"
+
+    def save_image(self, ref):
+        return self.client.images.get(ref).save(named=True)
+
+    def load_image(self, chunks):
+        # the archive is streamed straight into the daemon (chunked upload)
+        return self.client.images.load(chunks)[0].id
+
+    def remove_image(self, ref, force=False):
+        self.client.images.remove(ref, force=force)
+
+    def events(self, since=None, actions=None):
+        filters = {"type": "container"}
+        if actions:
+            filters["event"] = list(actions)
+        for event in self.client.events(decode=True, since=since, filters=filters):
+            yield {
+                "action": event.get("Action") or event.get("status"),
+                "id": event.get("Actor", {}).get("ID") or event.get("id"),
+                "name": event.get("Actor", {}).get("Attributes", {}).get("name"),
+                "time": event.get("time"),
+            }
+
+
+class SimContainer:
+    def __init__(self, name, labels, resources=None, image=IMAGE):
+        self.id = uuid.uuid4().hex
+        self.short_id = self.id[:10]
+        self.name = name
+        self.labels = dict(labels or {})
+        self.resources = resources
+        self.image = image
+        self.status = "running"
+
+
+class SimRuntime:
+    """In-memory runtime with simulated latency and failures.
+
+    `latency` scales the per-call base latencies in LATENCY (0 = instant);
+    each call sleeps base * latency * uniform(0.5, 1.5). `failure_rate` is
+    the probability that a mutating call raises instead of taking effect.
+    """
+
+    name = "sim"
+    LATENCY = {"run": 0.3, "rename": 0.01, "stop": 0.2, "remove": 0.05, "exec": 0.02, "list": 0.01,
+               "commit": 0.5, "save": 0.2, "load": 0.3, "pull": 2.0}
+    PULL_LAYERS = (3, 8 * 1024 * 1024)  # layers per simulated image, bytes per layer
+    HISTORY = 10000  # events kept for `since` replays
+
+    def __init__(self, latency=1.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.containers = {}  # id -> SimContainer
+        self.images = {IMAGE: {"from": None}}  # ref -> metadata
+        self.lock = threading.Lock()
+        self.history = []  # (seq, event)
+        self.seq = itertools.count(1)
+        self.cond = threading.Condition()
+
+    def _call(self, op, mutating=True):
+        with self.lock:
+            jitter = self.rng.uniform(0.5, 1.5)
+            fail = mutating and self.rng.random() < self.failure_rate
+        delay = self.LATENCY[op] * self.latency * jitter
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise RuntimeError(f"simulated {op} failure")
+
+    def _emit(self, action, c):
+        with self.cond:
+            self.history.append((next(self.seq), {"action": action, "id": c.id, "name": c.name,
+                                                  "time": time.time()}))
+            del self.history[:-self.HISTORY]
+            self.cond.notify_all()
+
+    def _get(self, container):
+        c = self.containers.get(container.id)
+        if c is None:
+            raise RuntimeError(f"No such container: {container.name}")
+        return c
+
+    def run(self, name, labels=None, resources=None, image=None):
+        self._call("run")
+        with self.lock:
+            if any(c.name == name for c in self.containers.values()):
+                raise RuntimeError(f"Conflict: container name {name} is already in use")
+            if (image or IMAGE) not in self.images:
+                raise RuntimeError(f"No such image: {image}")
+            c = SimContainer(name, labels, resources, image or IMAGE)
+            self.containers[c.id] = c
+        self._emit("start", c)
+        return c
+
+    def list(self, label=None):
+        self._call("list", mutating=False)
+        key, _, value = (label or "").partition("=")
+        with self.lock:
+            return [c for c in self.containers.values()
+                    if not label or (key in c.labels and (not value or c.labels[key] == value))]
+
+    def rename(self, container, name):
+        self._call("rename")
+        with self.lock:
+            if any(c.name == name for c in self.containers.values()):
+                raise RuntimeError(f"Conflict: container name {name} is already in use")
+            self._get(container).name = name
+
+    def stop(self, container):
+        self._call("stop")
+        with self.lock:
+            c = self._get(container)
+            was_running, c.status = c.status == "running", "exited"
+        if was_running:
+            self._emit("die", c)
+            self._emit("stop", c)
+
+    def remove(self, container, force=False):
+        self._call("remove")
+        with self.lock:
+            c = self._get(container)
+            if c.status == "running" and not force:
+                raise RuntimeError(f"Conflict: container {c.name} is running")
+            del self.containers[c.id]
+        if c.status == "running":
+            self._emit("die", c)
+        self._emit("destroy", c)
+
+    def exec_stream(self, container, cmd):
+        """Only `echo ...` produces output; every command exits 0."""
+        self._call("exec")
+        self._get(container)
+        text = cmd if isinstance(cmd, str) else " ".join(cmd)
+        out = [text[5:].encode() + b"\n"] if text.startswith("echo ") else []
+        return iter(out), lambda: 0
+
+    def exec_socket(self, container, cmd="/bin/sh"):
+        """A socketpair whose far end echoes each input line back after a prompt."""
+        self._call("exec")
+        self._get(container)
+        ours, theirs = socket.socketpair()
+        threading.Thread(target=self._fake_shell, args=(theirs,), daemon=True).start()
+        return ours
+
+    @staticmethod
+    def _fake_shell(sock):
+        try:
+            sock.sendall(b"/ # ")
+            buf = b""
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                buf += chunk
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    sock.sendall(line + b"\r\n/ # ")
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+    def has_image(self, ref):
+        with self.lock:
+            return ref in self.images
+
+    def pull(self, ref):
+        """Simulated pull: each layer downloads in steps over LATENCY["pull"] (scaled) in total."""
+        layers, size = self.PULL_LAYERS
+        steps = 4
+        delay = self.LATENCY["pull"] * self.latency / (layers * steps)
+        with self.lock:
+            fail = self.rng.random() < self.failure_rate
+        for layer in range(layers):
+            for step in range(1, steps + 1):
+                if delay > 0:
+                    time.sleep(delay)
+                yield {"layer": f"layer{layer}", "current": size * step // steps, "total": size}
+        if fail:
+            raise RuntimeError(f"simulated pull failure for {ref}")
+        with self.lock:
+            self.images[ref] = {"from": None}
+
+    def commit(self, container):
+        self._call("commit")
+        with self.lock:
+            c = self._get(container)
+            ref = f"{COMMIT_REPOSITORY}:{uuid.uuid4().hex[:12]}"
+            self.images[ref] = {"from": c.name}
+        return ref
+
+    def save_image(self, ref):
+        self._call("save", mutating=False)
+        with self.lock:
+            if ref not in self.images:
+                raise RuntimeError(f"No such image: {ref}")
+            return iter([json.dumps(dict(self.images[ref], ref=ref)).encode()])
+
+    def load_image(self, chunks):
+        self._call("load")
+        meta = json.loads(b"".join(chunks))
+        ref = meta.pop("ref")
+        with self.lock:
+            self.images[ref] = meta
+        return ref
+
+    def remove_image(self, ref, force=False):
+        self._call("remove")
+        with self.lock:
+            if not force and any(c.image == ref for c in self.containers.values()):
+                raise RuntimeError(f"Conflict: image {ref} is in use")
+            self.images.pop(ref, None)
+
+    def events(self, since=None, actions=None):
+        with self.cond:
+            last = self.history[-1][0] if self.history else 0
+            seq = last if since is None else next((s - 1 for s, e in self.history if e["time"] > since), last)
+        # the start position is fixed now, not when iteration begins
+        return self._follow(seq, actions)
+
+    def _follow(self, seq, actions):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.history and self.history[-1][0] > seq)
+                # sequence numbers are contiguous, so index straight to the new tail
+                new = self.history[max(0, seq - self.history[0][0] + 1):]
+            for s, event in new:
+                seq = s
+                if not actions or event["action"] in actions:
+                    yield event
+
+
+RUNTIMES = {"docker": DockerRuntime, "sim": SimRuntime}
+
+
+def get_runtime(name=None, **options):
+    """Build the runtime called `name` (default: $MINICLOUD_RUNTIME, else docker)."""
+    name = name or os.environ.get("MINICLOUD_RUNTIME", "docker")
+    if name not in RUNTIMES:
+        raise ValueError(f"Unknown runtime {name!r} (choose from {', '.join(RUNTIMES)})")
+    return RUNTIMES[name](**options)
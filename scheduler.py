@@ -0,0 +1,262 @@
+"""
+Backend selection strategies for the load balancer.
+
+The load balancer keeps one Backend record per server node. It is fed from
+two places:
+ - the node's load reports (containers, shell sessions, capacity,
+   allocated resources and the catalog images it has locally), sent with
+   its heartbeats
+ - the load balancer's forwarding path (in-flight requests, latency,
+   failures), which also feeds each node's circuit breaker and outlier
+   detector (see health.py)
+
+Whatever the strategy, a VM only goes to a healthy node with room for its
+size (see sizes.py) that is not draining and already has its image (nodes
+never pull on the request path, see images.py); if there is none, pick()
+raises LookupError.
+
+A Strategy picks one backend from that table. Strategies:
+ - round-robin     the original itertools.cycle behaviour
+ - least-loaded    fewest containers + shell sessions
+ - least-requests  fewest in-flight requests from this load balancer
+ - ewma            lowest latency EWMA, weighted by in-flight requests
+ - best-fit        the node left with the least free capacity (packs nodes full)
+ - worst-fit       the node left with the most free capacity (spreads VMs out)
+"""
+
+import threading
+import time
+
+import sizes
+from health import HealthTable
+
+
+class Backend:
+    """Load and latency bookkeeping for one server node."""
+
+    def __init__(self, url):
+        self.url = url
+        self.containers = 0
+        self.sessions = 0
+        self.in_flight = 0
+        self.ewma_ms = None
+        self.stats_at = None
+        self.capacity = None  # unknown until the node reports it
+        self.allocated = {}
+        self.draining = False  # no new VMs while set
+        self.images = None  # catalog images ready on the node; unknown until reported
+
+    def has_image(self, image):
+        return self.images is None or image in self.images
+
+    def fits(self, need):
+        return self.capacity is None or sizes.fits(self.capacity, self.allocated, need)
+
+    def free_after(self, need):
+        return 1.0 if self.capacity is None else sizes.free_after(self.capacity, self.allocated, need)
+
+    @property
+    def load(self):
+        return self.containers + self.sessions
+
+    def to_dict(self):
+        return {
+            "containers": self.containers,
+            "shell_sessions": self.sessions,
+            "in_flight": self.in_flight,
+            "ewma_ms": round(self.ewma_ms, 3) if self.ewma_ms is not None else None,
+            "stats_age": round(time.time() - self.stats_at, 3) if self.stats_at else None,
+            "capacity": self.capacity,
+            "allocated": self.allocated,
+            "draining": self.draining,
+            "images": self.images,
+        }
+
+
+class Strategy:
+    """Base class: pick one of `backends` (a non-empty list of Backend with room for `need`)."""
+
+    name = None
+
+    def __init__(self):
+        self._turn = 0
+
+    def _rotate(self, backends):
+        # rotate the starting point so ties don't always go to the first node
+        self._turn += 1
+        k = self._turn % len(backends)
+        return backends[k:] + backends[:k]
+
+    def score(self, backend):
+        raise NotImplementedError
+
+    def pick(self, backends, need=None):
+        return min(self._rotate(backends), key=self.score)
+
+
+class RoundRobin(Strategy):
+    name = "round-robin"
+
+    def pick(self, backends, need=None):
+        return self._rotate(backends)[0]
+
+
+class LeastLoaded(Strategy):
+    name = "least-loaded"
+
+    def score(self, backend):
+        return backend.load
+
+
+class LeastInFlight(Strategy):
+    name = "least-requests"
+
+    def score(self, backend):
+        return backend.in_flight
+
+
+class LatencyEWMA(Strategy):
+    """Lowest expected wait: latency EWMA times the queue it would join."""
+
+    name = "ewma"
+
+    def score(self, backend):
+        # unmeasured backends score 0 so every node gets probed at least once
+        return (backend.ewma_ms or 0.0) * (backend.in_flight + 1)
+
+
+class BestFit(Strategy):
+    """Tightest fit: fill nodes up before touching emptier ones."""
+
+    name = "best-fit"
+
+    def pick(self, backends, need=None):
+        return min(self._rotate(backends), key=lambda b: b.free_after(need))
+
+
+class WorstFit(Strategy):
+    """Loosest fit: spread VMs so every node keeps headroom."""
+
+    name = "worst-fit"
+
+    def pick(self, backends, need=None):
+        return max(self._rotate(backends), key=lambda b: b.free_after(need))
+
+
+STRATEGIES = {cls.name: cls for cls in (RoundRobin, LeastLoaded, LeastInFlight, LatencyEWMA, BestFit, WorstFit)}
+
+
+class Scheduler:
+    """Thread-safe backend table plus the active selection strategy."""
+
+    def __init__(self, urls=(), strategy="round-robin", alpha=0.3, health=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy {strategy!r} (choose from {', '.join(STRATEGIES)})")
+        self.strategy = STRATEGIES[strategy]()
+        self.alpha = alpha
+        self.health = health or HealthTable()
+        self.backends = {url: Backend(url) for url in urls}
+        self.lock = threading.Lock()
+
+    @property
+    def urls(self):
+        return list(self.backends)
+
+    def add(self, url):
+        """Start scheduling onto `url` (no-op if it is already a backend)."""
+        with self.lock:
+            self.backends.setdefault(url, Backend(url))
+
+    def remove(self, url):
+        """Stop scheduling onto `url`."""
+        with self.lock:
+            self.backends.pop(url, None)
+        self.health.forget(url)
+
+    def drain(self, url, draining=True):
+        """Stop (or resume) placing new VMs on `url`. Returns False for unknown backends."""
+        with self.lock:
+            b = self.backends.get(url)
+            if b is None:
+                return False
+            b.draining = draining
+            return True
+
+    def pick(self, size=None, exclude=(), image=None):
+        """Choose a backend URL for a new VM of `size` running `image`, never one in `exclude`.
+
+        Raises LookupError if there are no backends or none has room for it
+        with the image ready (and ValueError for an unknown size).
+        """
+        need = sizes.resources(size)
+        with self.lock:
+            if not self.backends:
+                raise LookupError("No live backend nodes")
+            open_ = [b for b in self.backends.values() if not b.draining and b.url not in exclude]
+            if not open_:
+                raise LookupError("No node is accepting new VMs")
+            open_ = [b for b in open_ if self.health.available(b.url)]
+            if not open_:
+                raise LookupError("No healthy node (circuits open or nodes ejected)")
+            candidates = [b for b in open_ if b.fits(need)]
+            if not candidates:
+                raise LookupError(f"No node has capacity for a {size or sizes.DEFAULT_SIZE} VM")
+            if image is not None:
+                candidates = [b for b in candidates if b.has_image(image)]
+                if not candidates:
+                    raise LookupError(f"No node with capacity has the {image} image ready yet")
+            return self.strategy.pick(candidates, need).url
+
+    def placed(self, url, size=None):
+        """Count a VM placed on `url` until the node's next load report confirms it."""
+        need = sizes.resources(size)
+        with self.lock:
+            b = self.backends.get(url)
+            if b is not None:
+                b.containers += 1
+                b.allocated = {k: b.allocated.get(k, 0) + need[k] for k in sizes.RESOURCES}
+
+    def admit(self, url):
+        """Ask `url`'s circuit breaker whether a request may go out now (nodes not in the table always may)."""
+        with self.lock:
+            if url not in self.backends:
+                return True
+        return self.health.allow(url)
+
+    def start(self, url):
+        """Mark a request to `url` as in flight."""
+        with self.lock:
+            if url in self.backends:
+                self.backends[url].in_flight += 1
+
+    def finish(self, url, elapsed, ok=True, op=None):
+        """Mark a request to `url` as done, fold its latency into the EWMA and record its outcome."""
+        with self.lock:
+            b = self.backends.get(url)
+            if b is None:
+                return
+            b.in_flight = max(0, b.in_flight - 1)
+            ms = elapsed * 1000
+            b.ewma_ms = ms if b.ewma_ms is None else self.alpha * ms + (1 - self.alpha) * b.ewma_ms
+        self.health.record(url, ok, elapsed, op)
+
+    def update_stats(self, url, stats):
+        """Apply a `/stats` payload reported by a node."""
+        with self.lock:
+            b = self.backends.get(url)
+            if b is None:
+                return
+            b.containers = stats.get("containers", 0)
+            b.sessions = stats.get("shell_sessions", 0)
+            b.capacity = stats.get("capacity") or b.capacity
+            b.allocated = stats.get("allocated") or b.allocated
+            b.images = stats.get("images", b.images)
+            b.stats_at = time.time()
+
+    def snapshot(self):
+        with self.lock:
+            backends = {url: b.to_dict() for url, b in self.backends.items()}
+        health = self.health.snapshot()
+        for url, b in backends.items():
+            b["health"] = health.get(url, {}).get("state", "healthy")
+        return {"strategy": self.strategy.name, "backends": backends, "health": health}
@@ -3,90 +3,810 @@
 A lightweight server node that simulates a cloud VM host.
 Each node has:
  - a Flask API to handle VM/container creation requests
- - an internal scheduler that manages Docker containers
+ - an internal scheduler that manages containers via a pluggable runtime (runtime.py)
 """
 
 from flask import Flask, jsonify, request, Response
-import docker
 import threading
 import time
 import argparse
 import uuid
 import queue
 import subprocess
-import socket
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from ring_buffer import ByteRing, complete_utf8
+from warm_pool import WarmPool
+from exec_stream import trailer
+from runtime import get_runtime, RUNTIMES
+from versioned import VersionedListing
+from sessions import SessionTable
+from snapshots import SnapshotCache
+from images import ImagePuller
+import images
+import sizes
+import metrics
+import http_pool
 
 
 app = Flask(__name__)
-client = docker.DockerClient(base_url='unix:///home/testuser/.docker/desktop/docker.sock')
+metrics.instrument(app, "server_node")
+# Container runtime (Docker or the in-memory simulator); built in __main__
+runtime = None
 
 # Internal store
 containers = {}
-lock = threading.Lock()
+lock = metrics.InstrumentedLock("lock")
+
+# Names reserved by create jobs that are still running
+pending = set()
+
+# Size profile of every VM, created or pending (see sizes.py); a create is
+# refused when its size no longer fits in `capacity` (set in __main__)
+vm_sizes = {}
+capacity = sizes.host_capacity()
+SIZE_LABEL = "minicloud.size"
+
+# VMs migrating here: name -> container started under a temporary name, waiting
+# for the load balancer to activate (or abort) it; their names stay in `pending`
+staged = {}
+MIGRATE_TIMEOUT = 300  # seconds to pull a VM's image from its source node
+
+# Catalog image (images.CATALOG name) of every VM, created or pending; the
+# puller makes the catalog local in the background (built in __main__), and
+# a create whose image is not ready yet is refused rather than pulled inline
+vm_images = {}
+image_puller = None
+
+# Committed VM snapshots that clones start from (see snapshots.py; cap set in __main__)
+snapshot_cache = SnapshotCache()
+
+# Async create jobs: job_id -> job dict (see new_job)
+jobs = {}
+JOB_TTL = 600  # seconds a finished job stays queryable
+create_workers = ThreadPoolExecutor(max_workers=8, thread_name_prefix="create")
+
+# Bulk stop/remove calls; seconds a bulk create waits for its jobs
+batch_workers = ThreadPoolExecutor(max_workers=16, thread_name_prefix="batch")
+BATCH_WAIT = 120
+
+# Pre-started containers for fast creates (configured in __main__; None = disabled)
+warm_pool = None
+WARM_LABEL = "minicloud.warm"
+node_id = "5000"  # the node's port; tags its warm containers
+
+# Last known state of each container, kept current by the runtime event stream
+vm_status = {}
+# Versioned, pre-serialised view of containers + vm_status served by /list_vms;
+# change both only through track() / untrack() / set_status()
+listing = VersionedListing()
+WATCHED_EVENTS = ["start", "die", "stop", "destroy"]
+
+# Session store for interactive shells: capped per node and per user, idle ones
+# reaped (limits set in __main__)
+shell_lock = metrics.InstrumentedLock("shell_lock")
+shell_sessions = SessionTable(lock=shell_lock)
+
+# Seconds between SSE keep-alive comments on an idle shell stream
+STREAM_HEARTBEAT = 15
+# Output kept per shell session for readers that fall behind
+SHELL_BUFFER_BYTES = 256 * 1024
+
+runtime_latency = metrics.histogram("minicloud_runtime_call_seconds", "Container runtime call latency", ["call"])
+metrics.gauge("minicloud_shell_sessions", "Active interactive shell sessions", lambda: len(shell_sessions))
+
+
+def sse(data, event=None, event_id=None):
+    """Format one Server-Sent Events message (payload is JSON-encoded)."""
+    head = f"event: {event}\n" if event else ""
+    if event_id is not None:
+        head += f"id: {event_id}\n"
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+
+def pump_shell_output(session):
+    """Background reader: drain a session's exec socket into its ring buffer."""
+    sock = session["socket"]
+    ring = session["output"]
+    try:
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            ring.write(chunk)
+            session["bytes_out"] += len(chunk)
+    except OSError:
+        pass  # socket closed by /shell_close
+    finally:
+        ring.close()
+
+
+def close_session(session, reason):
+    """Release a session's exec socket and output buffer."""
+    print(f"[Shell] Closing session {session['session_id']} on {session['container_name']} ({reason})")
+    try:
+        session["socket"].close()
+    finally:
+        session["output"].close()
+
+
+def reap_sessions(interval):
+    """Background thread: close shell sessions no client has touched for the idle timeout."""
+    while True:
+        time.sleep(interval)
+        for session in shell_sessions.reap():
+            try:
+                close_session(session, "idle")
+            except Exception:
+                pass
+
+
+def read_output(ring, since, limit=64 * 1024):
+    """Read new shell output from `since`.
+
+    Returns (text, next_offset, dropped, end): the cursor never splits a
+    UTF-8 character, so an incomplete trailing sequence is left for the
+    next read; `end` is the offset of the last byte actually looked at.
+    """
+    data, end, dropped = ring.read(since, limit)
+    keep = complete_utf8(data)
+    return data[:keep].decode("utf-8", errors="ignore"), end - (len(data) - keep), dropped, end
+
+def new_job(kind, name):
+    """Register a job and return it. Finished jobs older than JOB_TTL are pruned."""
+    now = time.time()
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "type": kind,
+        "name": name,
+        "status": "queued",
+        "error": None,
+        "created_at": now,
+        "finished_at": None,
+        "source": None,
+        "done": threading.Event()
+    }
+    with lock:
+        for job_id, j in list(jobs.items()):
+            if j["finished_at"] and now - j["finished_at"] > JOB_TTL:
+                del jobs[job_id]
+        jobs[job["job_id"]] = job
+    return job
+
+
+def finish_job(job, error=None):
+    job["status"] = "failed" if error else "done"
+    job["error"] = error
+    job["finished_at"] = time.time()
+    job["done"].set()
+
+
+def job_view(job):
+    return {k: v for k, v in job.items() if k != "done"}
+
+
+def start_container(name, labels=None, size=None, image=None):
+    """Cold-start a container (alpine, or the local image ref `image`) with the limits of its size profile."""
+    size = size or sizes.DEFAULT_SIZE
+    labels = dict(labels or {}, **{SIZE_LABEL: size})
+    with runtime_latency.time("run"):
+        return runtime.run(name, labels, sizes.resources(size), image)
+
+
+def start_warm_container():
+    # warm containers carry the default size's limits and image, so only default creates use them
+    return start_container(f"warm-{node_id}-{uuid.uuid4().hex[:12]}", labels={WARM_LABEL: node_id})
+
+
+def claim_warm(name, size=None, image=None):
+    """Take a pre-started container from the warm pool and give it `name`; None on a miss."""
+    if warm_pool is None or (size or sizes.DEFAULT_SIZE) != sizes.DEFAULT_SIZE:
+        return None
+    if (image or images.DEFAULT_IMAGE) != images.DEFAULT_IMAGE:
+        return None
+    container = warm_pool.claim()
+    if container is None:
+        return None
+    try:
+        with runtime_latency.time("rename"):
+            runtime.rename(container, name)
+        return container
+    except Exception as e:
+        print(f"[WarmPool] Rename to {name} failed ({e}); falling back to a cold start")
+        try:
+            runtime.remove(container, force=True)
+        except Exception:
+            pass
+        return None
+
+
+def track(name, container, status="running"):
+    """Add a VM to the state table (call with `lock` held)."""
+    containers[name] = container
+    vm_status[name] = status
+    listing.put(name, {"name": name, "id": container.short_id, "status": status, "size": vm_sizes.get(name),
+                           "image": vm_images.get(name)})
+
+
+def untrack(name):
+    """Drop a VM from the state table and return its container (call with `lock` held)."""
+    container = containers.pop(name, None)
+    vm_status.pop(name, None)
+    vm_sizes.pop(name, None)
+    vm_images.pop(name, None)
+    listing.delete(name)
+    return container
+
+
+def set_status(name, status):
+    """Record a status change for a tracked VM."""
+    with lock:
+        container = containers.get(name)
+        if container is None:
+            return
+        vm_status[name] = status
+        listing.put(name, {"name": name, "id": container.short_id, "status": status, "size": vm_sizes.get(name),
+                           "image": vm_images.get(name)})
+
+
+def run_create(job):
+    """Worker: start the container for a reserved name (outside the global lock)."""
+    name = job["name"]
+    job["status"] = "running"
+    try:
+        if job["snapshot_id"]:
+            job["source"] = "snapshot"
+            container = start_container(name, size=job["size"], image=job["ref"])
+        else:
+            container = claim_warm(name, job["size"], job["image"])
+            job["source"] = "warm" if container else "cold"
+            if container is None:
+                container = start_container(name, size=job["size"], image=images.resolve(job["image"]))
+    except Exception as e:
+        with lock:
+            pending.discard(name)
+            vm_sizes.pop(name, None)
+            vm_images.pop(name, None)
+        finish_job(job, str(e))
+        return
+    finally:
+        if job["snapshot_id"]:
+            snapshot_cache.release(job["snapshot_id"])
+    with lock:
+        pending.discard(name)
+        track(name, container)
+    finish_job(job)
+
+
+def allocated():
+    """Resources promised to this node's VMs (created and pending)."""
+    return sizes.total(list(vm_sizes.values()))
+
+
+def reserve(name, size=None, image=None):
+    """Reserve a VM name and its resources for creation.
+
+    Returns None on success, else an (error, status_code) pair.
+    """
+    size = size or sizes.DEFAULT_SIZE
+    with lock:
+        if name in containers or name in pending:
+            return "VM already exists", 400
+        if not sizes.fits(capacity, allocated(), sizes.resources(size)):
+            return f"Insufficient capacity for a {size} VM", 503
+        pending.add(name)
+        vm_sizes[name] = size
+        vm_images[name] = image or images.DEFAULT_IMAGE
+        return None
+
+
+def image_not_ready(image):
+    """None if `image` is local here, else an (error, status_code) pair; never pulls."""
+    image = image or images.DEFAULT_IMAGE
+    if image_puller is None or image_puller.ready(image):
+        return None
+    return f"Image {image} is not ready on this node yet", 503
+
+
+def new_create_job(name, size, image, snapshot=None):
+    """Queue a create; with `snapshot` (pinned in snapshot_cache) the VM starts from its image."""
+    job = new_job("clone_vm" if snapshot else "create_vm", name)
+    job["size"] = size or sizes.DEFAULT_SIZE
+    job["image"] = image or images.DEFAULT_IMAGE
+    job["snapshot_id"] = snapshot and snapshot["snapshot_id"]
+    if snapshot:
+        job["ref"] = snapshot["ref"]
+    create_workers.submit(run_create, job)
+    return job
 
-# Session store for interactive shells
-shell_sessions = {}
-shell_lock = threading.Lock()
 
 @app.route("/create_vm", methods=["POST"])
 def create_vm():
-    """Create a lightweight container (simulating a VM)"""
+    """Reserve the name and queue container creation; returns 202 and a job ID.
+
+    An optional "size" picks a profile from sizes.PROFILES (default "small");
+    its CPU, memory and pids limits are enforced on the container, and the
+    create is refused with 503 if it would overcommit the node.
+    An optional "image" picks from images.CATALOG (default "alpine"); the
+    create is refused with 503 if that image has not been pulled here yet.
+    Poll GET /jobs/<job_id> (optionally with ?wait=<s>) for the outcome.
+    """
     data = request.get_json(force=True)
     name = data.get("name", f"vm_{int(time.time())}")
+    size, image = data.get("size"), data.get("image")
+    try:
+        sizes.resources(size)
+        images.resolve(image)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    refused = image_not_ready(image) or reserve(name, size, image)
+    if refused:
+        return jsonify({"error": refused[0]}), refused[1]
+
+    job = new_create_job(name, size, image)
+    return (jsonify({"status": "accepted", "name": name, "job_id": job["job_id"]}), 202,
+            {"Location": f"/jobs/{job['job_id']}"})
 
-    with lock:
-        if name in containers:
-            return jsonify({"error": "VM already exists"}), 400
-        try:
-            # Create a lightweight container using alpine Linux
-            container = client.containers.run(
-                "alpine",
-                name=name,
-                command="sleep infinity",
-                detach=True,
-                tty=True
-            )
-            containers[name] = container
-            return jsonify({"status": "created", "name": name}), 201
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Report a job's progress. `?wait=<s>` blocks up to s seconds (max 30) for it to finish."""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    wait = request.args.get("wait", type=float)
+    if wait:
+        job["done"].wait(min(wait, 30))
+    return jsonify(job_view(job))
 
 @app.route("/list_vms", methods=["GET"])
 def list_vms():
-    """List all running containers (VMs)"""
+    """List all running containers (VMs)
+
+    The list is re-serialised only when the state version changes. Honours
+    If-None-Match (304 while unchanged). With `?since_version=<n>[&epoch=<e>]`
+    returns only the changes since that version (see versioned.py).
+    """
+    since = request.args.get("since_version")
+    if since is not None:
+        try:
+            delta = listing.delta(int(since), request.args.get("epoch"))
+        except ValueError:
+            return jsonify({"error": "Invalid since_version"}), 400
+        return jsonify(delta)
+    version, etag, body = listing.listing()
+    if request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers={"ETag": etag})
+    return Response(body, mimetype="application/json", headers={"ETag": etag, "X-List-Version": str(version)})
+
+def node_stats():
+    """Lightweight load report (sent with every heartbeat)."""
+    # len() on a dict is atomic, so no need to queue behind `lock` here
+    return {
+        "containers": len(containers) + len(pending),
+        "pending": len(pending),
+        "capacity": capacity,
+        "allocated": allocated(),
+        "images": image_puller.available() if image_puller else None,
+        "pulling": image_puller.progress() if image_puller else {},
+        "warm_pool": warm_pool.stats() if warm_pool else None,
+        "shell_sessions": len(shell_sessions),
+        "snapshots": len(snapshot_cache),
+        "time": time.time()
+    }
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Lightweight load report."""
+    return jsonify(node_stats())
+
+
+def heartbeat_loop(lb_url, url, interval):
+    """Background thread: register with the load balancer, then heartbeat with our load.
+
+    A 404 means the load balancer does not know us (it restarted, or dropped
+    us after missed heartbeats), so register again.
+    """
+    registered = False
+    while True:
+        try:
+            if not registered:
+                r = http_pool.post(f"{lb_url}/register_node", json={"url": url, "stats": node_stats()}, timeout=2)
+                registered = r.status_code == 200
+                if registered:
+                    print(f"[Membership] Registered with {lb_url} as {url}")
+            else:
+                r = http_pool.post(f"{lb_url}/heartbeat", json={"url": url, "stats": node_stats()}, timeout=2)
+                registered = r.status_code != 404
+        except Exception as e:
+            if registered:
+                print(f"[Membership] Heartbeat to {lb_url} failed: {e}")
+        time.sleep(interval)
+
+@app.route("/images", methods=["GET"])
+def list_images():
+    """State and pull progress of every catalog image on this node."""
+    if image_puller is None:
+        return jsonify({"images": {}})
+    return jsonify({"images": image_puller.snapshot()})
+
+@app.route("/warm_pool", methods=["GET"])
+def warm_pool_stats():
+    """Warm pool size and hit/miss metrics."""
+    if warm_pool is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(warm_pool.stats(), enabled=True))
+
+def do_delete(name):
+    """Stop and remove one container. Returns (body, status_code).
+
+    A VM still being created (or staged by a migration) is refused with 409:
+    its container isn't tracked yet, and the create would track it after
+    the delete had already reported it gone.
+    """
+    with lock:
+        if name in pending:
+            return {"error": "VM is still being created, try again once it is running"}, 409
+        container = untrack(name)
+    if not container:
+        return {"error": "Not found"}, 404
+    # Runtime calls run outside the lock so other requests aren't held up
+    try:
+        with runtime_latency.time("stop"):
+            runtime.stop(container)
+        with runtime_latency.time("remove"):
+            runtime.remove(container)
+    except Exception as e:
+        return {"error": str(e)}, 500
+    return {"status": "deleted", "name": name}, 200
+
+
+def do_shutdown(name):
+    """Stop one container without removing it. Returns (body, status_code)."""
     with lock:
-        vms = [{"name": n, "id": c.short_id, "status": c.status} for n, c in containers.items()]
-    return jsonify(vms)
+        container = containers.get(name)
+    if not container:
+        return {"error": "Not found"}, 404
+    try:
+        with runtime_latency.time("stop"):
+            runtime.stop(container)
+    except Exception as e:
+        return {"error": str(e)}, 500
+    return {"status": "stopped", "name": name}, 200
+
 
 @app.route("/delete_vm/<name>", methods=["DELETE"])
 def delete_vm(name):
     """Stop and remove a container"""
-    with lock:
-        container = containers.pop(name, None)
-        if not container:
-            return jsonify({"error": "Not found"}), 404
-        container.stop()
-        container.remove()
-    return jsonify({"status": "deleted", "name": name})
+    body, code = do_delete(name)
+    return jsonify(body), code
 
 
 @app.route("/shutdown_vm/<name>", methods=["POST"])
 def shutdown_vm(name):
     """Stop a container without removing it (can be restarted later)"""
+    body, code = do_shutdown(name)
+    return jsonify(body), code
+
+
+def batch_names():
+    """Read the de-duplicated, order-preserving `names` list of a bulk request."""
+    names = (request.get_json(force=True, silent=True) or {}).get("names")
+    if not isinstance(names, list) or not names:
+        return None
+    return list(dict.fromkeys(str(n) for n in names))
+
+
+def batch_item(name, body, code):
+    """Normalise one (body, status_code) outcome into a bulk result entry."""
+    item = dict(body, name=name, code=code)
+    if "error" in body:
+        item["status"] = "error"
+    return item
+
+
+@app.route("/create_vms", methods=["POST"])
+def create_vms():
+    """Create many VMs in parallel; returns one result per name.
+
+    Names are reserved up front, created on the worker pool, and waited on
+    for at most BATCH_WAIT seconds (unfinished ones report "pending").
+    """
+    names = batch_names()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    data = request.get_json(force=True, silent=True) or {}
+    size, image = data.get("size"), data.get("image")
+    try:
+        sizes.resources(size)
+        images.resolve(image)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    not_ready = image_not_ready(image)
+    if not_ready:
+        return jsonify({"error": not_ready[0]}), not_ready[1]
+
+    results = {}
+    batch_jobs = []
+    for name in names:
+        refused = reserve(name, size, image)
+        if refused:
+            results[name] = batch_item(name, {"error": refused[0]}, refused[1])
+            continue
+        batch_jobs.append(new_create_job(name, size, image))
+
+    collect_jobs(batch_jobs, results)
+    return jsonify({"results": [results[n] for n in names]})
+
+
+def collect_jobs(batch_jobs, results):
+    """Wait up to BATCH_WAIT seconds for create jobs and record each outcome in `results`."""
+    deadline = time.monotonic() + BATCH_WAIT
+    for job in batch_jobs:
+        job["done"].wait(max(0, deadline - time.monotonic()))
+        if job["status"] == "done":
+            body, code = {"status": "created", "source": job["source"]}, 201
+        elif job["status"] == "failed":
+            body, code = {"error": job["error"]}, 500
+        else:
+            body, code = {"status": "pending"}, 202
+        results[job["name"]] = batch_item(job["name"], dict(body, job_id=job["job_id"]), code)
+
+
+@app.route("/delete_vms", methods=["POST"])
+def delete_vms():
+    """Stop and remove many containers in parallel; returns one result per name."""
+    names = batch_names()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    outcomes = batch_workers.map(do_delete, names)
+    return jsonify({"results": [batch_item(n, *o) for n, o in zip(names, outcomes)]})
+
+
+@app.route("/shutdown_vms", methods=["POST"])
+def shutdown_vms():
+    """Stop many containers in parallel; returns one result per name."""
+    names = batch_names()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    outcomes = batch_workers.map(do_shutdown, names)
+    return jsonify({"results": [batch_item(n, *o) for n, o in zip(names, outcomes)]})
+
+
+@app.route("/snapshot_vm/<name>", methods=["POST"])
+def snapshot_vm(name):
+    """Commit a VM's filesystem as a snapshot to clone from; {"owner"?} tags it.
+
+    Returns the snapshot's metadata (201). The least recently used snapshot
+    beyond --max-snapshots is evicted and its image removed.
+    """
+    owner = (request.get_json(force=True, silent=True) or {}).get("owner")
     with lock:
         container = containers.get(name)
-        if not container:
-            return jsonify({"error": "Not found"}), 404
+        size = vm_sizes.get(name) or sizes.DEFAULT_SIZE
+        image = vm_images.get(name) or images.DEFAULT_IMAGE
+    if not container:
+        return jsonify({"error": "VM not found"}), 404
+    try:
+        with runtime_latency.time("commit"):
+            ref = runtime.commit(container)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    snapshot_id = f"snap-{uuid.uuid4().hex[:12]}"
+    snapshot = {"ref": ref, "vm": name, "size": size, "image": image, "owner": owner}
+    snapshot_cache.add(snapshot_id, snapshot)
+    remove_snapshot_images()
+    print(f"[Snapshot] {snapshot_id} of {name}")
+    return jsonify({k: v for k, v in snapshot.items() if k not in ("ref", "in_use")}), 201
+
+
+def remove_snapshot_images():
+    """Remove the images of evicted and deleted snapshots; failures are retried on the next call."""
+    # by repository:tag and forced, so only the tag goes: clones keep the layers they run on
+    for snapshot, e in snapshot_cache.remove_images(lambda ref: runtime.remove_image(ref, force=True)):
+        print(f"[Snapshot] Removing {snapshot['snapshot_id']} failed: {e}; will retry")
+
+
+@app.route("/snapshots", methods=["GET"])
+def list_snapshots():
+    """This node's snapshots (`?owner=` filters) and the cache limits."""
+    return jsonify({"snapshots": snapshot_cache.snapshot(request.args.get("owner")),
+                    "limits": snapshot_cache.stats()})
+
+
+@app.route("/snapshots/<snapshot_id>", methods=["DELETE"])
+def delete_snapshot(snapshot_id):
+    """Drop a snapshot and remove its image (VMs cloned from it keep running)."""
+    try:
+        snapshot = snapshot_cache.pop(snapshot_id)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    if snapshot is None:
+        return jsonify({"error": "Snapshot not found"}), 404
+    remove_snapshot_images()
+    return jsonify({"status": "deleted", "snapshot_id": snapshot_id}), 200
+
+
+@app.route("/clone_vm", methods=["POST"])
+def clone_vm():
+    """Start many VMs from a snapshot in parallel: {"snapshot_id", "names", "size"?}.
+
+    Clones share the snapshot's layers, so each one costs a plain container
+    start. Size defaults to the snapshot's; results are reported like
+    /create_vms (one entry per name, unfinished ones "pending").
+    """
+    names = batch_names()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    data = request.get_json(force=True)
+    snapshot = snapshot_cache.acquire(data.get("snapshot_id"), len(names))
+    if snapshot is None:
+        return jsonify({"error": "Snapshot not found"}), 404
+    size = data.get("size") or snapshot["size"]
+    try:
+        sizes.resources(size)
+    except ValueError as e:
+        snapshot_cache.release(snapshot["snapshot_id"], len(names))
+        return jsonify({"error": str(e)}), 400
+
+    results = {}
+    batch_jobs = []
+    for name in names:
+        refused = reserve(name, size, snapshot["image"])
+        if refused:
+            snapshot_cache.release(snapshot["snapshot_id"])
+            results[name] = batch_item(name, {"error": refused[0]}, refused[1])
+            continue
+        batch_jobs.append(new_create_job(name, size, snapshot["image"], snapshot))
+
+    collect_jobs(batch_jobs, results)
+    return jsonify({"snapshot_id": snapshot["snapshot_id"], "results": [results[n] for n in names]})
+
+
+@app.route("/export_vm/<name>", methods=["GET"])
+def export_vm(name):
+    """Commit a VM's filesystem and stream it as an image archive (the source side of a migration).
+
+    X-VM-Size and X-VM-Image carry the VM's size profile and catalog image.
+    The committed image is removed here once sent.
+    """
+    with lock:
+        container = containers.get(name)
+        size = vm_sizes.get(name) or sizes.DEFAULT_SIZE
+        image = vm_images.get(name) or images.DEFAULT_IMAGE
+    if not container:
+        return jsonify({"error": "VM not found"}), 404
+    try:
+        with runtime_latency.time("commit"):
+            ref = runtime.commit(container)
+        chunks = runtime.save_image(ref)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
         try:
-            container.stop()
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
-    return jsonify({"status": "stopped", "name": name})
+            yield from chunks
+        finally:
+            try:
+                runtime.remove_image(ref)
+            except Exception:
+                pass  # still used by a container on a shared daemon
+
+    return Response(generate(), mimetype="application/x-tar", headers={"X-VM-Size": size, "X-VM-Image": image})
+
+
+@app.route("/import_vm", methods=["POST"])
+def import_vm():
+    """Stage a VM migrating to this node: {"name", "source", "size", "image"}.
+
+    Reserves the name and capacity, loads the VM's image from the source
+    node's /export_vm and starts it under a temporary name (nodes may share
+    one Docker daemon, where the original still holds the name). The load
+    balancer then removes the original and calls /import_vm/<name>/activate,
+    or /import_vm/<name>/abort if that fails.
+    """
+    data = request.get_json(force=True)
+    name, source, size, image = data.get("name"), data.get("source"), data.get("size"), data.get("image")
+    if not name or not source:
+        return jsonify({"error": "Missing name or source"}), 400
+    try:
+        sizes.resources(size)
+        images.resolve(image)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # the VM's own committed image travels with it, so the catalog image need not be local here
+    refused = reserve(name, size, image)
+    if refused:
+        return jsonify({"error": refused[0]}), refused[1]
+
+    try:
+        res = http_pool.get(f"{source}/export_vm/{name}", stream=True, timeout=(2, MIGRATE_TIMEOUT))
+        try:
+            if res.status_code != 200:
+                raise RuntimeError(f"export from {source} failed: HTTP {res.status_code} {res.text}")
+            with runtime_latency.time("load"):
+                ref = runtime.load_image(res.iter_content(64 * 1024))
+        finally:
+            res.close()
+        container = start_container(f"{name}.migrating-{uuid.uuid4().hex[:8]}", size=size, image=ref)
+    except Exception as e:
+        with lock:
+            pending.discard(name)
+            vm_sizes.pop(name, None)
+            vm_images.pop(name, None)
+        return jsonify({"error": str(e)}), 500
+    with lock:
+        staged[name] = container
+    print(f"[Migrate] Staged {name} from {source} as {container.name}")
+    return jsonify({"status": "staged", "name": name, "staged_as": container.name}), 201
+
+
+@app.route("/import_vm/<name>/activate", methods=["POST"])
+def activate_import(name):
+    """Give a staged VM its real name and start serving it (idempotent: safe to retry)."""
+    with lock:
+        container = staged.pop(name, None)
+        already_running = container is None and name in containers
+    if already_running:
+        return jsonify({"status": "running", "name": name}), 200
+    if container is None:
+        return jsonify({"error": "Nothing staged for this VM"}), 404
+    try:
+        with runtime_latency.time("rename"):
+            runtime.rename(container, name)
+    except Exception as e:
+        with lock:
+            staged[name] = container  # still abortable
+        return jsonify({"error": str(e)}), 500
+    with lock:
+        pending.discard(name)
+        track(name, container)
+    print(f"[Migrate] {name} is now served here")
+    return jsonify({"status": "running", "name": name}), 200
+
+
+@app.route("/import_vm/<name>/abort", methods=["POST"])
+def abort_import(name):
+    """Drop a staged VM and release its reservation."""
+    with lock:
+        container = staged.pop(name, None)
+        if container is not None:
+            pending.discard(name)
+            vm_sizes.pop(name, None)
+            vm_images.pop(name, None)
+    if container is None:
+        return jsonify({"error": "Nothing staged for this VM"}), 404
+    try:
+        runtime.remove(container, force=True)
+    except Exception:
+        pass
+    return jsonify({"status": "aborted", "name": name}), 200
+
+
+@app.route("/vm_status", methods=["POST"])
+def vm_status_batch():
+    """Status of many VMs from the event-driven state table (no runtime calls).
+
+    Returns {"statuses": {name: status}}; "missing" means no such container.
+    """
+    names = batch_names()
+    if names is None:
+        return jsonify({"error": "Missing names"}), 400
+    with lock:
+        statuses = {n: vm_status.get(n) or ("creating" if n in pending else "missing") for n in names}
+    return jsonify({"statuses": statuses})
 
 
 @app.route("/exec_vm/<name>", methods=["POST"])
 def exec_vm(name):
-    """Execute a command inside a container and stream output back."""
+    """Execute a command inside a container and stream output back.
+
+    Output is sent as it is produced (chunked, never buffered whole) and
+    ends with an exit-code trailer (see exec_stream.py).
+    """
     data = request.get_json(force=True)
     cmd = data.get("cmd", "/bin/sh")
 
@@ -96,16 +816,32 @@ def exec_vm(name):
             return jsonify({"error": "VM not found"}), 404
 
     try:
-        exec_result = container.exec_run(cmd, stdin=False, tty=False)
-        output = exec_result.output.decode("utf-8", errors="ignore")
-        return Response(output, mimetype="text/plain")
+        with runtime_latency.time("exec"):
+            output, exit_code = runtime.exec_stream(container, cmd)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    def generate():
+        try:
+            for chunk in output:
+                yield chunk
+            code = exit_code()
+        except Exception as e:
+            yield f"\n[exec error: {e}]\n".encode()
+            code = -1
+        yield trailer(code)
+
+    return Response(generate(), mimetype="text/plain")
+
 
 @app.route("/shell_session/<name>", methods=["POST"])
 def shell_session(name):
-    """Initiate an interactive shell session. Returns a session ID."""
+    """Initiate an interactive shell session. Returns a session ID.
+
+    An optional {"user": ...} body names the owner for the per-user cap; when
+    a cap is hit the least recently used session is closed to make room.
+    """
+    owner = str((request.get_json(force=True, silent=True) or {}).get("user") or "anonymous")
     with lock:
         container = containers.get(name)
         if not container:
@@ -114,27 +850,20 @@ def shell_session(name):
     session_id = str(uuid.uuid4())
     
     try:
-        # Create interactive exec instance using Docker API
-        exec_id = client.api.exec_create(
-            container.id,
-            "/bin/sh",
-            stdin=True,
-            stdout=True,
-            stderr=True,
-            tty=True
-        )["Id"]
+        # Interactive /bin/sh on a TTY, attached to a raw socket
+        with runtime_latency.time("exec_socket"):
+            sock = runtime.exec_socket(container, "/bin/sh")
         
-        # Start the exec and get the socket
-        socket_obj = client.api.exec_start(exec_id, socket=True, tty=True)
-        
-        with shell_lock:
-            shell_sessions[session_id] = {
-                "container_name": name,
-                "container_id": container.id,
-                "exec_id": exec_id,
-                "socket": socket_obj,
-                "created_at": time.time()
-            }
+        session = {
+            "container_name": name,
+            "container_id": container.id,
+            "socket": sock,
+            "output": ByteRing(SHELL_BUFFER_BYTES),
+            "cursor": 0,  # read position for clients that don't send `since`
+        }
+        for old in shell_sessions.add(session_id, session, owner):
+            close_session(old, "evicted")
+        threading.Thread(target=pump_shell_output, args=(session,), daemon=True).start()
         
         return jsonify({"session_id": session_id, "status": "active"}), 201
     
@@ -145,17 +874,17 @@ def shell_session(name):
 @app.route("/shell_input/<session_id>", methods=["POST"])
 def shell_input(session_id):
     """Send input to an active shell session."""
-    with shell_lock:
-        session = shell_sessions.get(session_id)
-        if not session:
-            return jsonify({"error": "Session not found"}), 404
+    session = shell_sessions.get(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
     
     data = request.get_json(force=True)
     cmd_input = data.get("input", "")
     
     try:
-        socket = session["socket"]
-        socket._sock.sendall((cmd_input + "\n").encode())
+        payload = (cmd_input + "\n").encode()
+        session["socket"].sendall(payload)
+        session["bytes_in"] += len(payload)
         return jsonify({"status": "sent"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -163,67 +892,258 @@ def shell_input(session_id):
 
 @app.route("/shell_output/<session_id>", methods=["POST"])
 def shell_output(session_id):
-    """Get output from an active shell session."""
-    with shell_lock:
-        session = shell_sessions.get(session_id)
-        if not session:
-            return jsonify({"error": "Session not found"}), 404
+    """Get output from an active shell session.
+
+    With `since=<offset>` (query string or JSON body) returns exactly the
+    bytes written after that offset; X-Shell-Offset carries the next cursor
+    and X-Shell-Dropped the bytes lost to buffer overflow. Without it, a
+    per-session cursor is used, so each call returns only unseen output.
+    """
+    session = shell_sessions.get(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
     
+    data = request.get_json(force=True, silent=True) or {}
+    since = request.args.get("since", data.get("since"))
     try:
-        socket_obj = session["socket"]
-        # Try to read with a short timeout
-        socket_obj._sock.settimeout(0.1)
-        try:
-            output = socket_obj._sock.recv(4096).decode("utf-8", errors="ignore")
-        except (socket.timeout, BlockingIOError):
-            output = ""
-        socket_obj._sock.settimeout(None)
-        
-        return Response(output, mimetype="text/plain")
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        if since is None:
+            output, session["cursor"], dropped, _ = read_output(session["output"], session["cursor"])
+            offset = session["cursor"]
+        else:
+            output, offset, dropped, _ = read_output(session["output"], int(since))
+    except ValueError:
+        return jsonify({"error": "Invalid since"}), 400
+    
+    return Response(output, mimetype="text/plain",
+                    headers={"X-Shell-Offset": str(offset), "X-Shell-Dropped": str(dropped)})
+
+
+@app.route("/shell_stream/<session_id>", methods=["GET"])
+def shell_stream(session_id):
+    """Push shell output as Server-Sent Events as soon as it arrives.
+
+    Each `data:` line is a JSON string chunk and its `id:` is the output
+    offset after it, so a reconnecting EventSource resumes losslessly via
+    Last-Event-ID (or `?since=`). New streams start at the current end of
+    the output. An `end` event is sent when the shell exits; idle streams
+    only carry a comment every STREAM_HEARTBEAT s. A connected stream counts
+    as activity, so an open browser tab keeps its session alive.
+    """
+    session = shell_sessions.get(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+
+    ring = session["output"]
+    resume = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        since = int(resume) if resume else ring.end
+    except ValueError:
+        return jsonify({"error": "Invalid since"}), 400
+
+    def generate():
+        cursor = wait_from = since
+        yield ": connected\n\n"
+        while True:
+            shell_sessions.get(session_id)  # mark activity
+            if not ring.wait(wait_from, STREAM_HEARTBEAT):
+                if ring.closed:
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            text, cursor, _, seen = read_output(ring, cursor)
+            # an unfinished UTF-8 character stays unread: wait for more bytes
+            wait_from = seen
+            if text:
+                yield sse(text, event_id=cursor)
+        yield sse("", event="end")
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/shell_close/<session_id>", methods=["POST"])
 def shell_close(session_id):
     """Close an active shell session."""
-    with shell_lock:
-        session = shell_sessions.pop(session_id, None)
-    
+    session = shell_sessions.pop(session_id)
     if not session:
         return jsonify({"error": "Session not found"}), 404
     
     try:
-        socket = session["socket"]
-        socket._sock.close()
+        close_session(session, "closed by client")
         return jsonify({"status": "closed"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def auto_cleanup():
-    """Scheduler thread to auto-remove stopped containers"""
-    while True:
+
+@app.route("/sessions", methods=["GET"])
+def list_sessions():
+    """Shell sessions on this node (owner, VM, idle seconds, bytes in/out) plus the limits."""
+    return jsonify({"sessions": shell_sessions.snapshot(), "limits": shell_sessions.stats()})
+
+def remove_stopped(name, reason):
+    """Forget a stopped container and remove it (the runtime call runs outside `lock`)."""
+    with lock:
+        c = untrack(name)
+    if c is None:
+        return
+    print(f"[Scheduler] Removing stopped container {name} ({reason})")
+    try:
+        with runtime_latency.time("remove"):
+            runtime.remove(c, force=True)
+    except Exception:
+        pass
+
+
+def handle_event(event):
+    """Apply one runtime container event to the local state table."""
+    action, name = event["action"], event["name"]
+    if warm_pool is not None and action in ("die", "destroy"):
+        warm_pool.discard(name)  # a dead warm container must never be handed out
+    container = containers.get(name)
+    if container is None or container.id != event.get("id"):
+        return  # not one of ours, or an earlier container that had the same name
+    if action == "start":
+        set_status(name, "running")
+    elif action in ("die", "stop"):
+        set_status(name, "exited")
+        remove_stopped(name, action)
+    elif action == "destroy":
         with lock:
-            for name, c in list(containers.items()):
-                c.reload()
-                if c.status != "running":
-                    print(f"[Scheduler] Removing stopped container {name}")
-                    containers.pop(name, None)
-                    try:
-                        c.remove(force=True)
-                    except:
-                        pass
-        time.sleep(5)
+            untrack(name)
+
+
+def watch_events():
+    """Scheduler thread: track container state from the runtime event stream."""
+    since = None
+    while True:
+        try:
+            for event in runtime.events(since=since, actions=WATCHED_EVENTS):
+                since = event.get("time", since)
+                handle_event(event)
+        except Exception as e:
+            print(f"[Scheduler] Event stream error: {e}; reconnecting")
+        # resume from the last seen event so nothing is missed
+        time.sleep(1)
+
+
+def reconcile():
+    """Safety net: compare the state table with the runtime in a single call."""
+    with lock:
+        names = list(containers)  # snapshot first so newer VMs are never judged
+    try:
+        live = {c.name: c.status for c in runtime.list()}
+    except Exception as e:
+        print(f"[Scheduler] Reconcile failed: {e}")
+        return
+    for name in names:
+        status = live.get(name)
+        if status is None:
+            with lock:
+                untrack(name)
+        elif status != "running":
+            remove_stopped(name, "reconcile")
+        else:
+            set_status(name, status)
+
+
+def reconcile_loop(interval):
+    """Scheduler thread: run a full reconcile every `interval` seconds (and retry snapshot image removals)."""
+    while True:
+        time.sleep(interval)
+        reconcile()
+        remove_snapshot_images()
 
 if __name__ == "__main__":
     # --- parse the CLI port argument ---
     parser = argparse.ArgumentParser(description="Start a server node.")
     parser.add_argument("--port", type=int, default=5000,
                         help="Port number to run the server on (default: 5000)")
+    parser.add_argument("--reconcile-interval", type=float, default=60,
+                        help="Seconds between full state reconciles with the runtime (default: 60)")
+    parser.add_argument("--create-workers", type=int, default=8,
+                        help="Max containers created in parallel (default: 8)")
+    parser.add_argument("--warm-min", type=int, default=2,
+                        help="Idle pre-started containers to keep ready (default: 2, 0 disables the pool)")
+    parser.add_argument("--warm-max", type=int, default=8,
+                        help="Max idle containers the pool grows to during bursts (default: 8)")
+    parser.add_argument("--warm-max-age", type=float, default=3600,
+                        help="Seconds before an idle warm container is replaced (default: 3600)")
+    parser.add_argument("--runtime", choices=sorted(RUNTIMES),
+                        default=os.environ.get("MINICLOUD_RUNTIME", "docker"),
+                        help="Container runtime: docker, or sim for an in-memory simulator "
+                             "(default: $MINICLOUD_RUNTIME or docker)")
+    parser.add_argument("--sim-latency", type=float,
+                        default=float(os.environ.get("MINICLOUD_SIM_LATENCY", 1.0)),
+                        help="sim runtime: scale factor for simulated call latency, 0 = instant (default: 1.0)")
+    parser.add_argument("--sim-failure-rate", type=float,
+                        default=float(os.environ.get("MINICLOUD_SIM_FAILURE_RATE", 0.0)),
+                        help="sim runtime: probability that a container call fails (default: 0)")
+    parser.add_argument("--lb-url", default=os.environ.get("MINICLOUD_LB_URL", "http://127.0.0.1:8000"),
+                        help="Load balancer to register with (default: $MINICLOUD_LB_URL or http://127.0.0.1:8000)")
+    parser.add_argument("--advertise-url", default=None,
+                        help="URL the load balancer should use for this node (default: http://127.0.0.1:<port>)")
+    parser.add_argument("--heartbeat-interval", type=float, default=2.0,
+                        help="Seconds between heartbeats to the load balancer (default: 2)")
+    host = sizes.host_capacity()
+    parser.add_argument("--cpu-capacity", type=int, default=host["cpu_shares"],
+                        help=f"Allocatable CPU shares, 1024 per core (default: 90%% of this host, {host['cpu_shares']})")
+    parser.add_argument("--memory-capacity", type=int, default=host["memory_mb"],
+                        help=f"Allocatable memory in MB (default: 90%% of this host, {host['memory_mb']})")
+    parser.add_argument("--pids-capacity", type=int, default=host["pids"],
+                        help=f"Allocatable processes (default: {host['pids']})")
+    parser.add_argument("--max-sessions", type=int, default=64,
+                        help="Max shell sessions on this node; the least recently used is closed beyond it (default: 64)")
+    parser.add_argument("--max-sessions-per-user", type=int, default=8,
+                        help="Max shell sessions per user (default: 8)")
+    parser.add_argument("--session-idle-timeout", type=float, default=900,
+                        help="Seconds without client activity before a shell session is closed (default: 900)")
+    parser.add_argument("--max-snapshots", type=int, default=16,
+                        help="Snapshots kept for cloning; the least recently used is evicted beyond it (default: 16)")
+    parser.add_argument("--image-retry-interval", type=float, default=60,
+                        help="Seconds before retrying catalog images that failed to pull (default: 60)")
     args = parser.parse_args()
 
-    # --- start background cleanup thread ---
-    threading.Thread(target=auto_cleanup, daemon=True).start()
+    if args.runtime == "sim":
+        runtime = get_runtime("sim", latency=args.sim_latency, failure_rate=args.sim_failure_rate)
+    else:
+        runtime = get_runtime(args.runtime)
+    create_workers = ThreadPoolExecutor(max_workers=args.create_workers, thread_name_prefix="create")
+    node_id = str(args.port)
+    capacity = {"cpu_shares": args.cpu_capacity, "memory_mb": args.memory_capacity, "pids": args.pids_capacity}
+
+    # --- pre-pull the image catalog in the background (creates never wait on a pull) ---
+    image_puller = ImagePuller(runtime, retry_after=args.image_retry_interval)
+    threading.Thread(target=image_puller.run, daemon=True).start()
+
+    # --- warm pool: clear leftovers from a previous run, then start refilling ---
+    if args.warm_min > 0:
+        for c in runtime.list(label=f"{WARM_LABEL}={node_id}"):
+            try:
+                runtime.remove(c, force=True)
+            except Exception:
+                pass
+        warm_pool = WarmPool(start_warm_container, lambda c: runtime.remove(c, force=True),
+                             key=lambda c: c.name, min_size=args.warm_min,
+                             max_size=max(args.warm_min, args.warm_max),
+                             max_age=args.warm_max_age).start()
+
+    # --- start background state tracking (events + periodic reconcile) ---
+    threading.Thread(target=watch_events, daemon=True).start()
+    threading.Thread(target=reconcile_loop, args=(args.reconcile_interval,), daemon=True).start()
+
+    snapshot_cache.max_snapshots = args.max_snapshots
+
+    # --- shell session limits and the idle reaper ---
+    shell_sessions.max_sessions = args.max_sessions
+    shell_sessions.max_per_user = args.max_sessions_per_user
+    shell_sessions.idle_timeout = args.session_idle_timeout
+    threading.Thread(target=reap_sessions, args=(min(30.0, args.session_idle_timeout / 4),),
+                     daemon=True).start()
+
+    # --- join the load balancer's membership table ---
+    advertise_url = args.advertise_url or f"http://127.0.0.1:{args.port}"
+    threading.Thread(target=heartbeat_loop, args=(args.lb_url, advertise_url, args.heartbeat_interval),
+                     daemon=True).start()
 
     # --- run Flask on the chosen port ---
     print(f"[+] Starting server node on port {args.port}")
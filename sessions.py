@@ -0,0 +1,92 @@
+"""
+Bounded table of interactive shell sessions for a server node.
+
+Every session records its owner, when a client last touched it and how
+many bytes went in and came out. The table enforces two caps, per node
+and per owner: opening a session beyond a cap evicts the least recently
+used one (of that owner first), and `reap()` removes sessions idle for
+longer than `idle_timeout`. Evicted and reaped sessions are returned to
+the caller, which closes their sockets outside the table's lock, so
+sockets and buffers stay bounded whatever the clients do.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionTable:
+    def __init__(self, max_sessions=64, max_per_user=8, idle_timeout=900.0, lock=None):
+        self.max_sessions = max_sessions
+        self.max_per_user = max_per_user
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()  # session_id -> session, least recently used first
+        self.lock = lock or threading.Lock()
+        self.evicted = 0
+        self.reaped = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def _lru(self, owner=None):
+        for session_id, session in self.sessions.items():
+            if owner is None or session["owner"] == owner:
+                return session_id
+        return None
+
+    def add(self, session_id, session, owner="anonymous", now=None):
+        """Register a session; returns the [session]s evicted to stay within the caps."""
+        now = time.time() if now is None else now
+        session.update(session_id=session_id, owner=owner, created_at=now,
+                       last_activity=now, bytes_in=0, bytes_out=0)
+        evicted = []
+        with self.lock:
+            while self.max_per_user and sum(s["owner"] == owner for s in self.sessions.values()) >= self.max_per_user:
+                evicted.append(self.sessions.pop(self._lru(owner)))
+            while self.max_sessions and len(self.sessions) >= self.max_sessions:
+                evicted.append(self.sessions.popitem(last=False)[1])
+            self.sessions[session_id] = session
+            self.evicted += len(evicted)
+        return evicted
+
+    def get(self, session_id, now=None):
+        """Look up a session and mark it used (None if unknown)."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session["last_activity"] = time.time() if now is None else now
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def pop(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None)
+
+    def reap(self, now=None):
+        """Remove and return the sessions idle for at least `idle_timeout` seconds."""
+        now = time.time() if now is None else now
+        with self.lock:
+            idle = [sid for sid, s in self.sessions.items() if now - s["last_activity"] >= self.idle_timeout]
+            reaped = [self.sessions.pop(sid) for sid in idle]
+            self.reaped += len(reaped)
+        return reaped
+
+    def snapshot(self, now=None):
+        """Metadata of every session, most recently used last."""
+        now = time.time() if now is None else now
+        with self.lock:
+            return [{
+                "session_id": s["session_id"],
+                "owner": s["owner"],
+                "vm": s.get("container_name"),
+                "created_at": s["created_at"],
+                "idle": round(now - s["last_activity"], 3),
+                "bytes_in": s["bytes_in"],
+                "bytes_out": s["bytes_out"],
+            } for s in self.sessions.values()]
+
+    def stats(self):
+        with self.lock:
+            return {"active": len(self.sessions), "max_sessions": self.max_sessions,
+                    "max_per_user": self.max_per_user, "idle_timeout": self.idle_timeout,
+                    "evicted": self.evicted, "reaped": self.reaped}
@@ -0,0 +1,66 @@
+"""
+VM size profiles and capacity arithmetic.
+
+A size names the resources a VM is guaranteed and limited to:
+
+    cpu_shares   relative CPU weight (1024 = one core's worth under contention)
+    memory_mb    hard memory limit
+    pids         max processes
+
+Nodes report their allocatable capacity and what is already allocated
+(both in these units); the load balancer bin-packs VMs against that, and
+a node refuses a create that would overcommit it.
+"""
+
+import os
+
+PROFILES = {
+    "small": {"cpu_shares": 256, "memory_mb": 128, "pids": 64},
+    "medium": {"cpu_shares": 512, "memory_mb": 512, "pids": 128},
+    "large": {"cpu_shares": 1024, "memory_mb": 1024, "pids": 256},
+}
+DEFAULT_SIZE = "small"
+RESOURCES = ("cpu_shares", "memory_mb", "pids")
+
+
+def resources(size=None):
+    """Resources of a size profile (the default when None). Raises ValueError for unknown sizes."""
+    size = size or DEFAULT_SIZE
+    if size not in PROFILES:
+        raise ValueError(f"Unknown size {size!r} (choose from {', '.join(PROFILES)})")
+    return PROFILES[size]
+
+
+def host_capacity(reserve=0.1, nodes=1):
+    """Allocatable capacity of this machine, keeping `reserve` of it for the host itself.
+
+    With `nodes` server nodes on the same machine, this is one node's even share.
+    """
+    cpus = os.cpu_count() or 1
+    try:
+        memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        memory_mb = 4096
+    return {"cpu_shares": int(cpus * 1024 * (1 - reserve)) // nodes,
+            "memory_mb": int(memory_mb * (1 - reserve)) // nodes,
+            "pids": 32768 // nodes}
+
+
+def total(sizes):
+    """Sum the resources of an iterable of size names."""
+    used = dict.fromkeys(RESOURCES, 0)
+    for size in sizes:
+        for key, value in resources(size).items():
+            used[key] += value
+    return used
+
+
+def fits(capacity, allocated, need):
+    """True if `need` fits in what `allocated` leaves of `capacity`."""
+    return all(allocated.get(k, 0) + need[k] <= capacity.get(k, 0) for k in RESOURCES)
+
+
+def free_after(capacity, allocated, need):
+    """Fraction of capacity left after placing `need`, averaged over the resources."""
+    return sum((capacity[k] - allocated.get(k, 0) - need[k]) / capacity[k]
+               for k in RESOURCES if capacity.get(k)) / len(RESOURCES)
@@ -0,0 +1,100 @@
+"""
+Bounded cache of VM snapshots on a server node.
+
+A snapshot is a runtime commit of a VM's filesystem: one new image layer
+on top of the layers the VM already shares with its base image. Clones
+are containers started from that image, so they share every layer
+copy-on-write and a clone costs no more than a cold start, however much
+was installed in the original.
+
+The cache keeps at most `max_snapshots` of them. Adding one beyond the
+cap evicts the least recently used (cloning counts as use), skipping
+snapshots with a clone in progress. Evicted and deleted snapshots are
+queued for image removal, which the caller runs outside the cache's lock
+with `remove_images`; an image the runtime will not remove yet stays
+queued for the next attempt. Containers already cloned from an evicted
+snapshot keep running.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class SnapshotCache:
+    def __init__(self, max_snapshots=16, lock=None):
+        self.max_snapshots = max_snapshots
+        self.snapshots = OrderedDict()  # snapshot_id -> snapshot, least recently used first
+        self.lock = lock or threading.Lock()
+        self.evicted = 0
+        self.removals = []  # dropped snapshots whose images are still to be removed
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def add(self, snapshot_id, snapshot, now=None):
+        """Register a snapshot; returns the [snapshot]s evicted to stay within the cap."""
+        snapshot.update(snapshot_id=snapshot_id, created_at=time.time() if now is None else now,
+                        clones=0, in_use=0)
+        evicted = []
+        with self.lock:
+            self.snapshots[snapshot_id] = snapshot
+            idle = [sid for sid, s in self.snapshots.items() if not s["in_use"] and sid != snapshot_id]
+            while self.max_snapshots and len(self.snapshots) > self.max_snapshots and idle:
+                evicted.append(self.snapshots.pop(idle.pop(0)))
+            self.evicted += len(evicted)
+            self.removals.extend(evicted)
+        return evicted
+
+    def acquire(self, snapshot_id, count=1):
+        """Pin a snapshot for `count` clones and mark it used (None if unknown)."""
+        with self.lock:
+            snapshot = self.snapshots.get(snapshot_id)
+            if snapshot is not None:
+                snapshot["in_use"] += count
+                snapshot["clones"] += count
+                self.snapshots.move_to_end(snapshot_id)
+            return snapshot
+
+    def release(self, snapshot_id, count=1):
+        """Unpin a snapshot once `count` of its clones have finished."""
+        with self.lock:
+            snapshot = self.snapshots.get(snapshot_id)
+            if snapshot is not None:
+                snapshot["in_use"] = max(0, snapshot["in_use"] - count)
+
+    def pop(self, snapshot_id):
+        """Remove and return a snapshot (None if unknown); raises RuntimeError while it is being cloned."""
+        with self.lock:
+            snapshot = self.snapshots.get(snapshot_id)
+            if snapshot is not None and snapshot["in_use"]:
+                raise RuntimeError("A clone from this snapshot is in progress")
+            snapshot = self.snapshots.pop(snapshot_id, None)
+            if snapshot is not None:
+                self.removals.append(snapshot)
+            return snapshot
+
+    def remove_images(self, remove):
+        """Call `remove(ref)` for every queued image; returns [(snapshot, error)] for those that stay queued."""
+        with self.lock:
+            queued, self.removals = self.removals, []
+        failed = []
+        for snapshot in queued:
+            try:
+                remove(snapshot["ref"])
+            except Exception as e:
+                failed.append((snapshot, e))
+        with self.lock:
+            self.removals[:0] = [snapshot for snapshot, _ in failed]
+        return failed
+
+    def snapshot(self, owner=None):
+        """Metadata of every snapshot (optionally one owner's), most recently used last."""
+        with self.lock:
+            return [{k: v for k, v in s.items() if k not in ("ref", "in_use")}
+                    for s in self.snapshots.values() if owner is None or s.get("owner") == owner]
+
+    def stats(self):
+        with self.lock:
+            return {"snapshots": len(self.snapshots), "max_snapshots": self.max_snapshots,
+                    "evicted": self.evicted, "pending_removal": len(self.removals)}
@@ -0,0 +1,57 @@
+"""
+Short-lived, shared cache of live VM status for the web app.
+
+The dashboard asks for the status of all of a user's VMs at once. Names
+whose cached entry is younger than `ttl` are answered from memory; the
+rest are fetched with ONE batched call (`fetch(names) -> {name: entry}`),
+so a page refresh costs at most one load balancer request and usually
+none. Concurrent misses are serialised so they don't stampede the LB.
+"""
+
+import threading
+import time
+
+
+class StatusCache:
+    def __init__(self, fetch, ttl=3.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.entries = {}  # name -> (fetched_at, entry)
+        self.lock = threading.Lock()
+        self.fetch_lock = threading.Lock()
+        self.fetches = 0
+
+    def _fresh(self, names, now):
+        with self.lock:
+            hits = {}
+            for name in names:
+                cached = self.entries.get(name)
+                if cached and now - cached[0] < self.ttl:
+                    hits[name] = cached[1]
+            return hits
+
+    def get(self, names):
+        """Return {name: entry} for `names`, fetching only stale or unknown ones (in one call)."""
+        names = list(names)
+        result = self._fresh(names, time.monotonic())
+        if len(result) == len(names):
+            return result
+        with self.fetch_lock:
+            # another request may have fetched what we need while we waited
+            result = self._fresh(names, time.monotonic())
+            stale = [n for n in names if n not in result]
+            if stale:
+                fetched = self.fetch(stale)
+                self.fetches += 1
+                now = time.monotonic()
+                with self.lock:
+                    for name in stale:
+                        entry = fetched.get(name, {"status": "unknown"})
+                        self.entries[name] = (now, entry)
+                        result[name] = entry
+        return result
+
+    def invalidate(self, name):
+        """Forget `name` so the next lookup fetches it (after create/delete/shutdown)."""
+        with self.lock:
+            self.entries.pop(name, None)
@@ -0,0 +1,177 @@
+"""
+Persistent store for users and VM ownership.
+
+Backed by SQLite in WAL mode (readers never block the writer), with
+indexes on username and VM name so lookups stay flat as the tables grow.
+Reads go through an in-process cache that is invalidated on every write;
+a read only fills the cache if no write landed while it queried the
+database, so a stale row can never outlive its invalidation. Unknown
+usernames are not cached.
+
+On first open the legacy users.json / user_vms.json files are imported
+once; after that they are no longer read.
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username   TEXT PRIMARY KEY,
+    password   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_vms (
+    username   TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    server     TEXT,
+    created_at TEXT,
+    status     TEXT,
+    PRIMARY KEY (username, name)
+);
+CREATE INDEX IF NOT EXISTS idx_user_vms_name ON user_vms (name);
+CREATE TABLE IF NOT EXISTS meta (
+    key        TEXT PRIMARY KEY,
+    value      TEXT
+);
+"""
+
+VM_FIELDS = ("server", "created_at", "status")
+
+
+class Store:
+    """Thread-safe user / VM ownership store."""
+
+    def __init__(self, path="minicloud.db", users_json="users.json", vms_json="user_vms.json"):
+        self.path = str(path)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._passwords = {}
+        self._vms = {}
+        self._generation = 0  # bumped by every write, under _cache_lock
+        with self._write_lock, self._conn() as conn:
+            conn.executescript(SCHEMA)
+        self._migrate(Path(users_json), Path(vms_json))
+
+    def _conn(self):
+        """Return this thread's connection (sqlite3 connections are per-thread)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, users_json, vms_json):
+        """Import the legacy JSON files exactly once."""
+        with self._write_lock, self._conn() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return
+            users = {"admin": "admin"}  # default admin, as before
+            if users_json.exists():
+                with open(users_json) as f:
+                    users.update(json.load(f))
+            conn.executemany("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+                             users.items())
+            if vms_json.exists():
+                with open(vms_json) as f:
+                    for username, vms in json.load(f).items():
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO user_vms (username, name, server, created_at, status) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            [(username, name, *(info.get(k) for k in VM_FIELDS)) for name, info in vms.items()])
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+
+    def _write(self, sql, params=(), users=(), vm_users=()):
+        """Run one write statement and drop the affected cache entries."""
+        with self._write_lock, self._conn() as conn:
+            cur = conn.execute(sql, params)
+        self._invalidate(users, vm_users)
+        return cur.rowcount
+
+    def _invalidate(self, users=(), vm_users=()):
+        with self._cache_lock:
+            self._generation += 1
+            for u in users:
+                self._passwords.pop(u, None)
+            for u in vm_users:
+                self._vms.pop(u, None)
+
+    # --- users ---
+
+    def get_password(self, username):
+        """Return the stored password for `username`, or None."""
+        with self._cache_lock:
+            if username in self._passwords:
+                return self._passwords[username]
+            generation = self._generation
+        row = self._conn().execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None  # not cached: any name can be tried at /login
+        with self._cache_lock:
+            if self._generation == generation:
+                self._passwords[username] = row[0]
+        return row[0]
+
+    def add_user(self, username, password):
+        """Create a user. Returns False if the username is taken."""
+        try:
+            self._write("INSERT INTO users (username, password) VALUES (?, ?)",
+                        (username, password), users=(username,))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def delete_user(self, username):
+        """Delete a user and their VM ownership records."""
+        with self._write_lock, self._conn() as conn:
+            conn.execute("DELETE FROM user_vms WHERE username = ?", (username,))
+            conn.execute("DELETE FROM users WHERE username = ?", (username,))
+        self._invalidate((username,), (username,))
+
+    # --- VM ownership ---
+
+    def user_vms(self, username):
+        """Return {name: {server, created_at, status}} for one user."""
+        with self._cache_lock:
+            vms = self._vms.get(username)
+            generation = self._generation
+        if vms is None:
+            rows = self._conn().execute(
+                "SELECT name, server, created_at, status FROM user_vms WHERE username = ? ORDER BY created_at",
+                (username,)).fetchall()
+            vms = {name: dict(zip(VM_FIELDS, rest)) for name, *rest in rows}
+            # empty results aren't kept, so the cache only holds users that own VMs
+            with self._cache_lock:
+                if self._generation == generation and vms:
+                    self._vms[username] = vms
+        return {name: dict(info) for name, info in vms.items()}
+
+    def get_vm(self, username, name):
+        """Return one VM record owned by `username`, or None."""
+        return self.user_vms(username).get(name)
+
+    def vm_owner(self, name):
+        """Return the username owning VM `name`, or None."""
+        row = self._conn().execute("SELECT username FROM user_vms WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def add_vm(self, username, name, server, created_at, status):
+        self._write("INSERT OR REPLACE INTO user_vms (username, name, server, created_at, status) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (username, name, server, created_at, status), vm_users=(username,))
+
+    def update_vm(self, username, name, **fields):
+        """Update some of server / created_at / status on a VM record."""
+        cols = [k for k in fields if k in VM_FIELDS]
+        if not cols:
+            return 0
+        sql = f"UPDATE user_vms SET {', '.join(f'{c} = ?' for c in cols)} WHERE username = ? AND name = ?"
+        return self._write(sql, (*(fields[c] for c in cols), username, name), vm_users=(username,))
+
+    def remove_vm(self, username, name):
+        return self._write("DELETE FROM user_vms WHERE username = ? AND name = ?",
+                           (username, name), vm_users=(username,))
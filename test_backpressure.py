@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-backend concurrency limit.
+
+Run: python3 -m pytest -q test_backpressure.py
+"""
+
+import asyncio
+
+import pytest
+
+from backpressure import ConcurrencyLimit, Overloaded
+
+
+def test_limit_is_respected_and_queue_is_fifo():
+    async def main():
+        gate = ConcurrencyLimit(limit=2, max_queue=10)
+        running, peak, order = 0, 0, []
+
+        async def task(i):
+            nonlocal running, peak
+            async with gate:
+                running += 1
+                peak = max(peak, running)
+                order.append(i)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(task(i) for i in range(8)))
+        return gate, peak, order
+
+    gate, peak, order = asyncio.run(main())
+    assert peak == 2
+    assert order == list(range(8))
+    assert gate.stats()["active"] == 0 and gate.peak_queued == 6
+
+
+def test_full_queue_rejects():
+    async def main():
+        gate = ConcurrencyLimit(limit=1, max_queue=1)
+        await gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await gate.acquire()
+        gate.release()
+        await waiter
+        gate.release()
+        return gate
+
+    gate = asyncio.run(main())
+    assert gate.rejected == 1 and gate.active == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def main():
+        gate = ConcurrencyLimit(limit=1, max_queue=5)
+        await gate.acquire()
+        queued = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.sleep(0)
+        assert gate.queued == 0
+        gate.release()
+        # slot handed over, then the new owner is cancelled before running
+        await gate.acquire()
+        handed = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        gate.release()
+        handed.cancel()
+        await asyncio.sleep(0)
+        return gate
+
+    gate = asyncio.run(main())
+    assert gate.active == 0 and gate.queued == 0
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Tests for the routing logic both load balancer engines share (balancer.py).
+No servers needed: flows are driven against scripted node replies.
+
+Run: python3 -m pytest -q test_balancer.py
+"""
+
+import json
+import tempfile
+from pathlib import Path
+
+from balancer import Balancer, Call, Gather, Sleep, Offload, Reply, etag_matches, run
+from health import CircuitOpen
+from placement import PlacementRegistry
+from scheduler import Scheduler
+
+A = "http://node-a"
+B = "http://node-b"
+
+
+class ScriptedBalancer(Balancer):
+    """Answers each Call with `nodes(call)`: a (status, body) pair, or an exception to raise."""
+
+    def __init__(self, placements, nodes):
+        super().__init__(Scheduler([A, B]), placements)
+        self.nodes = nodes
+        self.calls = []
+        self.spawned = []
+
+    def send(self, call):
+        self.calls.append((call.method, call.server, call.path))
+        answer = self.nodes(call)
+        if isinstance(answer, Exception):
+            raise answer
+        status, body = answer
+        return Reply(status, {}, json.dumps(body).encode())
+
+    def perform(self, step):
+        if isinstance(step, Call):
+            return self.send(step)
+        if isinstance(step, Gather):
+            results = []
+            for call in step.calls:
+                try:
+                    results.append(self.send(call))
+                except Exception as e:
+                    results.append(e)
+            return results
+        if isinstance(step, Offload):
+            return step.fn(*step.args)
+        assert isinstance(step, Sleep)
+
+    def drive(self, flow):
+        return run(flow, self.perform)
+
+    def spawn(self, flow):
+        self.spawned.append(flow)
+
+
+def registry(d):
+    return PlacementRegistry(Path(d) / "placements.json")
+
+
+def test_sync_create_waits_for_the_job():
+    def nodes(call):
+        if call.path == "/create_vm":
+            return 202, {"name": "vm1", "job_id": "j1"}
+        return 200, {"status": "done", "name": "vm1"}
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        body, code = lb.drive(lb.create_vm({"name": "vm1"}))
+        server = lb.calls[0][1]
+        assert code == 201 and body == {"status": "created", "name": "vm1", "server": server}
+        assert lb.calls[1] == ("GET", server, "/jobs/j1")
+        assert lb.placements.get("vm1") == server and not lb.job_servers
+
+
+def test_sync_create_stops_polling_a_job_the_node_lost():
+    def nodes(call):
+        if call.path == "/create_vm":
+            return 202, {"name": "vm1", "job_id": "j1"}
+        return 404, {"error": "Job not found"}
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        body, code = lb.drive(lb.create_vm({"name": "vm1"}))
+        assert code == 502 and body["job_id"] == "j1" and len(lb.calls) == 2
+        assert not lb.job_servers and lb.placements.get("vm1") == body["server"]
+
+
+def test_vm_status_does_not_ask_the_source_of_a_migrating_vm():
+    def nodes(call):
+        return 200, {"statuses": {n: "missing" for n in call.kwargs["json"]["names"]}}
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        lb.placements.set("vm1", A)
+        lb.placements.set("vm2", A)
+        lb.migrating.add("vm1")
+        body, code = lb.drive(lb.vm_status(["vm1", "vm2"]))
+        assert body["statuses"] == {"vm1": {"status": "unknown", "server": A},
+                                    "vm2": {"status": "missing", "server": A}}
+        assert lb.calls == [("POST", A, "/vm_status")]
+
+
+def test_create_moves_to_another_node_after_a_refusal():
+    def nodes(call):
+        if len(lb.calls) == 1:
+            return 503, {"error": "No capacity"}
+        return 202, {"name": call.kwargs["json"]["name"], "job_id": "j1"}
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        body, code = lb.drive(lb.create_vm({"name": "vm1", "async": True}))
+        refused, chosen = [c[1] for c in lb.calls]
+        assert code == 202 and body["server"] == chosen != refused
+        assert lb.placements.get("vm1") == chosen and lb.job_servers == {"j1": chosen}
+
+
+def test_create_does_not_retry_a_node_that_may_have_acted():
+    def nodes(call):
+        return TimeoutError("read timed out")  # the node may have reserved the name
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        try:
+            lb.drive(lb.create_vm({"name": "vm1"}))
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("expected the timeout to surface")
+        assert len(lb.calls) == 1 and "vm1" not in lb.placements
+
+
+def test_create_vms_places_refused_names_again():
+    def nodes(call):
+        names = call.kwargs["json"]["names"]
+        if call.server == A:
+            return CircuitOpen("node-a is unavailable")
+        return 200, {"results": [{"name": n, "status": "created"} for n in names]}
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        lb.placements.set("taken", B)
+        body, code = lb.drive(lb.create_vms(["vm1", "vm2", "taken"], {}))
+        results = {r["name"]: r for r in body["results"]}
+        assert code == 200
+        assert results["vm1"]["server"] == results["vm2"]["server"] == B
+        assert results["taken"]["code"] == 400
+        assert lb.placements.snapshot() == {"vm1": B, "vm2": B, "taken": B}
+
+
+def test_failed_batch_share_drops_its_placements():
+    def nodes(call):
+        if call.server == A:
+            return ConnectionError("node-a is down")
+        return 200, {"results": [{"name": n, "status": "created"} for n in call.kwargs["json"]["names"]]}
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        body, code = lb.drive(lb.create_vms(["vm1", "vm2"], {}))
+        results = {r["name"]: r for r in body["results"]}
+        failed = next(r for r in results.values() if r["server"] == A)
+        assert code == 200 and failed["code"] == 502
+        assert lb.placements.snapshot() == {n: B for n, r in results.items() if r["server"] == B}
+
+
+def test_delete_vms_reports_unknown_names():
+    def nodes(call):
+        return 200, {"results": [{"name": n, "status": "deleted"} for n in call.kwargs["json"]["names"]]}
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        lb.placements.set("vm1", A)
+        body, _ = lb.drive(lb.delete_vms(["vm1", "ghost"]))
+        assert [r["status"] for r in body["results"]] == ["deleted", "error"]
+        assert body["results"][1]["code"] == 404 and "vm1" not in lb.placements
+
+
+def test_migrate_stages_removes_then_activates():
+    def nodes(call):
+        return {"/import_vm": (201, {"status": "staged"}),
+                "/delete_vm/vm1": (200, {"status": "deleted"}),
+                "/import_vm/vm1/activate": (200, {"status": "running"}),
+                "/list_vms": (200, {"full": True, "epoch": "e", "version": 1, "vms": []})}[call.path]
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        lb.placements.set("vm1", A)
+        body, code = lb.drive(lb.migrate("vm1", B))
+        assert code == 200 and body["to"] == B
+        steps = [c for c in lb.calls if c[2] != "/list_vms"]
+        assert steps == [("POST", B, "/import_vm"), ("DELETE", A, "/delete_vm/vm1"),
+                         ("POST", B, "/import_vm/vm1/activate")]
+        assert lb.placements.get("vm1") == B and not lb.migrating
+
+
+def test_migrate_keeps_retrying_a_stranded_copy_in_the_background():
+    def nodes(call):
+        if call.path.endswith("/activate"):
+            return 500, {"error": "busy"}
+        return {"/import_vm": (201, {}), "/delete_vm/vm1": (200, {}),
+                "/list_vms": (200, {"full": True, "epoch": "e", "version": 1, "vms": []})}[call.path]
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        lb.placements.set("vm1", A)
+        body, code = lb.drive(lb.migrate("vm1", B))
+        assert code == 500 and body["retrying"] and lb.unactivated == {"vm1": B}
+        assert len(lb.spawned) == 1
+        assert lb.drive(lb.migrate("vm1", A))[1] == 409
+
+
+def test_list_snapshots_answers_per_node_and_fills_the_index():
+    def nodes(call):
+        if call.server == A:
+            return ConnectionError("node-a is down")
+        return 200, {"snapshots": [{"snapshot_id": "snap-1", "size": "small"}], "limits": {}}
+
+    with tempfile.TemporaryDirectory() as d:
+        lb = ScriptedBalancer(registry(d), nodes)
+        body, code = lb.drive(lb.list_snapshots())
+        assert code == 200 and body[A].startswith("Error: ")
+        assert lb.snapshot_index == {"snap-1": {"server": B, "size": "small"}}
+
+
+def test_etag_matches_lists_and_weak_tags():
+    assert etag_matches('"v1"', '"v1"')
+    assert etag_matches('"v0", W/"v1"', '"v1"')
+    assert etag_matches("*", '"v1"')
+    assert not etag_matches('"v10"', '"v1"')
+    assert not etag_matches(None, '"v1"')
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Tests for the streamed exec output format.
+
+Run: python3 -m pytest -q test_exec_stream.py
+"""
+
+from exec_stream import ExitTrailerParser, trailer
+
+
+def parse(chunks):
+    parser = ExitTrailerParser()
+    out = b"".join(parser.feed(c) for c in chunks) + parser.finish()
+    return out, parser.exit_code
+
+
+def test_trailer_in_its_own_chunk():
+    assert parse([b"hello\n", b"world\n", trailer(0)]) == (b"hello\nworld\n", 0)
+
+
+def test_trailer_split_across_every_byte():
+    body = b"line one\nline two\n" + trailer(127)
+    assert parse([body[i:i + 1] for i in range(len(body))]) == (b"line one\nline two\n", 127)
+
+
+def test_output_is_released_without_waiting_for_the_end():
+    parser = ExitTrailerParser()
+    assert parser.feed(b"progress 10%\n") == b"progress 10%\n"
+    # a NUL that could start the marker is held back until disambiguated
+    assert parser.feed(b"x\x00") == b"x"
+    assert parser.feed(b"y") == b"\x00y"
+
+
+def test_missing_trailer_means_truncated():
+    assert parse([b"partial output\x00mini"]) == (b"partial output\x00mini", None)
+
+
+def test_negative_exit_code():
+    assert parse([b"", trailer(-1)]) == (b"", -1)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for the load balancer's circuit breakers and slow-node ejection.
+Time is passed in explicitly, so nothing sleeps.
+
+Run: python3 -m pytest -q test_health.py
+"""
+
+from health import CircuitBreaker, HealthTable
+from scheduler import Scheduler
+
+NODES = ["http://node-a", "http://node-b", "http://node-c"]
+
+
+def test_breaker_opens_at_failure_rate_and_probes_half_open():
+    b = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5, open_for=5.0)
+    for ok in (True, False, True):
+        b.record(ok, now=0)
+    assert b.state == "closed"  # too few calls to judge
+    b.record(False, now=1)
+    assert b.state == "open" and not b.allow(now=2)
+
+    # after the cooldown exactly one probe goes through; its failure doubles the wait
+    assert b.allow(now=6) and b.state == "half-open"
+    assert not b.allow(now=6)
+    b.record(False, now=6.5)
+    assert b.state == "open" and b.cooldown == 10.0
+    assert not b.available(now=15) and b.available(now=17)
+
+    assert b.allow(now=17)
+    b.record(True, now=17.1)
+    assert b.state == "closed" and b.cooldown == 5.0 and b.allow(now=17.2)
+
+
+def test_slow_node_is_ejected_per_operation_and_returns_clean():
+    health = HealthTable(min_samples=3, eject_for=10.0)
+    for _ in range(3):
+        health.record(NODES[0], True, 0.02, op="create_vm", now=0)
+        health.record(NODES[1], True, 0.03, op="create_vm", now=0)
+        # operations are only compared with the same operation on other nodes
+        health.record(NODES[2], True, 9.0, op="list_vms", now=0)
+    assert health.state(NODES[2], now=0) == "healthy"
+    for _ in range(3):
+        health.record(NODES[2], True, 0.8, op="create_vm", now=1)
+    assert health.state(NODES[2], now=1) == "ejected"
+    assert not health.allow(NODES[2], now=5)
+
+    # back after the ejection, with its latency history cleared
+    assert health.allow(NODES[2], now=11)
+    assert "create_vm" not in health.snapshot(now=11)[NODES[2]]["latency_ms"]
+    # a second ejection lasts longer
+    for _ in range(3):
+        health.record(NODES[2], True, 0.8, op="create_vm", now=12)
+    assert health.state(NODES[2], now=12 + 15) == "ejected"
+
+
+def test_ejection_never_takes_out_more_than_the_cap():
+    health = HealthTable(min_samples=1, max_ejected=0.5)
+    for node in NODES:
+        health.record(node, True, 0.01, op="list_vms", now=0)
+    health.record(NODES[1], True, 1.0, op="list_vms", now=0)
+    health.record(NODES[2], True, 1.0, op="list_vms", now=0)
+    states = [health.state(n, now=0) for n in NODES]
+    assert states.count("ejected") == 1
+
+
+def test_scheduler_skips_nodes_with_open_circuits():
+    sched = Scheduler(NODES, "round-robin",
+                      health=HealthTable({"min_calls": 2, "open_for": 60.0}))
+    for _ in range(2):
+        assert sched.admit(NODES[0])
+        sched.finish(NODES[0], 2.0, ok=False)
+    assert not sched.admit(NODES[0])
+    assert NODES[0] not in {sched.pick() for _ in range(10)}
+    assert sched.snapshot()["backends"][NODES[0]]["health"] == "open"
+
+
+def test_partial_outage_barely_reaches_the_dead_node():
+    """Replay 2000 creates, one every 10 ms, round-robin, while one of three nodes times out every call."""
+    health = HealthTable({"min_calls": 5, "open_for": 5.0})
+    dead, timeout = NODES[1], 2.0
+    sent_to_dead = 0
+    for i in range(2000):
+        now = i * 0.01
+        for node in NODES[i % 3:] + NODES[:i % 3]:  # failed or refused: retry on the next node
+            if not health.allow(node, now=now):
+                continue
+            if node != dead:
+                health.record(node, True, 0.02, op="create_vm", now=now)
+                break
+            sent_to_dead += 1
+            health.record(node, False, timeout, op="create_vm", now=now)
+    # without a breaker a third of the calls (~667) would wait out the timeout;
+    # with it, only the calls that open it and one probe per cooldown do
+    assert sent_to_dead <= 5 + 20 / 5
+
+
+def test_create_job_polls_never_eject_a_node():
+    health = HealthTable(min_samples=3)
+    for _ in range(3):
+        health.record(NODES[0], True, 0.05, op="jobs", now=0)
+        health.record(NODES[1], True, 0.05, op="create_vms", now=0)
+        # cold creates and big batches are slow because of the work, not the node
+        health.record(NODES[2], True, 1.5, op="jobs", now=0)
+        health.record(NODES[2], True, 30.0, op="create_vms", now=0)
+    assert health.state(NODES[2], now=0) == "healthy"
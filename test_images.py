@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the image catalog and the node-side pre-puller, on the sim runtime.
+
+Run: python3 -m pytest -q test_images.py
+"""
+
+import pytest
+
+import images
+from images import ImagePuller
+from runtime import SimRuntime
+
+
+def test_resolve_only_allows_catalog_images():
+    assert images.resolve() == images.CATALOG[images.DEFAULT_IMAGE]
+    assert images.resolve("debian") == images.CATALOG["debian"]
+    with pytest.raises(ValueError):
+        images.resolve("centos")
+
+
+def test_pulls_missing_images_and_reports_progress():
+    rt = SimRuntime(latency=0)
+    puller = ImagePuller(rt)
+    seen = []
+    real_pull = rt.pull
+
+    def watched_pull(ref):
+        for event in real_pull(ref):
+            yield event
+            seen.append(puller.progress())
+
+    rt.pull = watched_pull
+    puller.run()
+    assert sorted(puller.available()) == sorted(images.CATALOG)
+    assert puller.progress() == {}
+    # the default image was already local, so only the others were pulled
+    assert {name for p in seen for name in p} == set(images.CATALOG) - {images.DEFAULT_IMAGE}
+    assert seen[-1] == {"ubuntu": 100}
+    assert all(rt.has_image(ref) for ref in images.CATALOG.values())
+
+
+def test_failed_pull_is_reported_not_ready():
+    rt = SimRuntime(latency=0, failure_rate=1.0)
+    puller = ImagePuller(rt)
+    assert not puller.pull("debian")
+    state = puller.snapshot()["debian"]
+    assert state["state"] == "failed" and "simulated" in state["error"]
+    assert not puller.ready("debian")
+    assert puller.pull("alpine")  # already local: no pull needed
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Tests for the node membership table.
+
+Run: python3 -m pytest -q test_membership.py
+"""
+
+from membership import Membership
+
+A = "http://127.0.0.1:5000"
+B = "http://127.0.0.1:5001"
+
+
+def make():
+    changes = []
+    table = Membership(suspect_after=6, remove_after=15, on_change=lambda url, state: changes.append((url, state)))
+    return table, changes
+
+
+def test_register_heartbeat_and_failure_detection():
+    table, changes = make()
+    assert table.register(A, {"containers": 1}, now=0)
+    assert not table.register(A, now=0)  # already alive: no change
+    table.register(B, now=0)
+    assert table.heartbeat(A, {"containers": 2}, now=5)
+    assert table.check(now=7) == [(B, "suspect")]
+    assert table.alive() == [A]
+    table.heartbeat(A, now=14)
+    assert table.check(now=16) == [(B, "removed")]
+    assert changes == [(A, "alive"), (B, "alive"), (B, "suspect"), (B, "removed")]
+    assert table.snapshot()[A]["stats"] == {"containers": 2}
+
+
+def test_suspect_node_recovers_on_heartbeat():
+    table, changes = make()
+    table.register(A, now=0)
+    table.check(now=10)
+    assert table.heartbeat(A, now=11)
+    assert table.alive() == [A]
+    assert changes[-1] == (A, "alive")
+
+
+def test_unknown_node_must_register():
+    table, _ = make()
+    assert not table.heartbeat(A, now=0)
+    table.register(A, now=0)
+    table.check(now=100)
+    assert not table.heartbeat(A, now=101)  # removed: register again
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus text renderer and lock instrumentation.
+
+Run: python3 -m pytest -q test_metrics.py
+"""
+
+import threading
+import time
+
+from metrics import Counter, Gauge, Histogram, InstrumentedLock, LOCK_HOLD, LOCK_WAIT
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("req_seconds", "Request latency", ["route"], buckets=(0.1, 1))
+    for v in (0.05, 0.5, 0.5, 5):
+        h.observe(v, "/x")
+    lines = h.render()
+    assert lines[:2] == ["# HELP req_seconds Request latency", "# TYPE req_seconds histogram"]
+    assert 'req_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'req_seconds_bucket{route="/x",le="1"} 3' in lines
+    assert 'req_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'req_seconds_count{route="/x"} 4' in lines
+    assert 'req_seconds_sum{route="/x"} 6.05' in lines
+
+
+def test_counter_and_gauge_render():
+    c = Counter("hits_total", "Hits", ["path"])
+    c.inc('a"b')
+    c.inc('a"b', amount=2)
+    assert c.render()[-1] == 'hits_total{path="a\\"b"} 3'
+    assert Gauge("sessions", "Sessions", lambda: 7).render()[-1] == "sessions 7"
+
+
+def test_instrumented_lock_records_wait_and_hold():
+    lock = InstrumentedLock("test_lock")
+    holder = threading.Thread(target=lambda: (lock.acquire(), time.sleep(0.05), lock.release()))
+    holder.start()
+    time.sleep(0.01)
+    with lock:
+        pass
+    holder.join()
+    assert LOCK_WAIT.series[("test_lock",)][-1] >= 0.02
+    assert LOCK_HOLD.series[("test_lock",)][-1] >= 0.04
+    assert not lock.locked()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the load balancer's VM placement registry.
+
+Run: python3 -m pytest -q test_placement.py
+"""
+
+import tempfile
+from pathlib import Path
+
+from placement import PlacementRegistry
+
+A = "http://127.0.0.1:5000"
+B = "http://127.0.0.1:5001"
+
+
+def test_set_get_remove_persist():
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "placements.json"
+        reg = PlacementRegistry(path)
+        reg.set("vm1", A)
+        reg.set("vm2", B)
+        assert reg.get("vm1") == A and "vm2" in reg
+        assert reg.remove("vm1") == A
+        assert reg.remove("vm1") is None
+
+        reloaded = PlacementRegistry(path)
+        assert reloaded.snapshot() == {"vm2": B}
+
+
+def test_merge_keeps_unlisted_entries():
+    with tempfile.TemporaryDirectory() as d:
+        reg = PlacementRegistry(Path(d) / "placements.json")
+        reg.set("creating", A)
+        reg.set("moved", B)
+        # A's listing lacks the VM still being created there, and now has the migrated one
+        reg.merge({A: ["fresh", "moved"]})
+        assert reg.snapshot() == {"creating": A, "fresh": A, "moved": A}
+
+
+def test_in_memory_registry_touches_no_file(monkeypatch):
+    with tempfile.TemporaryDirectory() as d:
+        monkeypatch.chdir(d)
+        reg = PlacementRegistry(None)
+        reg.set_many({"vm1": A, "vm2": B})
+        reg.remove("vm1")
+        reg.close()
+        assert reg.snapshot() == {"vm2": B}
+        assert not list(Path(d).iterdir())
+
+
+def test_corrupt_file_starts_empty_and_is_kept():
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "placements.json"
+        path.write_text("{not json")
+        assert PlacementRegistry(path).snapshot() == {}
+        assert (Path(d) / "placements.json.corrupt").read_text() == "{not json"
+
+
+def test_journal_replays_skips_a_torn_line_and_compacts():
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "placements.json"
+        reg = PlacementRegistry(path, compact_every=10)
+        for i in range(8):
+            reg.set(f"vm{i}", A)
+        reg.remove_many(["vm0", "vm1"])
+        lines = path.read_text().splitlines()
+        assert len(lines) == 10  # the initial snapshot plus one line per change
+        with open(path, "a") as f:
+            f.write('["set", {"half')  # a crash mid-write
+        reloaded = PlacementRegistry(path, compact_every=10)
+        assert reloaded.snapshot() == {f"vm{i}": A for i in range(2, 8)}
+        assert len(path.read_text().splitlines()) == 1  # compacted on open
+        for i in range(12):
+            reloaded.set("flip", B if i % 2 else A)
+        assert len(path.read_text().splitlines()) <= 11
+        assert PlacementRegistry(path).get("flip") == B
+
+
+def test_reads_the_old_single_object_format():
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "placements.json"
+        path.write_text('{\n  "vm1": "%s"\n}' % A)
+        assert PlacementRegistry(path).snapshot() == {"vm1": A}
+        assert PlacementRegistry(path).snapshot() == {"vm1": A}  # converted to the journal
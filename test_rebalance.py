@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Tests for the load balancer's rebalancing decisions.
+
+Run: python3 -m pytest -q test_rebalance.py
+"""
+
+from rebalance import plan_move
+from sizes import total
+
+CAPACITY = {"cpu_shares": 2048, "memory_mb": 2048, "pids": 4096}
+
+
+def cluster(placed, draining=()):
+    nodes = {url: {"capacity": CAPACITY, "allocated": total(s for _, s in vms), "draining": url in draining}
+             for url, vms in placed.items()}
+    return nodes, placed
+
+
+def test_moves_from_hottest_to_coolest():
+    nodes, vms = cluster({"a": [("l1", "large"), ("m1", "medium"), ("s1", "small")],
+                          "b": [("l2", "large")]})
+    # moving the large VM would just make b the hot node; the medium one evens them out
+    assert plan_move(nodes, vms, 0.2) == ("m1", "a", "b")
+
+
+def test_balanced_or_draining_clusters_are_left_alone():
+    nodes, vms = cluster({"a": [("m1", "medium")], "b": [("s1", "small")]})
+    assert plan_move(nodes, vms, 0.5) is None
+    nodes, vms = cluster({"a": [("l1", "large"), ("m1", "medium")], "b": []}, draining=("b",))
+    assert plan_move(nodes, vms, 0.1) is None
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the offset-addressed ring buffers.
+
+Run: python3 -m pytest -q test_ring_buffer.py
+"""
+
+import threading
+import time
+
+from ring_buffer import ByteRing, LogRing, complete_utf8
+
+
+def test_read_since_returns_only_new_bytes():
+    ring = ByteRing(16)
+    ring.write(b"hello ")
+    data, cursor, dropped = ring.read(0)
+    assert (data, cursor, dropped) == (b"hello ", 6, 0)
+    ring.write(b"world")
+    assert ring.read(cursor) == (b"world", 11, 0)
+    assert ring.read(11) == (b"", 11, 0)
+
+
+def test_wraparound_and_dropped_bytes():
+    ring = ByteRing(8)
+    ring.write(b"abcdef")
+    ring.write(b"ghijkl")  # wraps; "abcd" overwritten
+    assert ring.start == 4
+    assert ring.read(0) == (b"efghijkl", 12, 4)
+    assert ring.read(6, max_bytes=3) == (b"ghi", 9, 0)
+    ring.write(b"0123456789")  # larger than capacity: only the tail survives
+    assert ring.read(0) == (b"23456789", 22, 14)
+
+
+def test_wait_wakes_on_write_and_close():
+    ring = ByteRing(8)
+    assert not ring.wait(0, timeout=0.01)
+    threading.Timer(0.02, ring.write, args=(b"x",)).start()
+    t0 = time.monotonic()
+    assert ring.wait(0, timeout=2)
+    assert time.monotonic() - t0 < 1
+    threading.Timer(0.02, ring.close).start()
+    assert not ring.wait(1, timeout=2)
+    assert ring.closed
+
+
+def test_complete_utf8_keeps_partial_characters():
+    e_acute = "é".encode()  # 2 bytes
+    euro = "€".encode()  # 3 bytes
+    assert complete_utf8(b"abc") == 3
+    assert complete_utf8(b"a" + e_acute) == 3
+    assert complete_utf8(b"a" + e_acute[:1]) == 1
+    assert complete_utf8(b"a" + euro[:2]) == 1
+    assert complete_utf8(euro) == 3
+    assert complete_utf8(b"") == 0
+
+
+def test_log_ring_since_and_eviction():
+    logs = LogRing(3)
+    for i in range(1, 6):
+        assert logs.append(f"line {i}") == i
+    entries, next_seq = logs.since(0)
+    assert entries == [(3, "line 3"), (4, "line 4"), (5, "line 5")]
+    assert next_seq == 5
+    assert logs.since(4) == ([(5, "line 5")], 5)
+    assert logs.since(5) == ([], 5)
+    assert logs.recent(2) == ["line 4", "line 5"]
+    assert logs.tail(2) == ([(4, "line 4"), (5, "line 5")], 5)
+    assert not logs.wait(5, timeout=0.01)
+    assert logs.wait(4, timeout=0.01)
+
+
+def test_log_ring_limit_pages_through_a_burst():
+    logs = LogRing(100)
+    for i in range(1, 11):
+        logs.append(f"line {i}")
+    seen, cursor = [], 0
+    while True:
+        entries, cursor = logs.since(cursor, 3)
+        if not entries:
+            break
+        seen += [seq for seq, _ in entries]
+    assert seen == list(range(1, 11)) and cursor == 10
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-memory simulator runtime.
+
+Run: python3 -m pytest -q test_runtime.py
+"""
+
+from itertools import islice
+
+import pytest
+
+from runtime import SimRuntime, get_runtime
+
+
+def collect(events, n):
+    out = []
+    for event in events:
+        out.append((event["action"], event["name"]))
+        if len(out) == n:
+            return out
+
+
+def test_lifecycle_emits_events():
+    rt = SimRuntime(latency=0)
+    events = rt.events(actions=["start", "die", "destroy"])
+    c = rt.run("vm1", labels={"pool": "warm"})
+    assert [x.name for x in rt.list(label="pool=warm")] == ["vm1"]
+    assert rt.list(label="pool=cold") == []
+    with pytest.raises(RuntimeError):
+        rt.run("vm1")
+    rt.rename(c, "vm2")
+    rt.stop(c)
+    assert c.status == "exited"
+    rt.remove(c)
+    assert rt.list() == []
+    assert collect(events, 3) == [("start", "vm1"), ("die", "vm2"), ("destroy", "vm2")]
+
+
+def test_events_since_replays_history():
+    rt = SimRuntime(latency=0)
+    c = rt.run("a")
+    t = rt.history[-1][1]["time"]
+    rt.remove(c, force=True)
+    assert collect(rt.events(since=t - 1), 3) == [("start", "a"), ("die", "a"), ("destroy", "a")]
+
+
+def test_events_name_the_container_id():
+    rt = SimRuntime(latency=0)
+    events = rt.events(actions=["start", "destroy"])
+    old = rt.run("a")
+    rt.remove(old, force=True)
+    new = rt.run("a")  # same name, different container
+    assert [(e["action"], e["id"]) for e in islice(events, 3)] == [
+        ("start", old.id), ("destroy", old.id), ("start", new.id)]
+
+
+def test_failure_injection():
+    rt = SimRuntime(latency=0, failure_rate=1.0)
+    with pytest.raises(RuntimeError, match="simulated run failure"):
+        rt.run("x")
+    assert rt.list() == []  # reads never fail
+
+
+def test_exec_stream_and_socket():
+    rt = SimRuntime(latency=0)
+    c = rt.run("vm")
+    output, exit_code = rt.exec_stream(c, "echo hi")
+    assert b"".join(output) == b"hi\n" and exit_code() == 0
+    sock = rt.exec_socket(c)
+    sock.sendall(b"ls\n")
+    got = b""
+    while not got.endswith(b"ls\r\n/ # "):
+        got += sock.recv(4096)
+    sock.close()
+
+
+def test_commit_and_move_image_between_runtimes():
+    source, target = SimRuntime(latency=0), SimRuntime(latency=0)
+    c = source.run("vm")
+    ref = source.commit(c)
+    loaded = target.load_image(source.save_image(ref))
+    assert loaded == ref
+    moved = target.run("vm", image=loaded)
+    assert moved.image == ref
+    with pytest.raises(RuntimeError, match="in use"):
+        target.remove_image(ref)
+    source.remove_image(ref)
+    assert ref not in source.images
+
+
+def test_get_runtime_from_env(monkeypatch):
+    monkeypatch.setenv("MINICLOUD_RUNTIME", "sim")
+    assert isinstance(get_runtime(latency=0), SimRuntime)
+    with pytest.raises(ValueError):
+        get_runtime("nope")
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Simulation tests for the load balancer's scheduling strategies.
+No servers needed: nodes are simulated in-process.
+
+Run: python3 -m pytest -q test_scheduler.py
+"""
+
+import heapq
+
+from scheduler import Scheduler
+
+NODES = ["http://node-a", "http://node-b", "http://node-c"]
+
+
+def simulate(strategy, service_ms, arrivals=3000, gap_ms=1.0):
+    """Replay a steady request stream; return per-node request counts and mean latency."""
+    sched = Scheduler(NODES, strategy)
+    done = []  # (finish_time, node, started_at)
+    counts = {n: 0 for n in NODES}
+    busy_until = {n: 0.0 for n in NODES}
+    latencies = []
+    now = 0.0
+    for _ in range(arrivals):
+        now += gap_ms
+        while done and done[0][0] <= now:
+            t, node, started = heapq.heappop(done)
+            sched.finish(node, (t - started) / 1000)
+        node = sched.pick()
+        sched.start(node)
+        counts[node] += 1
+        # each node serves one request at a time (FIFO)
+        start = max(now, busy_until[node])
+        busy_until[node] = start + service_ms[node]
+        latencies.append(busy_until[node] - now)
+        heapq.heappush(done, (busy_until[node], node, now))
+    return counts, sum(latencies) / len(latencies)
+
+
+def test_round_robin_spreads_evenly():
+    counts, _ = simulate("round-robin", {n: 1.0 for n in NODES}, arrivals=300)
+    assert set(counts.values()) == {100}
+
+
+def test_least_loaded_fills_emptiest_node():
+    sched = Scheduler(NODES, "least-loaded")
+    sched.update_stats(NODES[0], {"containers": 10, "shell_sessions": 5})
+    sched.update_stats(NODES[1], {"containers": 3, "shell_sessions": 0})
+    sched.update_stats(NODES[2], {"containers": 8, "shell_sessions": 0})
+    placed = []
+    for _ in range(5):
+        node = sched.pick()
+        sched.placed(node)
+        placed.append(node)
+    # node-b climbs from 3 to 8 before anything else is touched
+    assert placed == [NODES[1]] * 5
+    sched.placed(NODES[1])
+    assert sched.pick() == NODES[2]
+
+
+def test_least_requests_avoids_stuck_node():
+    # node-a is pathologically slow: requests pile up there under round-robin
+    service = {NODES[0]: 20.0, NODES[1]: 0.5, NODES[2]: 0.5}
+    rr_counts, rr_latency = simulate("round-robin", service)
+    lr_counts, lr_latency = simulate("least-requests", service)
+    assert lr_counts[NODES[0]] < rr_counts[NODES[0]] / 5
+    assert lr_latency < rr_latency / 10
+
+
+def test_ewma_prefers_fast_nodes():
+    # demand (2 req/ms) exceeds what the fastest node alone can serve
+    service = {NODES[0]: 4.0, NODES[1]: 1.0, NODES[2]: 2.0}
+    counts, latency = simulate("ewma", service, gap_ms=0.5)
+    _, rr_latency = simulate("round-robin", service, gap_ms=0.5)
+    assert counts[NODES[1]] > counts[NODES[2]] > counts[NODES[0]]
+    assert latency < rr_latency
+
+
+def test_unknown_strategy_rejected():
+    try:
+        Scheduler(NODES, "random")
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError")
+
+
+def test_add_and_remove_backends():
+    sched = Scheduler()
+    try:
+        sched.pick()
+        raise AssertionError("expected LookupError")
+    except LookupError:
+        pass
+    sched.add(NODES[0])
+    sched.add(NODES[0])
+    assert sched.urls == [NODES[0]]
+    sched.remove(NODES[0])
+    sched.remove(NODES[0])
+    assert sched.urls == []
+
+
+
+def test_draining_nodes_get_no_new_vms():
+    sched = Scheduler(NODES[:2], "round-robin")
+    assert sched.drain(NODES[0])
+    assert {sched.pick() for _ in range(4)} == {NODES[1]}
+    assert sched.pick(exclude=[NODES[0]]) == NODES[1]
+    sched.drain(NODES[1])
+    try:
+        sched.pick()
+        raise AssertionError("expected LookupError")
+    except LookupError:
+        pass
+    sched.drain(NODES[0], False)
+    assert sched.pick() == NODES[0]
+    assert not sched.drain("http://unknown")
+
+CAPACITY = {"cpu_shares": 1024, "memory_mb": 1024, "pids": 1024}
+
+
+def packed(strategy, sizes_in_order):
+    sched = Scheduler(NODES[:2], strategy)
+    for node in NODES[:2]:
+        sched.update_stats(node, {"capacity": CAPACITY, "allocated": {}})
+    placed = []
+    for size in sizes_in_order:
+        node = sched.pick(size)
+        sched.placed(node, size)
+        placed.append(node)
+    return sched, placed
+
+
+def test_best_fit_packs_and_worst_fit_spreads():
+    _, placed = packed("best-fit", ["medium", "small", "small"])
+    assert len(set(placed)) == 1
+    _, placed = packed("worst-fit", ["medium", "small", "small"])
+    assert placed[1] != placed[0] and placed[2] == placed[1]
+
+
+def test_rejects_when_no_node_fits():
+    sched, _ = packed("best-fit", ["large", "large"])
+    for size in ("small", "large"):
+        try:
+            sched.pick(size)
+            raise AssertionError("expected LookupError")
+        except LookupError:
+            pass
+
+
+def test_places_only_on_nodes_with_the_image():
+    sched = Scheduler(NODES[:2], "round-robin")
+    sched.update_stats(NODES[0], {"images": ["alpine"]})
+    sched.update_stats(NODES[1], {"images": ["alpine", "debian"]})
+    assert {sched.pick(image="debian") for _ in range(4)} == {NODES[1]}
+    assert {sched.pick(image="alpine") for _ in range(4)} == set(NODES[:2])
+    try:
+        sched.pick(image="ubuntu")
+        raise AssertionError("expected LookupError")
+    except LookupError:
+        pass
+
+
+if __name__ == "__main__":
+    for strategy in ("round-robin", "least-requests", "ewma"):
+        counts, latency = simulate(strategy, {NODES[0]: 20.0, NODES[1]: 0.5, NODES[2]: 0.5})
+        print(f"{strategy:<15} mean latency {latency:8.2f}ms  {counts}")
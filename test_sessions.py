@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Tests for the shell session table (caps, LRU eviction, idle reaping).
+
+Run: python3 -m pytest -q test_sessions.py
+"""
+
+from sessions import SessionTable
+
+
+def add(table, sid, owner, now):
+    return [s["session_id"] for s in table.add(sid, {"container_name": "vm"}, owner, now=now)]
+
+
+def test_per_user_cap_evicts_that_users_lru():
+    table = SessionTable(max_sessions=10, max_per_user=2)
+    add(table, "a1", "alice", 0)
+    add(table, "b1", "bob", 1)
+    add(table, "a2", "alice", 2)
+    table.get("a1", now=3)  # a1 is now more recent than a2
+    assert add(table, "a3", "alice", 4) == ["a2"]
+    assert sorted(table.sessions) == ["a1", "a3", "b1"]
+
+
+def test_node_cap_evicts_global_lru():
+    table = SessionTable(max_sessions=2, max_per_user=0)
+    add(table, "s1", "alice", 0)
+    add(table, "s2", "bob", 1)
+    table.get("s1", now=2)
+    assert add(table, "s3", "carol", 3) == ["s2"]
+    assert table.stats()["evicted"] == 1
+
+
+def test_idle_sessions_are_reaped():
+    table = SessionTable(idle_timeout=10)
+    add(table, "old", "alice", 0)
+    add(table, "busy", "alice", 0)
+    table.get("busy", now=8)
+    assert [s["session_id"] for s in table.reap(now=12)] == ["old"]
+    assert [s["session_id"] for s in table.snapshot(now=12)] == ["busy"]
+    assert table.get("old") is None
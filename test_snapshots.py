@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the node's snapshot cache (LRU eviction, pinning during clones).
+
+Run: python3 -m pytest -q test_snapshots.py
+"""
+
+import pytest
+
+from snapshots import SnapshotCache
+
+
+def add(cache, sid, now):
+    return [s["snapshot_id"] for s in cache.add(sid, {"ref": f"img-{sid}", "vm": "vm", "owner": "alice"}, now=now)]
+
+
+def test_evicts_least_recently_cloned():
+    cache = SnapshotCache(max_snapshots=2)
+    add(cache, "s1", 0)
+    add(cache, "s2", 1)
+    cache.acquire("s1")
+    cache.release("s1")  # s1 is now more recent than s2
+    assert add(cache, "s3", 2) == ["s2"]
+    assert list(cache.snapshots) == ["s1", "s3"]
+    assert cache.stats()["evicted"] == 1
+
+
+def test_snapshots_being_cloned_are_pinned():
+    cache = SnapshotCache(max_snapshots=1)
+    add(cache, "s1", 0)
+    assert cache.acquire("s1", count=3)["clones"] == 3
+    assert add(cache, "s2", 1) == []  # s1 is pinned, so the cache runs over its cap
+    with pytest.raises(RuntimeError):
+        cache.pop("s1")
+    cache.release("s1", count=3)
+    assert add(cache, "s3", 2) == ["s1", "s2"]
+    assert cache.pop("s3")["ref"] == "img-s3"
+    assert cache.pop("s3") is None
+
+
+def test_listing_hides_image_refs_and_filters_by_owner():
+    cache = SnapshotCache()
+    add(cache, "s1", 0)
+    cache.add("s2", {"ref": "img-s2", "vm": "vm", "owner": "bob"}, now=1)
+    assert [s["snapshot_id"] for s in cache.snapshot("bob")] == ["s2"]
+    assert all("ref" not in s for s in cache.snapshot())
+
+
+def test_failed_image_removal_stays_queued():
+    cache = SnapshotCache(max_snapshots=1)
+    add(cache, "s1", 0)
+    add(cache, "s2", 1)  # evicts s1
+
+    def busy(ref):
+        raise RuntimeError(f"conflict: {ref} is in use")
+
+    assert [(s["snapshot_id"], str(e)) for s, e in cache.remove_images(busy)] == [
+        ("s1", "conflict: img-s1 is in use")]
+    assert cache.stats()["pending_removal"] == 1
+    removed = []
+    cache.pop("s2")
+    assert cache.remove_images(removed.append) == []
+    assert removed == ["img-s1", "img-s2"] and cache.stats()["pending_removal"] == 0
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for the dashboard's shared VM status cache.
+
+Run: python3 -m pytest -q test_status_cache.py
+"""
+
+import threading
+import time
+
+from status_cache import StatusCache
+
+
+def make(ttl=60.0, delay=0.0):
+    calls = []
+
+    def fetch(names):
+        calls.append(sorted(names))
+        time.sleep(delay)
+        return {n: {"status": "running"} for n in names if n != "gone"}
+
+    return StatusCache(fetch, ttl), calls
+
+
+def test_one_batched_fetch_then_cache_hits():
+    cache, calls = make()
+    got = cache.get(["a", "b", "gone"])
+    assert got["a"] == {"status": "running"} and got["gone"] == {"status": "unknown"}
+    assert cache.get(["b", "a"]) == {"a": {"status": "running"}, "b": {"status": "running"}}
+    cache.get(["a", "c"])  # only the new name is fetched
+    assert calls == [["a", "b", "gone"], ["c"]]
+
+
+def test_ttl_expiry_and_invalidate():
+    cache, calls = make(ttl=0.05)
+    cache.get(["a"])
+    time.sleep(0.06)
+    cache.get(["a"])
+    cache.invalidate("a")
+    cache.get(["a"])
+    assert len(calls) == 3
+
+
+def test_concurrent_refreshes_share_one_fetch():
+    cache, calls = make(delay=0.05)
+    threads = [threading.Thread(target=cache.get, args=(["a", "b"],)) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [["a", "b"]]
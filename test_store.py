@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite-backed user / VM ownership store.
+
+Run: python3 -m pytest -q test_store.py
+"""
+
+import json
+import tempfile
+import threading
+from pathlib import Path
+
+from store import Store
+
+
+def make_store(d, users=None, vms=None):
+    d = Path(d)
+    if users is not None:
+        (d / "users.json").write_text(json.dumps(users))
+    if vms is not None:
+        (d / "user_vms.json").write_text(json.dumps(vms))
+    return Store(d / "minicloud.db", d / "users.json", d / "user_vms.json")
+
+
+def test_migrates_json_once():
+    with tempfile.TemporaryDirectory() as d:
+        vms = {"alice": {"vm1": {"server": "http://s0", "created_at": "t0", "status": "running"}}}
+        store = make_store(d, {"admin": "admin", "alice": "pw"}, vms)
+        assert store.get_password("alice") == "pw"
+        assert store.user_vms("alice") == vms["alice"]
+
+        # later edits to the JSON files are ignored: migration ran once
+        store.remove_vm("alice", "vm1")
+        again = make_store(d, {"bob": "x"}, vms)
+        assert again.get_password("bob") is None
+        assert again.user_vms("alice") == {}
+
+
+def test_default_admin_without_json():
+    with tempfile.TemporaryDirectory() as d:
+        assert make_store(d).get_password("admin") == "admin"
+
+
+def test_cache_invalidated_on_write():
+    with tempfile.TemporaryDirectory() as d:
+        store = make_store(d)
+        assert store.get_password("carol") is None
+        assert store.add_user("carol", "pw")
+        assert not store.add_user("carol", "other")
+        assert store.get_password("carol") == "pw"
+
+        store.add_vm("carol", "c1", "http://s0", "t0", "running")
+        assert store.get_vm("carol", "c1")["status"] == "running"
+        store.update_vm("carol", "c1", status="stopped")
+        assert store.get_vm("carol", "c1")["status"] == "stopped"
+        assert store.vm_owner("c1") == "carol"
+
+        store.delete_user("carol")
+        assert store.get_password("carol") is None
+        assert store.user_vms("carol") == {}
+
+
+def test_concurrent_writers_lose_nothing():
+    with tempfile.TemporaryDirectory() as d:
+        store = make_store(d)
+
+        def worker(i):
+            for j in range(50):
+                store.add_vm("dave", f"vm-{i}-{j}", "http://s0", f"{i}.{j}", "running")
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(store.user_vms("dave")) == 400
+
+
+class RacingConn:
+    """A connection whose next SELECT lets `write` land after the query but before the cache fill."""
+
+    def __init__(self, store, write):
+        self.store, self.write, self.real = store, write, store._conn()
+
+    def execute(self, sql, params=()):
+        rows = self.real.execute(sql, params).fetchall()
+        self.store._local.conn = self.real
+        self.write()
+        return RacingCursor(rows)
+
+
+class RacingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+def test_write_racing_a_read_is_not_undone_by_the_cache_fill():
+    with tempfile.TemporaryDirectory() as d:
+        store = make_store(d)
+        store.add_vm("alice", "vm1", "http://s0", "t0", "creating")
+        store._local.conn = RacingConn(store, lambda: store.update_vm("alice", "vm1", status="running"))
+        assert store.user_vms("alice")["vm1"]["status"] == "creating"  # read before the write
+        assert store.user_vms("alice")["vm1"]["status"] == "running"
+
+        store._local.conn = RacingConn(store, lambda: store.add_user("bob", "pw"))
+        assert store.get_password("bob") is None  # not registered yet when it was read
+        assert store.get_password("bob") == "pw"
+        # unknown names are never cached
+        assert store.get_password("nobody") is None and "nobody" not in store._passwords
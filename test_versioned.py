@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for versioned listings and the load balancer's listing aggregator.
+
+Run: python3 -m pytest -q test_versioned.py
+"""
+
+import json
+
+from versioned import ListingAggregator, VersionedListing
+
+A = "http://127.0.0.1:5000"
+B = "http://127.0.0.1:5001"
+
+
+def vm(name, status="running"):
+    return {"name": name, "id": name[:2], "status": status}
+
+
+def test_version_moves_only_on_change_and_body_is_cached():
+    table = VersionedListing()
+    table.put("a", vm("a"))
+    table.put("a", vm("a"))  # unchanged
+    version, etag, body = table.listing()
+    assert version == 1 and json.loads(body) == [vm("a")]
+    assert table.listing()[2] is body  # not re-serialised
+    table.put("a", vm("a", "exited"))
+    assert table.listing()[1] != etag
+
+
+def test_delta_since_version():
+    table = VersionedListing()
+    table.put("a", vm("a"))
+    table.put("b", vm("b"))
+    table.delete("a")
+    table.put("b", vm("b", "exited"))
+    d = table.delta(1)
+    assert (d["full"], d["version"], d["changes"], d["deleted"]) == (False, 4, [vm("b", "exited")], ["a"])
+    assert table.delta(4)["changes"] == []
+    assert table.delta(0, epoch="other")["full"]
+
+
+def test_delta_falls_back_to_full_when_history_is_gone():
+    table = VersionedListing(history=2)
+    for name in "abcd":
+        table.put(name, vm(name))
+    assert table.delta(1)["full"]
+    assert not table.delta(2)["full"]
+
+
+def test_aggregator_applies_node_deltas():
+    node_a, node_b = VersionedListing(), VersionedListing()
+    agg = ListingAggregator()
+    node_a.put("x", vm("x"))
+    node_b.put("y", vm("y"))
+    for server, node in ((A, node_a), (B, node_b)):
+        agg.apply(server, node.delta(**_since(agg, server)))
+    etag, body = agg.listing([A, B])
+    assert json.loads(body) == [{A: [vm("x")]}, {B: [vm("y")]}]
+    assert agg.listing([A, B]) == (etag, body)
+
+    view_version = agg.view.version
+    node_a.delete("x")
+    node_a.put("z", vm("z"))
+    delta = node_a.delta(**_since(agg, A))
+    assert not delta["full"]
+    agg.apply(A, delta)
+    assert agg.vms(A) == [vm("z")]
+    assert agg.listing([A, B])[0] != etag
+    changes = agg.view.delta(view_version)
+    assert changes["deleted"] == ["x"] and changes["changes"] == [dict(vm("z"), server=A)]
+
+    agg.drop(B)
+    assert "y" not in agg.view.entries
+
+
+def _since(agg, server):
+    params = agg.params(server)
+    return {"since": params["since_version"], "epoch": params.get("epoch")}
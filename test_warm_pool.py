@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the warm container pool (with fake create/destroy callables).
+
+Run: python3 -m pytest -q test_warm_pool.py
+"""
+
+import itertools
+import time
+
+from warm_pool import WarmPool
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.ids = itertools.count()
+        self.alive = set()
+
+    def create(self):
+        item = f"warm-{next(self.ids)}"
+        self.alive.add(item)
+        return item
+
+    def destroy(self, item):
+        self.alive.discard(item)
+
+
+def make_pool(rt, **kwargs):
+    return WarmPool(rt.create, rt.destroy, key=lambda item: item, **kwargs)
+
+
+def test_claim_hits_then_misses():
+    rt = FakeRuntime()
+    pool = make_pool(rt, min_size=2, max_size=4)
+    pool.refill_once()
+    assert pool.stats()["idle"] == 2
+    assert pool.claim() == "warm-0"  # oldest first
+    assert pool.claim() == "warm-1"
+    assert pool.claim() is None
+    stats = pool.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (2, 1, 0.667)
+
+
+def test_target_grows_on_burst_and_shrinks_after():
+    rt = FakeRuntime()
+    pool = make_pool(rt, min_size=1, max_size=3)
+    pool.refill_once()
+    for _ in range(5):
+        pool.claim()
+    assert pool.target == 3  # capped at max_size
+    pool.refill_once()
+    assert pool.stats()["idle"] == 3
+    pool.refill_once()  # quiet pass: start shrinking
+    pool.refill_once()
+    assert pool.target == 1
+
+
+def test_expired_items_are_replaced():
+    rt = FakeRuntime()
+    pool = make_pool(rt, min_size=1, max_size=1, max_age=0.05)
+    pool.refill_once()
+    time.sleep(0.1)
+    pool.refill_once()
+    stats = pool.stats()
+    assert stats["expired"] == 1 and stats["idle"] == 1
+    assert "warm-0" not in rt.alive
+    assert pool.claim() == "warm-1"
+
+
+def test_discard_and_drain():
+    rt = FakeRuntime()
+    pool = make_pool(rt, min_size=2, max_size=2)
+    pool.refill_once()
+    pool.discard("warm-0")
+    pool.drain()
+    time.sleep(0.05)  # discard destroys on a helper thread
+    assert rt.alive == set()
+    assert pool.claim() is None
+
+
+def test_create_failure_counts_and_stops():
+    def broken():
+        raise RuntimeError("docker down")
+
+    pool = WarmPool(broken, lambda item: None, key=lambda item: item, min_size=3, max_size=3)
+    pool.refill_once()
+    assert pool.stats()["failures"] == 1
+    assert pool.stats()["idle"] == 0
@@ -0,0 +1,156 @@
+"""
+Versioned VM listings with cached serialisation and delta queries.
+
+VersionedListing is a name -> entry table whose version counter goes up on
+every change. The JSON list is serialised at most once per version (so an
+unchanged table costs a dict lookup, and conditional requests get a 304),
+and a bounded change log answers "what changed since version N" in time
+proportional to the changes.
+
+Versions are only comparable within one `epoch` (a random ID picked when
+the table is created), so a restarted node can never be mistaken for an
+unchanged one.
+
+ListingAggregator is the load balancer's side: it keeps each node's
+listing up to date from delta responses and maintains an aggregate
+VersionedListing of every VM (entries carry their "server").
+"""
+
+import json
+import threading
+import uuid
+import zlib
+from collections import deque
+
+
+class VersionedListing:
+    def __init__(self, history=10000):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.entries = {}
+        self.changes = deque(maxlen=history)  # (version, name), oldest first
+        self.cache = None  # (version, serialised list)
+        self.lock = threading.Lock()
+
+    def _bump(self, name):
+        self.version += 1
+        self.changes.append((self.version, name))
+
+    def put(self, name, entry):
+        """Insert or update an entry; the version only moves if it actually changed."""
+        with self.lock:
+            if self.entries.get(name) != entry:
+                self.entries[name] = entry
+                self._bump(name)
+
+    def delete(self, name):
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                self._bump(name)
+
+    def etag(self):
+        return f'"{self.epoch}-{self.version}"'
+
+    def listing(self):
+        """Return (version, etag, JSON bytes of the entry list), serialising at most once per version."""
+        with self.lock:
+            if self.cache is None or self.cache[0] != self.version:
+                self.cache = (self.version, json.dumps(list(self.entries.values())).encode())
+            return self.version, self.etag(), self.cache[1]
+
+    def delta(self, since, epoch=None):
+        """Changes after version `since` as a dict.
+
+        {"full": false, "changes": [...entries], "deleted": [...names]} when
+        the change log still covers `since`; otherwise (other epoch, or too
+        old) {"full": true, "vms": [...]} with the whole table.
+        """
+        with self.lock:
+            head = {"epoch": self.epoch, "version": self.version}
+            oldest = self.changes[0][0] if self.changes else self.version + 1
+            if (epoch is not None and epoch != self.epoch) or since > self.version or since < oldest - 1:
+                return dict(head, full=True, vms=list(self.entries.values()))
+            names = []
+            for version, name in reversed(self.changes):
+                if version <= since:
+                    break
+                names.append(name)
+            names = list(dict.fromkeys(reversed(names)))
+            return dict(head, full=False,
+                        changes=[self.entries[n] for n in names if n in self.entries],
+                        deleted=[n for n in names if n not in self.entries])
+
+
+class ListingAggregator:
+    """Merges per-node listings (fetched as deltas) into one versioned view."""
+
+    def __init__(self):
+        self.nodes = {}  # server -> {"epoch", "version", "vms": {name: entry}}
+        self.view = VersionedListing()
+        self.cache = None  # (etag, serialised [{server: vms}] list)
+        self.lock = threading.Lock()
+
+    def servers(self):
+        with self.lock:
+            return list(self.nodes)
+
+    def params(self, server):
+        """Query parameters for the next delta fetch of `server`'s /list_vms."""
+        with self.lock:
+            node = self.nodes.get(server)
+            if node is None:
+                return {"since_version": 0}
+            return {"since_version": node["version"], "epoch": node["epoch"]}
+
+    def apply(self, server, delta):
+        """Fold a /list_vms delta response from `server` into its listing and the view."""
+        with self.lock:
+            node = self.nodes.setdefault(server, {"epoch": None, "version": 0, "vms": {}})
+            if delta["full"]:
+                fresh = {vm["name"]: vm for vm in delta["vms"]}
+                gone = [n for n in node["vms"] if n not in fresh]
+                node["vms"] = fresh
+                changed = list(fresh.values())
+            else:
+                gone = delta["deleted"]
+                changed = delta["changes"]
+                for name in gone:
+                    node["vms"].pop(name, None)
+                for vm in changed:
+                    node["vms"][vm["name"]] = vm
+            node["epoch"], node["version"] = delta["epoch"], delta["version"]
+        for name in gone:
+            if self.view.entries.get(name, {}).get("server") == server:
+                self.view.delete(name)
+        for vm in changed:
+            self.view.put(vm["name"], dict(vm, server=server))
+
+    def drop(self, server):
+        """Forget a node that left the cluster."""
+        with self.lock:
+            node = self.nodes.pop(server, None)
+        for name in (node or {}).get("vms", ()):
+            if self.view.entries.get(name, {}).get("server") == server:
+                self.view.delete(name)
+
+    def etag(self, servers):
+        """ETag of the per-node listing for `servers`: the view version plus every node's version."""
+        with self.lock:
+            state = ",".join(f"{s}@{self.nodes[s]['epoch']}.{self.nodes[s]['version']}" if s in self.nodes else s
+                             for s in servers)
+        return f'"{self.view.epoch}-{self.view.version}-{zlib.crc32(state.encode()):08x}"'
+
+    def listing(self, servers):
+        """Return (etag, JSON bytes of [{server: vms}, ...]), serialised at most once per etag."""
+        etag = self.etag(servers)
+        cache = self.cache
+        if cache is None or cache[0] != etag:
+            body = json.dumps([{s: self.vms(s) or []} for s in servers]).encode()
+            self.cache = cache = (etag, body)
+        return cache
+
+    def vms(self, server):
+        """Current list of `server`'s VMs (without the "server" field), or None if never fetched."""
+        with self.lock:
+            node = self.nodes.get(server)
+            return None if node is None else list(node["vms"].values())
@@ -0,0 +1,137 @@
+"""
+Warm pool of pre-started, unassigned containers.
+
+create_vm claims a ready container from the pool (and renames it) instead
+of paying the cold-start cost of `containers.run`. A background thread
+keeps the pool topped up:
+ - it holds at least `min_size` idle containers
+ - after misses (bursts) the target grows by one per miss up to `max_size`,
+   then shrinks back towards `min_size` once the burst is over
+ - idle containers older than `max_age` seconds are replaced
+
+The pool is runtime-agnostic: it is given `create()` / `destroy(item)`
+callables and a `key(item)` used to identify entries.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class WarmPool:
+    def __init__(self, create, destroy, key, min_size=2, max_size=8, max_age=3600,
+                 refill_interval=1.0):
+        if min_size > max_size:
+            raise ValueError("min_size must not exceed max_size")
+        self.create = create
+        self.destroy = destroy
+        self.key = key
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.refill_interval = refill_interval
+        self.target = min_size
+        self.idle = OrderedDict()  # key -> (item, created_at), oldest first
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.missed = False
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.expired = 0
+        self.failures = 0
+
+    def claim(self):
+        """Take the oldest fresh idle item, or return None (a miss)."""
+        now = time.time()
+        with self.lock:
+            while self.idle:
+                _, (item, created_at) = self.idle.popitem(last=False)
+                if now - created_at <= self.max_age:
+                    self.hits += 1
+                    self.wakeup.set()
+                    return item
+                self.expired += 1
+                self._destroy_later(item)
+            self.misses += 1
+            self.missed = True
+            self.target = min(self.max_size, self.target + 1)
+        self.wakeup.set()
+        return None
+
+    def discard(self, key):
+        """Drop an idle item that is no longer usable (e.g. its container died)."""
+        with self.lock:
+            entry = self.idle.pop(key, None)
+        if entry:
+            self._destroy_later(entry[0])
+            self.wakeup.set()
+
+    def _destroy_later(self, item):
+        threading.Thread(target=self._safe_destroy, args=(item,), daemon=True).start()
+
+    def _safe_destroy(self, item):
+        try:
+            self.destroy(item)
+        except Exception:
+            pass
+
+    def refill_once(self):
+        """Expire stale items and create new ones until the pool reaches its target."""
+        now = time.time()
+        with self.lock:
+            stale = [k for k, (_, t) in self.idle.items() if now - t > self.max_age]
+            expired = [self.idle.pop(k)[0] for k in stale]
+            self.expired += len(expired)
+            if not self.missed and len(self.idle) >= self.target:
+                self.target = max(self.min_size, self.target - 1)
+            self.missed = False
+            need = self.target - len(self.idle)
+        for item in expired:
+            self._safe_destroy(item)
+        for _ in range(max(0, need)):
+            try:
+                item = self.create()
+            except Exception as e:
+                self.failures += 1
+                print(f"[WarmPool] Failed to pre-create container: {e}")
+                break
+            with self.lock:
+                self.idle[self.key(item)] = (item, time.time())
+                self.created += 1
+
+    def run(self):
+        """Background thread body: refill whenever woken, and at least every refill_interval."""
+        while True:
+            self.refill_once()
+            self.wakeup.wait(self.refill_interval)
+            self.wakeup.clear()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def drain(self):
+        """Destroy every idle item (node shutdown)."""
+        with self.lock:
+            items = [item for item, _ in self.idle.values()]
+            self.idle.clear()
+        for item in items:
+            self._safe_destroy(item)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "idle": len(self.idle),
+                "target": self.target,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "max_age": self.max_age,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "created": self.created,
+                "expired": self.expired,
+                "failures": self.failures
+            }